@@ -143,6 +143,15 @@ class Client(kcidb.orm.Source):
         assert self.is_initialized()
         self.driver.empty()
 
+    def compact(self):
+        """
+        Compact the database, rewriting its data into a more efficient
+        storage, without changing what is stored.
+        The database must be initialized.
+        """
+        assert self.is_initialized()
+        self.driver.compact()
+
     def get_last_modified(self):
         """
         Get the time the data in the connected database was last modified.
@@ -341,13 +350,22 @@ class Client(kcidb.orm.Source):
         except StopIteration:
             return self.get_schema()[1].new()
 
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Query raw object-oriented data from the database.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
@@ -356,8 +374,9 @@ class Client(kcidb.orm.Source):
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, kcidb.orm.query.Pattern)
                    for r in pattern_set)
+        assert kcidb.orm.data.SCHEMA.is_valid_projection(projection)
         LOGGER.debug("OO Query: %r", pattern_set)
-        return self.driver.oo_query(pattern_set)
+        return self.driver.oo_query(pattern_set, lazy, projection)
 
     def load(self, data):
         """
@@ -764,3 +783,17 @@ def empty_main():
         client.empty()
     else:
         raise Exception(f"Database {args.database!r} is not initialized")
+
+
+def compact_main():
+    """Execute the kcidb-db-compact command-line tool"""
+    sys.excepthook = kcidb.misc.log_and_print_excepthook
+    description = 'kcidb-db-compact - Compact the storage of a ' \
+        'Kernel CI report database'
+    parser = ArgumentParser(description=description)
+    args = parser.parse_args()
+    client = Client(args.database)
+    if client.is_initialized():
+        client.compact()
+    else:
+        raise Exception(f"Database {args.database!r} is not initialized")
@@ -77,6 +77,15 @@ class Driver(ABC):
         """
         assert self.is_initialized()
 
+    @abstractmethod
+    def compact(self):
+        """
+        Compact the driven database, rewriting its data into a more
+        efficient storage, without changing what is stored.
+        The database must be initialized.
+        """
+        assert self.is_initialized()
+
     @abstractmethod
     def get_last_modified(self):
         """
@@ -185,7 +194,7 @@ class Driver(ABC):
         assert self.is_initialized()
 
     @abstractmethod
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Query raw object-oriented data from the database.
         The database must be initialized.
@@ -193,6 +202,15 @@ class Driver(ABC):
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
@@ -200,6 +218,7 @@ class Driver(ABC):
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, orm.query.Pattern)
                    for r in pattern_set)
+        assert orm.data.SCHEMA.is_valid_projection(projection)
         assert self.is_initialized()
 
     @abstractmethod
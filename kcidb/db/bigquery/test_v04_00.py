@@ -0,0 +1,169 @@
+"""kcidb.db.bigquery.v04_00 module tests"""
+
+import json
+import decimal
+import datetime
+import re
+from unittest.mock import Mock, patch
+import pytest
+from google.cloud.bigquery.schema import SchemaField as Field
+from kcidb.db.bigquery import LatestSchema
+
+pyarrow = pytest.importorskip("pyarrow")
+
+# It's OK for tests, pylint: disable=protected-access
+
+
+def get_arrow_type(field):
+    """Get the Arrow type BigQuery returns values of a field in"""
+    if field.field_type in ("RECORD", "STRUCT"):
+        arrow_type = pyarrow.struct([
+            pyarrow.field(subfield.name, get_arrow_type(subfield))
+            for subfield in field.fields
+        ])
+    else:
+        arrow_type = dict(
+            STRING=pyarrow.string(),
+            BOOL=pyarrow.bool_(),
+            INTEGER=pyarrow.int64(),
+            FLOAT64=pyarrow.float64(),
+            NUMERIC=pyarrow.decimal128(38, 9),
+            BIGNUMERIC=pyarrow.decimal256(76, 38),
+            TIMESTAMP=pyarrow.timestamp("us", tz="UTC"),
+        )[field.field_type]
+    if field.mode == "REPEATED":
+        return pyarrow.list_(arrow_type)
+    return arrow_type
+
+
+def get_scalar(field, index):
+    """Generate a non-NULL (scalar) value of a field, based on an index"""
+    if field.field_type in ("RECORD", "STRUCT"):
+        return {
+            subfield.name: get_value(subfield, index + number + 1)
+            for number, subfield in enumerate(field.fields)
+        }
+    if field.name == "misc" or field.name.endswith("_misc"):
+        return json.dumps(dict(index=index, values=[index, None]))
+    return dict(
+        STRING=lambda: f"{field.name}{index}",
+        BOOL=lambda: bool(index % 2),
+        INTEGER=lambda: index,
+        FLOAT64=lambda: index / 4,
+        NUMERIC=lambda: decimal.Decimal(index) / 8,
+        BIGNUMERIC=lambda: decimal.Decimal(index) / 8,
+        TIMESTAMP=lambda: datetime.datetime(
+            2020, 1, 1, tzinfo=datetime.timezone.utc
+        ) + datetime.timedelta(seconds=index, microseconds=index),
+    )[field.field_type]()
+
+
+def get_value(field, index):
+    """Generate a value of a field, possibly NULL, based on an index"""
+    if field.mode == "REPEATED":
+        return [get_scalar(field, index + number)
+                for number in range(index % 4)]
+    if index % 4 == 0:
+        return None
+    return get_scalar(field, index)
+
+
+def check_batch_unpacker(fields, batch):
+    """
+    Check an Arrow record batch is unpacked the same way retrieved nodes
+    are.
+    """
+    expected = [LatestSchema._unpack_node(row) for row in batch.to_pylist()]
+    assert LatestSchema._get_batch_unpacker(fields)(batch) == expected
+
+
+def test_batch_unpacker():
+    """
+    Check Arrow record batches are unpacked the same way retrieved nodes
+    are, for every table, and every unpacked field type.
+    """
+    tables = dict(
+        LatestSchema.TABLE_MAP,
+        numbers=[Field("numeric", "NUMERIC"),
+                 Field("bignumeric", "BIGNUMERIC"),
+                 Field("numerics", "NUMERIC", mode="REPEATED")],
+    )
+    for table_name, fields in tables.items():
+        rows = [
+            {field.name: get_value(field, index) for field in fields}
+            for index in range(16)
+        ]
+        batch = pyarrow.RecordBatch.from_pylist(rows, schema=pyarrow.schema([
+            pyarrow.field(field.name, get_arrow_type(field))
+            for field in fields
+        ]))
+        try:
+            check_batch_unpacker(fields, batch)
+        except AssertionError as exc:
+            raise AssertionError(
+                f"Unpacked {table_name!r} batch differs"
+            ) from exc
+
+
+def test_batch_unpacker_timestamps():
+    """
+    Check timestamps are unpacked correctly, whatever their Arrow unit.
+    """
+    values = [
+        datetime.datetime(2020, 1, 2, 3, 4, 5, 678000,
+                          tzinfo=datetime.timezone.utc),
+        None,
+    ]
+    for unit in ("s", "ms", "us"):
+        check_batch_unpacker(
+            [Field("start_time", "TIMESTAMP")],
+            pyarrow.RecordBatch.from_pylist(
+                [dict(start_time=value) for value in values],
+                schema=pyarrow.schema([
+                    pyarrow.field("start_time",
+                                  pyarrow.timestamp(unit, tz="UTC"))
+                ])
+            )
+        )
+
+
+def get_query_iter_queries(ids, children, parents):
+    """
+    Get the query strings and the numbers of parameters of the jobs
+    started by query_iter() for specified arguments, by object list names.
+    """
+    schema = object.__new__(LatestSchema)
+    schema.conn = Mock()
+    with patch.object(schema, "_iter_query_job_objs",
+                      return_value=iter(())):
+        assert not list(schema.query_iter(ids, children, parents, 0))
+    return {
+        re.search(r"SELECT \* FROM `(\w+)`", call.args[0]).group(1):
+        (call.args[0], len(call.args[1]))
+        for call in schema.conn.query_create.call_args_list
+    }
+
+
+def test_query_iter_subqueries():
+    """
+    Check query_iter() doesn't start jobs which can't return anything,
+    and only includes the subqueries each job refers to.
+    """
+    assert get_query_iter_queries({}, True, True) == {}
+    queries = get_query_iter_queries(dict(checkouts=["c"]), False, False)
+    assert list(queries) == ["checkouts"]
+    assert queries["checkouts"][1] == 1
+
+    queries = get_query_iter_queries(dict(tests=["t"]), True, True)
+    assert set(queries) == {"checkouts", "builds", "tests", "incidents"}
+    assert "builds_ids_with_children" not in queries["checkouts"][0]
+    assert "tests_ids_with_children" not in queries["builds"][0]
+    for obj_list_name, (query, parameter_num) in queries.items():
+        # Check no subquery is defined twice
+        definitions = re.findall(r"^(?:WITH )?(\w+) AS \(", query,
+                                 re.MULTILINE)
+        assert len(definitions) == len(set(definitions))
+        references = set(re.findall(r"(?:FROM|JOIN) (\w+_ids\w*)", query))
+        # Check only (and all) the referenced subqueries are defined
+        assert references == set(definitions), obj_list_name
+        assert parameter_num == 1
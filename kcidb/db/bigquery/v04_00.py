@@ -1,23 +1,33 @@
 """Kernel CI report database - BigQuery schema v4.0"""
 
+import contextlib
 import decimal
+import gzip
 import json
 import logging
 import textwrap
 import datetime
+import tempfile
 from functools import reduce
 from google.cloud import bigquery
 from google.cloud.bigquery.schema import SchemaField as Field
 from google.api_core.exceptions import BadRequest as GoogleBadRequest
 from google.api_core.exceptions import NotFound as GoogleNotFound
+try:  # Optional, for reading results in Arrow record batches
+    import pyarrow
+    import pyarrow.compute
+    from google.cloud import \
+        bigquery_storage  # pylint: disable=ungrouped-imports
+except ImportError:
+    bigquery_storage = None
 import kcidb.io as io
 import kcidb.orm as orm
 from kcidb.misc import LIGHT_ASSERTS
 from kcidb.db.schematic import \
     Schema as AbstractSchema, \
     Connection as AbstractConnection
-from kcidb.db.misc import NotFound
-from kcidb.db.bigquery.schema import validate_json_obj_list
+from kcidb.db.misc import NotFound, sort_obj_list_names
+from kcidb.db.bigquery.schema import validate_json_obj
 
 # We'll manage for now, pylint: disable=too-many-lines
 
@@ -43,6 +53,11 @@ class Connection(AbstractConnection):
         <DATASET>       The name of the dataset containing the report data,
                         located within the specified (or inferred) Google Cloud
                         project.
+
+        If the "pyarrow" and "google-cloud-bigquery-storage" packages are
+        installed (e.g. with the package's "arrow" extra), large query
+        results are read in Arrow record batches, using the BigQuery
+        Storage Read API.
     """)
 
     def __init__(self, params):
@@ -70,6 +85,11 @@ class Connection(AbstractConnection):
             project_id = None
             dataset_name = params
         self.client = bigquery.Client(project=project_id)
+        # The BigQuery Storage Read API client to read large query results
+        # with, or None, if unavailable
+        self.read_client = None
+        if bigquery_storage is not None:
+            self.read_client = bigquery_storage.BigQueryReadClient()
         self.dataset_ref = bigquery.DatasetReference(
             self.client.project, dataset_name
         )
@@ -637,7 +657,7 @@ class Schema(AbstractSchema):
             ).result()
 
     @classmethod
-    def _unpack_node(cls, node, drop_null=True):
+    def _unpack_node(cls, node, drop_null=True, lazy=False):
         """
         Unpack a retrieved data node (and all its children) to
         the JSON-compatible and schema-complying representation.
@@ -646,6 +666,9 @@ class Schema(AbstractSchema):
             node:       The node to unpack.
             drop_null:  Drop nodes with NULL values, if true.
                         Keep them otherwise.
+            lazy:       Keep "misc" fields JSON-encoded, as
+                        kcidb.orm.data.LazyJSON instances, if true.
+                        Decode them otherwise.
 
         Returns:
             The unpacked node.
@@ -666,11 +689,204 @@ class Schema(AbstractSchema):
                     if drop_null:
                         del node[key]
                 elif key == "misc" or key.endswith("_misc"):
-                    node[key] = json.loads(value)
+                    node[key] = orm.data.LazyJSON(value) if lazy \
+                        else json.loads(value)
                 else:
-                    node[key] = cls._unpack_node(value)
+                    node[key] = cls._unpack_node(value, lazy=lazy)
         return node
 
+    @classmethod
+    def _get_value_unpacker(cls, field):
+        """
+        Get a function unpacking a retrieved (non-NULL) value of a field to
+        the JSON-compatible and schema-complying representation, the same way
+        _unpack_node() does, but deciding on conversions once per field,
+        instead of once per value.
+
+        Args:
+            field:  The field (google.cloud.bigquery.schema.SchemaField) to
+                    get the unpacker for.
+
+        Returns:
+            The function unpacking a value, and returning either the unpacked
+            value, or None, if it should be dropped. Or None, if the values
+            of the field need no unpacking.
+        """
+        assert isinstance(field, Field)
+        if field.name == "misc" or field.name.endswith("_misc"):
+            unpack = json.loads
+        elif field.field_type in ("NUMERIC", "BIGNUMERIC"):
+            unpack = float
+        elif field.field_type == "TIMESTAMP":
+            def unpack(value):
+                return value.isoformat(timespec='microseconds')
+        elif field.field_type in ("RECORD", "STRUCT"):
+            unpack_values = cls._get_record_unpacker(field.fields)
+            field_names = [f.name for f in field.fields]
+
+            def unpack(value):
+                return unpack_values(map(value.get, field_names))
+        else:
+            unpack = None
+        if field.mode != "REPEATED":
+            return unpack
+
+        def unpack_list(value):
+            if not value:
+                return None
+            if unpack is None:
+                return value
+            return [unpack(item) for item in value]
+        return unpack_list
+
+    @classmethod
+    def _get_record_unpacker(cls, fields):
+        """
+        Get a function unpacking a retrieved record (a row, or a RECORD
+        value) to the JSON-compatible and schema-complying dictionary,
+        dropping NULL (and empty REPEATED) fields.
+
+        Args:
+            fields: A list of the record's fields
+                    (google.cloud.bigquery.schema.SchemaField).
+
+        Returns:
+            The function accepting an iterable of the record's field values,
+            in the order of the fields, and returning the unpacked
+            dictionary.
+        """
+        assert isinstance(fields, (list, tuple))
+        field_names_unpackers = [
+            (field.name, cls._get_value_unpacker(field)) for field in fields
+        ]
+
+        def unpack_values(values):
+            node = {}
+            for (name, unpack), value in zip(field_names_unpackers, values):
+                if value is not None and unpack is not None:
+                    value = unpack(value)
+                if value is not None:
+                    node[name] = value
+            return node
+        return unpack_values
+
+    @classmethod
+    def _get_array_unpacker(cls, field):
+        """
+        Get a function unpacking an Arrow array of retrieved values of a
+        field to the JSON-compatible and schema-complying representation,
+        the same way _unpack_node() does, but converting whole arrays at
+        once, where possible.
+
+        Args:
+            field:  The field (google.cloud.bigquery.schema.SchemaField) to
+                    get the unpacker for.
+
+        Returns:
+            The function accepting an Arrow array of the field's values,
+            and returning a list of the unpacked values, with None in place
+            of the values which should be dropped.
+        """
+        assert isinstance(field, Field)
+        if field.mode == "REPEATED" or \
+                field.field_type in ("RECORD", "STRUCT"):
+            unpack = cls._get_value_unpacker(field)
+
+            def unpack_array(array):
+                return [None if value is None else unpack(value)
+                        for value in array.to_pylist()]
+        elif field.name == "misc" or field.name.endswith("_misc"):
+            def unpack_array(array):
+                # Decode all the values as a single JSON array
+                return json.loads("[" + ",".join(
+                    "null" if value is None else value
+                    for value in array.to_pylist()
+                ) + "]")
+        elif field.field_type in ("NUMERIC", "BIGNUMERIC"):
+            def unpack_array(array):
+                # Arrow's casts to float aren't always rounded correctly
+                return [None if value is None else float(value)
+                        for value in array.to_pylist()]
+        elif field.field_type == "TIMESTAMP":
+            def unpack_array(array):
+                if array.type.unit == "us" and \
+                        array.type.tz in ("UTC", "+00:00"):
+                    return pyarrow.compute.strftime(
+                        array, format="%Y-%m-%dT%H:%M:%S+00:00"
+                    ).to_pylist()
+                return [
+                    None if value is None
+                    else value.isoformat(timespec='microseconds')
+                    for value in array.to_pylist()
+                ]
+        else:
+            def unpack_array(array):
+                return array.to_pylist()
+        return unpack_array
+
+    @classmethod
+    def _get_batch_unpacker(cls, fields):
+        """
+        Get a function unpacking an Arrow record batch of retrieved rows to
+        a list of JSON-compatible and schema-complying dictionaries,
+        dropping NULL (and empty REPEATED) fields, the same way
+        _get_record_unpacker() does, but unpacking column by column.
+
+        Args:
+            fields: A list of the rows' fields
+                    (google.cloud.bigquery.schema.SchemaField).
+
+        Returns:
+            The function accepting an Arrow record batch with columns in the
+            order of the fields, and returning the list of unpacked
+            dictionaries.
+        """
+        assert isinstance(fields, (list, tuple))
+        names = [field.name for field in fields]
+        unpackers = [cls._get_array_unpacker(field) for field in fields]
+
+        def unpack_batch(batch):
+            columns = [
+                unpack(column)
+                for unpack, column in zip(unpackers, batch.columns)
+            ]
+            return [
+                {
+                    name: value
+                    for name, value in zip(names, values)
+                    if value is not None
+                }
+                for values in zip(*columns)
+            ]
+        return unpack_batch
+
+    def _iter_query_job_objs(self, query_job):
+        """
+        Create a generator returning unpacked objects from the results of a
+        query job. Read the results in Arrow record batches, unpacked
+        column by column, via the BigQuery Storage Read API, if available.
+        Read them row by row, page by page, otherwise.
+
+        Args:
+            query_job:  The query job to read the results of.
+
+        Returns:
+            A generator returning the unpacked objects, in the JSON-compatible
+            and schema-complying representation.
+        """
+        assert isinstance(query_job, bigquery.job.QueryJob)
+        result = query_job.result()
+        if self.conn.read_client is None:
+            unpack = self._get_record_unpacker(result.schema)
+            for row in result:
+                yield unpack(row.values())
+        else:
+            unpack_batch = self._get_batch_unpacker(result.schema)
+            for batch in result.to_arrow_iterable(
+                bqstorage_client=self.conn.read_client
+            ):
+                yield from unpack_batch(batch)
+
     def dump_iter(self, objects_per_report):
         """
         Dump all data from the database in object number-limited chunks.
@@ -687,17 +903,22 @@ class Schema(AbstractSchema):
         assert isinstance(objects_per_report, int)
         assert objects_per_report >= 0
 
+        # Start all the query jobs at once, to have them run concurrently
+        obj_list_query_jobs = {
+            obj_list_name:
+            self.conn.query_create(f"SELECT * FROM `{obj_list_name}`")
+            for obj_list_name in self.TABLE_MAP
+        }
+
         obj_num = 0
         data = self.io.new()
-        for obj_list_name in self.TABLE_MAP:
-            query_string = f"SELECT * FROM `{obj_list_name}`"
-            query_job = self.conn.query_create(query_string)
+        for obj_list_name, query_job in obj_list_query_jobs.items():
             obj_list = None
-            for row in query_job:
+            for obj in self._iter_query_job_objs(query_job):
                 if obj_list is None:
                     obj_list = []
                     data[obj_list_name] = obj_list
-                obj_list.append(self._unpack_node(dict(row.items())))
+                obj_list.append(obj)
                 obj_num += 1
                 if objects_per_report and obj_num >= objects_per_report:
                     assert self.io.is_compatible_exactly(data)
@@ -734,6 +955,7 @@ class Schema(AbstractSchema):
         """
         # Calm down, we'll get to it,
         # pylint: disable=too-many-locals,too-many-statements
+        # pylint: disable=too-many-branches
         assert isinstance(ids, dict)
         assert all(isinstance(k, str) and isinstance(v, list) and
                    all(isinstance(e, str) for e in v)
@@ -741,81 +963,153 @@ class Schema(AbstractSchema):
         assert isinstance(objects_per_report, int)
         assert objects_per_report >= 0
 
-        # A dictionary of object list names and two-element lists,
-        # containing a SELECT statement (returning IDs of the objects to
-        # fetch), and the list of its parameters.
-        obj_list_queries = {
-            obj_list_name: [
-                "SELECT id FROM UNNEST(?) AS id\n",
-                [
-                    bigquery.ArrayQueryParameter(
-                        None, "STRING", ids.get(obj_list_name, [])
-                    ),
-                ],
-            ]
-            for obj_list_name in self.io.graph if obj_list_name
-        }
+        # A dictionary of names of named subqueries (common table
+        # expressions), each returning IDs of objects in a list at a
+        # particular stage of expansion, and tuples containing the subquery
+        # definition, the list of its parameters, and the names of the
+        # (previous stage) subqueries it refers to, or None, if it returns
+        # no IDs. In the order of definition.
+        subqueries = {}
+        # A dictionary of object list names and the names of the
+        # subqueries returning IDs of the objects to fetch
+        obj_list_subqueries = {}
+        obj_list_names = sort_obj_list_names(self.io.graph)
+        for obj_list_name in obj_list_names:
+            subquery_name = f"{obj_list_name}_ids"
+            if ids.get(obj_list_name):
+                subqueries[subquery_name] = (
+                    f"{subquery_name} AS (\n"
+                    f"    SELECT id FROM UNNEST(?) AS id\n"
+                    f")",
+                    [bigquery.ArrayQueryParameter(
+                        None, "STRING", ids[obj_list_name]
+                    )],
+                    []
+                )
+            else:
+                subqueries[subquery_name] = None
+            obj_list_subqueries[obj_list_name] = subquery_name
 
-        # Add referenced parents if requested
+        # Add referenced parents if requested, children first
         if parents:
-            def add_parents(obj_list_name):
-                """Add parent IDs to query results"""
+            for obj_list_name in reversed(obj_list_names):
                 obj_name = obj_list_name[:-1]
-                query = obj_list_queries[obj_list_name]
-                for child_list_name in self.io.graph[obj_list_name]:
-                    add_parents(child_list_name)
-                    child_query = obj_list_queries[child_list_name]
-                    query[0] += \
-                        f"UNION DISTINCT\n" \
-                        f"SELECT {child_list_name}.{obj_name}_id AS id " \
-                        f"FROM {child_list_name} " + \
-                        "INNER JOIN (\n" + \
-                        textwrap.indent(child_query[0], " " * 4) + \
-                        ") USING(id)\n"
-                    query[1] += child_query[1]
-
-            for obj_list_name in self.io.graph[""]:
-                add_parents(obj_list_name)
-
-        # Add referenced children if requested
+                if not self.io.graph[obj_list_name]:
+                    continue
+                subquery_name = f"{obj_list_name}_ids_with_parents"
+                own_name = obj_list_subqueries[obj_list_name]
+                child_list_names = [
+                    child_list_name
+                    for child_list_name in self.io.graph[obj_list_name]
+                    if subqueries[obj_list_subqueries[child_list_name]]
+                ]
+                if not child_list_names:
+                    continue
+                subqueries[subquery_name] = (
+                    f"{subquery_name} AS (\n" +
+                    "    UNION DISTINCT\n".join(
+                        ([f"    SELECT id FROM {own_name}\n"]
+                         if subqueries[own_name] else []) +
+                        [
+                            f"    SELECT {child_list_name}.{obj_name}_id "
+                            f"AS id FROM {child_list_name} INNER JOIN "
+                            f"{obj_list_subqueries[child_list_name]} "
+                            f"USING(id)\n"
+                            for child_list_name in child_list_names
+                        ]
+                    ) +
+                    ")",
+                    [],
+                    ([own_name] if subqueries[own_name] else []) + [
+                        obj_list_subqueries[child_list_name]
+                        for child_list_name in child_list_names
+                    ]
+                )
+                obj_list_subqueries[obj_list_name] = subquery_name
+
+        # Add referenced children if requested, parents first
         if children:
-            def add_children(obj_list_name):
-                """Add child IDs to query results"""
-                obj_name = obj_list_name[:-1]
-                query = obj_list_queries[obj_list_name]
-                for child_list_name in self.io.graph[obj_list_name]:
-                    child_query = obj_list_queries[child_list_name]
-                    child_query[0] += \
-                        f"UNION DISTINCT\n" \
-                        f"SELECT {child_list_name}.id AS id " \
-                        f"FROM {child_list_name} " + \
-                        "INNER JOIN (\n" + \
-                        textwrap.indent(query[0], " " * 4) + \
-                        f") AS {obj_list_name} ON " \
-                        f"{child_list_name}.{obj_name}_id = " \
-                        f"{obj_list_name}.id\n"
-                    child_query[1] += query[1]
-                    add_children(child_list_name)
-
-            for obj_list_name in self.io.graph[""]:
-                add_children(obj_list_name)
+            for obj_list_name in obj_list_names:
+                parent_list_names = [
+                    parent_list_name
+                    for parent_list_name in obj_list_names
+                    if obj_list_name in self.io.graph[parent_list_name] and
+                    subqueries[obj_list_subqueries[parent_list_name]]
+                ]
+                if not parent_list_names:
+                    continue
+                subquery_name = f"{obj_list_name}_ids_with_children"
+                own_name = obj_list_subqueries[obj_list_name]
+                subqueries[subquery_name] = (
+                    f"{subquery_name} AS (\n" +
+                    "    UNION DISTINCT\n".join(
+                        ([f"    SELECT id FROM {own_name}\n"]
+                         if subqueries[own_name] else []) +
+                        [
+                            f"    SELECT {obj_list_name}.id AS id "
+                            f"FROM {obj_list_name} INNER JOIN "
+                            f"{obj_list_subqueries[parent_list_name]} AS "
+                            f"{parent_list_name} ON "
+                            f"{obj_list_name}.{parent_list_name[:-1]}_id = "
+                            f"{parent_list_name}.id\n"
+                            for parent_list_name in parent_list_names
+                        ]
+                    ) +
+                    ")",
+                    [],
+                    ([own_name] if subqueries[own_name] else []) + [
+                        obj_list_subqueries[parent_list_name]
+                        for parent_list_name in parent_list_names
+                    ]
+                )
+                obj_list_subqueries[obj_list_name] = subquery_name
+
+        def get_query(obj_list_name):
+            """
+            Get the query string and parameters fetching the objects in a
+            list, including only the subqueries it refers to, as BigQuery
+            re-evaluates (and doesn't materialize) them for every query.
+            """
+            subquery_name = obj_list_subqueries[obj_list_name]
+            # Collect the names of referenced subqueries
+            names = set()
+            pending_names = [subquery_name]
+            while pending_names:
+                name = pending_names.pop()
+                if name not in names:
+                    names.add(name)
+                    pending_names.extend(subqueries[name][2])
+            # Join them in the order of definition
+            definitions = []
+            parameters = []
+            for name, subquery in subqueries.items():
+                if name in names:
+                    definitions.append(subquery[0])
+                    parameters.extend(subquery[1])
+            return \
+                "WITH " + ",\n".join(definitions) + "\n" + \
+                f"SELECT * FROM `{obj_list_name}` INNER JOIN " + \
+                f"{subquery_name} USING(id)\n", \
+                parameters
+
+        # Start all the query jobs at once, to have them run concurrently,
+        # skipping the ones which can't return anything
+        obj_list_query_jobs = {
+            obj_list_name: self.conn.query_create(*get_query(obj_list_name))
+            for obj_list_name in self.io.graph
+            if obj_list_name and subqueries[obj_list_subqueries[obj_list_name]]
+        }
 
         # Fetch the data
         obj_num = 0
         data = self.io.new()
-        for obj_list_name, query in obj_list_queries.items():
-            query_parameters = query[1]
-            query_string = \
-                f"SELECT * FROM `{obj_list_name}` INNER JOIN (\n" + \
-                textwrap.indent(query[0], " " * 4) + \
-                ") USING(id)\n"
-            query_job = self.conn.query_create(query_string, query_parameters)
+        for obj_list_name, query_job in obj_list_query_jobs.items():
             obj_list = None
-            for row in query_job:
+            for obj in self._iter_query_job_objs(query_job):
                 if obj_list is None:
                     obj_list = []
                     data[obj_list_name] = obj_list
-                obj_list.append(self._unpack_node(dict(row.items())))
+                obj_list.append(obj)
                 obj_num += 1
                 if objects_per_report and obj_num >= objects_per_report:
                     assert self.io.is_compatible_exactly(data)
@@ -902,13 +1196,22 @@ class Schema(AbstractSchema):
 
         return query_string, query_parameters
 
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Query raw object-oriented data from the database.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
@@ -916,6 +1219,7 @@ class Schema(AbstractSchema):
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, orm.query.Pattern)
                    for r in pattern_set)
+        assert orm.data.SCHEMA.is_valid_projection(projection)
 
         # Render all queries for each type
         obj_type_queries = {}
@@ -928,12 +1232,16 @@ class Schema(AbstractSchema):
                     obj_type_queries[obj_type]. \
                         append(self._oo_query_render(pattern))
 
-        # Execute all the queries
-        objs = {}
+        # Start all the query jobs at once, to have them run concurrently
+        obj_type_jobs = {}
         for obj_type, queries in obj_type_queries.items():
+            fields = obj_type.get_projected_fields(projection)
             # Workaround lack of equality operation for array columns
             # required for "UNION DISTINCT"
-            query_string = "SELECT obj.* FROM (\n" + \
+            query_string = "SELECT " + \
+                ("obj.*" if len(fields) == len(obj_type.fields)
+                 else ", ".join(f"obj.{field}" for field in fields)) + \
+                " FROM (\n" + \
                 textwrap.indent(self.OO_QUERIES[obj_type.name],
                                 " " * 4) + "\n" + \
                 ") AS obj INNER JOIN (\n" + \
@@ -946,40 +1254,87 @@ class Schema(AbstractSchema):
                 ") AS ids USING(" + ", ".join(obj_type.id_fields) + ")"
             query_parameters = reduce(lambda x, y: x + y,
                                       (q[1] for q in queries))
-            job = self.conn.query_create(query_string, query_parameters)
+            obj_type_jobs[obj_type] = \
+                self.conn.query_create(query_string, query_parameters)
+
+        # Collect the results in order
+        objs = {}
+        for obj_type, job in obj_type_jobs.items():
             objs[obj_type.name] = [
-                self._unpack_node(dict(row.items()), drop_null=False)
+                self._unpack_node(dict(row.items()),
+                                  drop_null=False, lazy=lazy)
                 for row in job.result()
             ]
 
-        assert LIGHT_ASSERTS or orm.data.SCHEMA.is_valid(objs)
+        assert LIGHT_ASSERTS or orm.data.SCHEMA.is_valid(objs, projection)
         return objs
 
     @classmethod
-    def _pack_node(cls, node):
+    def _get_obj_packer(cls, fields):
         """
-        Pack a loaded data node (and all its children) to
-        the BigQuery storage-compatible representation.
+        Get a function packing a loaded object to the BigQuery
+        storage-compatible representation, JSON-encoding its "misc" fields.
+        Only the dictionaries containing "misc" fields (directly or
+        indirectly) are copied, the rest is shared with the loaded object.
 
         Args:
-            node:   The node to pack.
+            fields: A list of the object's fields
+                    (google.cloud.bigquery.schema.SchemaField).
 
         Returns:
-            The packed node.
+            The function accepting a loaded object and returning the packed
+            object, or None, if the objects need no packing.
         """
-        if isinstance(node, list):
-            node = node.copy()
-            for index, value in enumerate(node):
-                node[index] = cls._pack_node(value)
-        elif isinstance(node, dict):
-            node = node.copy()
-            for key, value in list(node.items()):
-                # Flatten the "misc" fields
-                if key == "misc":
-                    node[key] = json.dumps(value)
-                else:
-                    node[key] = cls._pack_node(value)
-        return node
+        assert isinstance(fields, (list, tuple))
+        field_packers = []
+        for field in fields:
+            if field.name == "misc":
+                pack = json.dumps
+            elif field.field_type == "RECORD":
+                pack = cls._get_obj_packer(field.fields)
+            else:
+                pack = None
+            if pack is None:
+                continue
+            if field.mode == "REPEATED":
+                def pack_list(value, pack_item=pack):
+                    return [pack_item(item) for item in value]
+                pack = pack_list
+            field_packers.append((field.name, pack))
+        if not field_packers:
+            return None
+
+        def pack_obj(obj):
+            obj = obj.copy()
+            for name, pack in field_packers:
+                if name in obj:
+                    obj[name] = pack(obj[name])
+            return obj
+        return pack_obj
+
+    def _write_obj_list(self, file, table_schema, obj_list):
+        """
+        Write a list of loaded objects into a file, packed to the BigQuery
+        storage-compatible representation, as gzip-compressed
+        newline-delimited JSON, one object at a time.
+
+        Args:
+            file:           The binary file to write to.
+            table_schema:   Schema of the table the objects belong to.
+            obj_list:       The list of objects to write.
+        """
+        assert isinstance(table_schema, list)
+        assert isinstance(obj_list, list)
+        pack_obj = self._get_obj_packer(table_schema)
+        # Default compression level is noticeably slower for little gain
+        with gzip.GzipFile(fileobj=file, mode="wb",
+                           compresslevel=6) as gzip_file:
+            for obj in obj_list:
+                if pack_obj is not None:
+                    obj = pack_obj(obj)
+                if not LIGHT_ASSERTS:
+                    validate_json_obj(table_schema, obj)
+                gzip_file.write(json.dumps(obj).encode() + b"\n")
 
     def load(self, data):
         """
@@ -992,18 +1347,28 @@ class Schema(AbstractSchema):
         assert self.io.is_compatible_directly(data)
         assert LIGHT_ASSERTS or self.io.is_valid_exactly(data)
 
-        # Load the data
-        for obj_list_name, table_schema in self.TABLE_MAP.items():
-            if obj_list_name in data:
-                obj_list = self._pack_node(data[obj_list_name])
-                if not LIGHT_ASSERTS:
-                    validate_json_obj_list(table_schema, obj_list)
-                job_config = bigquery.job.LoadJobConfig(autodetect=False,
-                                                        schema=table_schema)
-                job = self.conn.client.load_table_from_json(
-                    obj_list,
+        # Start a load job per table, to have them run concurrently
+        with contextlib.ExitStack() as stack:
+            jobs = []
+            for obj_list_name, table_schema in self.TABLE_MAP.items():
+                if obj_list_name not in data:
+                    continue
+                file = stack.enter_context(tempfile.TemporaryFile())
+                self._write_obj_list(file, table_schema, data[obj_list_name])
+                job_config = bigquery.job.LoadJobConfig(
+                    autodetect=False,
+                    schema=table_schema,
+                    source_format=bigquery.job.SourceFormat.
+                    NEWLINE_DELIMITED_JSON
+                )
+                jobs.append(self.conn.client.load_table_from_file(
+                    file,
                     self.conn.dataset_ref.table("_" + obj_list_name),
-                    job_config=job_config)
+                    rewind=True,
+                    job_config=job_config
+                ))
+            # Wait for the jobs to complete
+            for job in jobs:
                 try:
                     job.result()
                 except GoogleBadRequest as exc:
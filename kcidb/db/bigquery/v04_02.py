@@ -0,0 +1,219 @@
+"""Kernel CI report database - BigQuery schema v4.2"""
+
+import logging
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound as GoogleNotFound
+import kcidb.io as io
+from .v04_01 import Schema as PreviousSchema
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+
+class Schema(PreviousSchema):
+    """BigQuery database schema v4.2"""
+
+    # Loaded data is appended to the raw tables ("_<table>"), as before, but
+    # can be compacted: deduplicated and merged into the compacted tables
+    # ("__<table>"), clustered by the key fields, and partitioned by start
+    # time, where there's one. The views ("<table>") return the compacted
+    # records without raw ones with the same keys, unaggregated, followed
+    # by the deduplicated raw records.
+
+    # The schema's version.
+    version = (4, 2)
+    # The I/O schema the database schema supports
+    io = io.schema.V4_1
+
+    # The name of the field to partition compacted tables by, if present
+    PARTITION_FIELD = "start_time"
+
+    @classmethod
+    def _format_view_query(cls, conn, table_name, table_schema):
+        """
+        Format the query of a view deduplicating the compacted and the raw
+        records of a table. Raw records replace compacted ones with the
+        same key, the same way compaction merges them. The compacted records
+        are filtered without aggregation, so filters on the view can prune
+        their partitions.
+
+        Args:
+            conn:           The connection to format the query for.
+            table_name:     Name of the table to format the view query for.
+            table_schema:   Schema of the table.
+
+        Returns:
+            The formatted view query string.
+        """
+        assert isinstance(conn, cls.Connection)
+        assert isinstance(table_name, str)
+        assert isinstance(table_schema, list)
+        key_names = cls.KEY_MAP[table_name]
+        return \
+            "SELECT " + \
+            ", ".join(f"compacted.`{f.name}`" for f in table_schema) + \
+            f" FROM `{conn.dataset_ref.table('__' + table_name)}` " \
+            "AS compacted WHERE NOT EXISTS (SELECT 1 FROM " + \
+            f"`{conn.dataset_ref.table('_' + table_name)}` AS raw WHERE " + \
+            " AND ".join(
+                f"raw.`{n}` = compacted.`{n}`" for n in key_names
+            ) + \
+            ") UNION ALL " + \
+            cls._format_dedup_query(
+                str(conn.dataset_ref.table('_' + table_name)),
+                key_names, table_schema
+            )
+
+    @staticmethod
+    def _format_dedup_query(table_ref, key_names, table_schema):
+        """
+        Format a query deduplicating the records of a table by their keys.
+
+        Args:
+            table_ref:      The (fully-qualified) name of the table to
+                            deduplicate.
+            key_names:      A tuple of names of the key fields.
+            table_schema:   Schema of the table.
+
+        Returns:
+            The formatted query string.
+        """
+        assert isinstance(table_ref, str)
+        assert isinstance(key_names, tuple)
+        assert isinstance(table_schema, list)
+        return \
+            "SELECT " + \
+            ", ".join(
+                f"`{f.name}`" if f.name in key_names
+                else f"ANY_VALUE(`{f.name}`) AS `{f.name}`"
+                for f in table_schema
+            ) + \
+            f" FROM `{table_ref}` GROUP BY " + \
+            ", ".join(f"`{n}`" for n in key_names)
+
+    @classmethod
+    def _create_compacted_table(cls, conn, table_name, table_schema):
+        """
+        Create a table for compacted records.
+
+        Args:
+            conn:           The connection to create the table with.
+            table_name:     Name of the table to create the compacted table
+                            for.
+            table_schema:   Schema of the table.
+        """
+        assert isinstance(conn, cls.Connection)
+        assert isinstance(table_name, str)
+        assert isinstance(table_schema, list)
+        table = bigquery.table.Table(
+            conn.dataset_ref.table("__" + table_name), schema=table_schema
+        )
+        table.clustering_fields = list(cls.KEY_MAP[table_name])
+        if any(f.name == cls.PARTITION_FIELD and f.field_type == "TIMESTAMP"
+               for f in table_schema):
+            table.time_partitioning = bigquery.table.TimePartitioning(
+                type_=bigquery.table.TimePartitioningType.MONTH,
+                field=cls.PARTITION_FIELD
+            )
+        conn.client.create_table(table)
+
+    @classmethod
+    def _create_table(cls, conn, table_name, table_schema):
+        """
+        Create a table, its compacted table, and its view.
+
+        Args:
+            conn:           The connection to create the table with.
+            table_name:     Name of the table being created.
+            table_schema:   Schema of the table being created.
+        """
+        assert isinstance(conn, cls.Connection)
+        assert isinstance(table_name, str)
+        assert isinstance(table_schema, list)
+        # Create raw table with duplicate records
+        table_ref = conn.dataset_ref.table("_" + table_name)
+        table = bigquery.table.Table(table_ref, schema=table_schema)
+        conn.client.create_table(table)
+        # Create the table with compacted records
+        cls._create_compacted_table(conn, table_name, table_schema)
+        # Create a view deduplicating both
+        view = bigquery.table.Table(conn.dataset_ref.table(table_name))
+        view.view_query = \
+            cls._format_view_query(conn, table_name, table_schema)
+        conn.client.create_table(view)
+
+    @classmethod
+    def _inherit(cls, conn):
+        """
+        Inerit the database data from the previous schema version (if any).
+
+        Args:
+            conn:   Connection to the database to inherit. The database must
+                    comply with the previous version of the schema.
+        """
+        assert isinstance(conn, cls.Connection)
+        # Create compacted tables and switch the views to them
+        for table_name, table_schema in cls.TABLE_MAP.items():
+            cls._create_compacted_table(conn, table_name, table_schema)
+            view = conn.client.get_table(conn.dataset_ref.table(table_name))
+            view.view_query = \
+                cls._format_view_query(conn, table_name, table_schema)
+            conn.client.update_table(view, ["view_query"])
+
+    def cleanup(self):
+        """
+        Cleanup (deinitialize) the database, removing all data.
+        The database must be initialized.
+        """
+        super().cleanup()
+        for table_name in self.TABLE_MAP:
+            try:
+                self.conn.client.delete_table(
+                    self.conn.dataset_ref.table("__" + table_name)
+                )
+            except GoogleNotFound:
+                pass
+
+    def empty(self):
+        """
+        Empty the database, removing all data.
+        The database must be initialized.
+        """
+        super().empty()
+        for table_name in self.TABLE_MAP:
+            self.conn.query_create(
+                f"DELETE FROM `__{table_name}` WHERE TRUE"
+            ).result()
+
+    def compact(self):
+        """
+        Compact the database, merging deduplicated raw records into the
+        compacted tables, replacing the compacted records with the same
+        keys, one transaction per table. Only the affected records of
+        compacted tables are rewritten. A transaction fails, if its raw
+        table is modified concurrently, without losing any data, and can be
+        retried.
+        The database must be initialized.
+        """
+        for table_name, table_schema in self.TABLE_MAP.items():
+            key_names = self.KEY_MAP[table_name]
+            field_list = ", ".join(f"`{f.name}`" for f in table_schema)
+            self.conn.query_create(
+                "BEGIN TRANSACTION;\n"
+                f"MERGE `__{table_name}` AS compacted\n"
+                "USING (" +
+                self._format_dedup_query(
+                    "_" + table_name, key_names, table_schema
+                ) + ") AS raw\n"
+                "ON " + " AND ".join(
+                    f"compacted.`{n}` = raw.`{n}`" for n in key_names
+                ) + "\n"
+                "WHEN MATCHED THEN UPDATE SET " + ", ".join(
+                    f"`{f.name}` = raw.`{f.name}`"
+                    for f in table_schema if f.name not in key_names
+                ) + "\n"
+                f"WHEN NOT MATCHED THEN INSERT ({field_list}) VALUES (" +
+                ", ".join(f"raw.`{f.name}`" for f in table_schema) + ");\n"
+                f"DELETE FROM `_{table_name}` WHERE TRUE;\n"
+                "COMMIT TRANSACTION;\n"
+            ).result()
@@ -33,6 +33,98 @@ class UnsupportedSchema(Error):
     """Database schema version is not supported"""
 
 
+class LoadError(Error):
+    """Loading data into some of multiple databases failed"""
+
+    def __init__(self, driver_errors):
+        """
+        Initialize the exception.
+
+        Args:
+            driver_errors:  A list of tuples, each containing a driver, which
+                            failed loading, and the exception it raised.
+        """
+        assert isinstance(driver_errors, list) and driver_errors
+        assert all(isinstance(error, Exception) for _, error in driver_errors)
+        self.driver_errors = driver_errors
+        super().__init__(
+            f"Failed loading into {len(driver_errors)} database(s):\n" +
+            "\n".join(
+                f"{driver!r}: {error}" for driver, error in driver_errors
+            )
+        )
+
+
+def parse_params_options(params):
+    """
+    Parse the optional list of options from the start of a driver's parameter
+    string. The list is a comma-separated sequence of <NAME>=<VALUE> pairs,
+    enclosed in square brackets. An opening square bracket can be included at
+    the start of the parameters literally by doubling it.
+
+    Args:
+        params: The parameter string to parse.
+
+    Returns:
+        A dictionary of option names and their (string) values, and the
+        remaining parameter string.
+
+    Raises:
+        Exception   - the option list is malformed.
+    """
+    assert isinstance(params, str)
+    options = {}
+    if params.startswith("[["):
+        return options, params[1:]
+    if not params.startswith("["):
+        return options, params
+    end = params.find("]")
+    if end < 0:
+        raise Exception(f"Unterminated option list in {params!r}")
+    for option in params[1:end].split(","):
+        if not option.strip():
+            continue
+        name, sep, value = option.partition("=")
+        name = name.strip()
+        if not sep or not name:
+            raise Exception(f"Invalid option {option!r} in {params!r}")
+        if name in options:
+            raise Exception(f"Duplicate option {name!r} in {params!r}")
+        options[name] = value.strip()
+    return options, params[end + 1:]
+
+
+def sort_obj_list_names(graph):
+    """
+    Sort object list names from an I/O schema's object graph topologically,
+    placing each list after all the lists of its parents.
+
+    Args:
+        graph:  The object graph to sort: a dictionary of object list names
+                and lists of their child list names, with the empty string
+                name listing the root lists.
+
+    Returns:
+        The list of sorted object list names, without the empty string.
+    """
+    assert isinstance(graph, dict)
+    assert "" in graph
+    visited = set()
+    reverse_order = []
+
+    def visit(obj_list_name):
+        """Add a list to the reverse order after all its descendants"""
+        if obj_list_name in visited:
+            return
+        visited.add(obj_list_name)
+        for child_list_name in graph[obj_list_name]:
+            visit(child_list_name)
+        reverse_order.append(obj_list_name)
+
+    visit("")
+    return reverse_order[-2::-1]
+
+
 def format_spec_list(specs):
     """
     Format a database specification list string out of a list of specification
@@ -1,14 +1,27 @@
 """Kernel CI reporting database - multiplexing"""
 
+import time
+import logging
 import textwrap
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 import kcidb.io as io
 import kcidb.db.misc
 from kcidb.db.abstract import Driver as AbstractDriver
 
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
 
 class Driver(AbstractDriver):
     """Abstract multiplexing driver"""
+    # It's OK, pylint: disable=too-many-instance-attributes
+
+    # The weight of the latest read latency in the per-member moving average
+    READ_LATENCY_WEIGHT = 0.3
+    # The number of reads with the "fastest" policy, after which the member
+    # read from least recently is read from, to re-measure its latency
+    READ_PROBE_PERIOD = 16
 
     @classmethod
     @abstractmethod
@@ -33,15 +46,40 @@ class Driver(AbstractDriver):
             The mux driver allows loading data into multiple databases at
             once, and querying one of them.
 
-            Parameters: <DATABASES>
+            Parameters: [<OPTIONS>]<DATABASES>
+
+            <OPTIONS>   A comma-separated list of <NAME>=<VALUE> options,
+                        enclosed in square brackets ('[' and ']'). Double the
+                        opening bracket to include one literally.
+                        Supported options:
+
+                        load    The data loading mode: "sequential" to load
+                                into the databases one after another (the
+                                default), stopping at the first failure, or
+                                "parallel" to load into all of them at once,
+                                from one thread per database, and to report
+                                all failures together, after all loads
+                                finish.
+                        read    The policy choosing the database to read
+                                (query or dump) from: "first" to always
+                                read from the first database (the default),
+                                "fastest" to read from the database with
+                                the lowest moving average of the time to the
+                                first result (trying each one at least
+                                once, and re-trying the least recently
+                                tried one every 16 reads), "failover" to
+                                read from the first database, falling back
+                                to the next ones on errors, or a driver
+                                name to read from the first database of
+                                that driver.
 
             <DATABASES> A whitespace-separated list of strings describing the
                         multiplexed databases (<DRIVER>[:<PARAMS>] pairs). Any
                         spaces or backslashes in database strings need to be
                         escaped with backslashes. All databases have to either
                         be initialized or not, at the same time. Each database
-                        will receive the loaded data, but only the first one
-                        will be queried.
+                        will receive the loaded data, but only one will be
+                        queried at a time, as chosen by the "read" option.
         """)
 
     @staticmethod
@@ -190,9 +228,37 @@ class Driver(AbstractDriver):
         if params is None:
             raise Exception("Database parameters must be specified\n\n" +
                             self.get_doc())
+        options, params = kcidb.db.misc.parse_params_options(params.lstrip())
+        # The names of member drivers, in order
+        self.driver_names = [
+            spec.split(":", 1)[0]
+            for spec in kcidb.db.misc.parse_spec_list(params)
+        ]
+        parallel = False
+        # The read policy
+        self.read_policy = "first"
+        for name, value in options.items():
+            if name == "load" and value in ("sequential", "parallel"):
+                parallel = value == "parallel"
+            elif name == "read" and (
+                value in ("first", "fastest", "failover") or
+                value in self.driver_names
+            ):
+                self.read_policy = value
+            else:
+                raise Exception(
+                    f"Invalid option {name}={value!r}\n\n" + self.get_doc()
+                )
         self.drivers = list(
             kcidb.db.misc.instantiate_spec_list(self.get_drivers(), params)
         )
+        # The moving averages of read latencies (times to the first
+        # result) of each member driver, in seconds, None if not measured
+        self.read_latencies = [None] * len(self.drivers)
+        # The number of the latest read, and the numbers of the latest
+        # reads measured from each member driver, None if none
+        self.read_number = 0
+        self.read_numbers = [None] * len(self.drivers)
         initialized = Driver._drivers_are_initialized(self.drivers)
         if initialized is None:
             raise kcidb.db.misc.UnsupportedSchema(
@@ -204,6 +270,9 @@ class Driver(AbstractDriver):
         self.schemas = Driver._drivers_get_schemas(self.drivers)
         # The current (first) schema version
         self.version = (0, 0) if initialized else None
+        # True if loading into member drivers in parallel, one thread per
+        # driver, False if loading sequentially
+        self.load_parallel = parallel and len(self.drivers) > 1
 
     def is_initialized(self):
         """
@@ -250,6 +319,15 @@ class Driver(AbstractDriver):
         for driver in self.drivers:
             driver.empty()
 
+    def compact(self):
+        """
+        Compact the driven databases, rewriting their data into a more
+        efficient storage, without changing what is stored.
+        All the databases must be initialized.
+        """
+        for driver in self.drivers:
+            driver.compact()
+
     def get_last_modified(self):
         """
         Get the time the data in the driven databases was last modified.
@@ -316,9 +394,111 @@ class Driver(AbstractDriver):
                     driver.upgrade(driver_version)
                 self.version = version
 
+    def _get_read_driver_indices(self):
+        """
+        Get the indices of member drivers to read from, according to the read
+        policy, in the order they should be tried.
+
+        Returns:
+            A list of member driver indices.
+        """
+        if self.read_policy == "first":
+            return [0]
+        if self.read_policy == "failover":
+            return list(range(len(self.drivers)))
+        if self.read_policy == "fastest":
+            self.read_number += 1
+            # Periodically re-try the driver measured least recently,
+            # in case it got faster since
+            if self.read_number % self.READ_PROBE_PERIOD == 0:
+                return [min(
+                    range(len(self.drivers)),
+                    key=lambda index: self.read_numbers[index] or 0
+                )]
+            # Try unmeasured drivers first
+            return [min(
+                range(len(self.drivers)),
+                key=lambda index: self.read_latencies[index] or 0
+            )]
+        return [self.driver_names.index(self.read_policy)]
+
+    def _record_read_latency(self, index, latency):
+        """
+        Record a read latency of a member driver.
+
+        Args:
+            index:      The index of the member driver.
+            latency:    The time to the first result of the read, in seconds.
+        """
+        self.read_numbers[index] = self.read_number
+        average = self.read_latencies[index]
+        self.read_latencies[index] = latency if average is None else \
+            average + (latency - average) * self.READ_LATENCY_WEIGHT
+
+    def _read(self, read):
+        """
+        Read from a member driver chosen by the read policy, failing over to
+        the next one on errors, if allowed by the policy.
+
+        Args:
+            read:   The function to call with the member driver to read
+                    from, returning the read result.
+
+        Returns:
+            The read result.
+        """
+        indices = self._get_read_driver_indices()
+        for index in indices:
+            driver = self.drivers[index]
+            start = time.monotonic()
+            try:
+                result = read(driver)
+            except Exception:  # pylint: disable=broad-except
+                if index == indices[-1]:
+                    raise
+                LOGGER.warning("Failing over reading from %r", driver,
+                               exc_info=True)
+                continue
+            self._record_read_latency(index, time.monotonic() - start)
+            return result
+        assert False, "No drivers to read from"
+
+    def _read_iter(self, read_iter):
+        """
+        Read from a member driver chosen by the read policy, failing over to
+        the next one on errors before the first result, if allowed by the
+        policy.
+
+        Args:
+            read_iter:  The function to call with the member driver to read
+                        from, returning an iterator over read results.
+
+        Returns:
+            An iterator over read results.
+        """
+        indices = self._get_read_driver_indices()
+        for index in indices:
+            driver = self.drivers[index]
+            start = time.monotonic()
+            results = read_iter(driver)
+            try:
+                result = next(results, None)
+            except Exception:  # pylint: disable=broad-except
+                if index == indices[-1]:
+                    raise
+                LOGGER.warning("Failing over reading from %r", driver,
+                               exc_info=True)
+                continue
+            self._record_read_latency(index, time.monotonic() - start)
+            if result is not None:
+                yield result
+                yield from results
+            return
+
     def dump_iter(self, objects_per_report):
         """
-        Dump all data from the first database in object number-limited chunks.
+        Dump all data from a database chosen by the read policy, in object
+        number-limited chunks.
 
         Args:
             objects_per_report: An integer number of objects per each returned
@@ -329,13 +509,15 @@ class Driver(AbstractDriver):
             schema version, each containing at most the specified number of
             objects.
         """
-        yield from self.drivers[0].dump_iter(objects_per_report)
+        yield from self._read_iter(
+            lambda driver: driver.dump_iter(objects_per_report)
+        )
 
     # We can live with this for now, pylint: disable=too-many-arguments
     def query_iter(self, ids, children, parents, objects_per_report):
         """
-        Match and fetch objects from the first database, in object
-        number-limited chunks.
+        Match and fetch objects from a database chosen by the read policy, in
+        object number-limited chunks.
 
         Args:
             ids:                A dictionary of object list names, and lists
@@ -353,22 +535,36 @@ class Driver(AbstractDriver):
             schema version, each containing at most the specified number of
             objects.
         """
-        yield from self.drivers[0].query_iter(
-            ids, children, parents, objects_per_report
+        yield from self._read_iter(
+            lambda driver: driver.query_iter(
+                ids, children, parents, objects_per_report
+            )
         )
 
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
-        Query raw object-oriented data from the first database.
+        Query raw object-oriented data from a database chosen by the read
+        policy.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.oo.data.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
         """
-        return self.drivers[0].oo_query(pattern_set)
+        return self._read(
+            lambda driver: driver.oo_query(pattern_set, lazy, projection)
+        )
 
     def load(self, data):
         """
@@ -382,11 +578,38 @@ class Driver(AbstractDriver):
         # The mux driver I/O schema is the oldest across member drivers
         io_schema = self.get_schema()[1]
         assert io_schema.is_compatible_directly(data)
-        # Load data into every driver
+        # A dictionary of I/O schemas and the data upgraded to them,
+        # shared between the drivers using the same I/O schema
+        io_schema_data = {io_schema: data}
+        driver_data = []
         for driver in self.drivers:
-            # Only copy if we need to upgrade
             driver_io_schema = driver.get_schema()[1]
-            driver.load(
-                driver_io_schema.upgrade(data)
-                if driver_io_schema != io_schema else data
-            )
+            if driver_io_schema not in io_schema_data:
+                io_schema_data[driver_io_schema] = \
+                    driver_io_schema.upgrade(data)
+            driver_data.append((driver, io_schema_data[driver_io_schema]))
+
+        # Load data into every driver one by one, if requested
+        if not self.load_parallel:
+            for driver, upgraded_data in driver_data:
+                driver.load(upgraded_data)
+            return
+
+        # Load data into every driver at once, and wait for all of them,
+        # shutting down the threads afterwards
+        with ThreadPoolExecutor(
+            max_workers=len(driver_data),
+            thread_name_prefix="kcidb_db_mux_load"
+        ) as executor:
+            futures = [
+                (driver, executor.submit(driver.load, upgraded_data))
+                for driver, upgraded_data in driver_data
+            ]
+            driver_errors = []
+            for driver, future in futures:
+                error = future.exception()
+                if error is not None:
+                    driver_errors.append((driver, error))
+        if driver_errors:
+            raise kcidb.db.misc.LoadError(driver_errors) \
+                from driver_errors[0][1]
@@ -106,6 +106,13 @@ class Driver(AbstractDriver):
         The database must be initialized.
         """
 
+    def compact(self):
+        """
+        Compact the driven database, rewriting its data into a more
+        efficient storage, without changing what is stored.
+        The database must be initialized.
+        """
+
     def get_last_modified(self):
         """
         Get the time the data in the driven database was last modified.
@@ -160,18 +167,29 @@ class Driver(AbstractDriver):
         del ids, children, parents, objects_per_report
         yield io.SCHEMA.new()
 
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Query raw object-oriented data from the database.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.oo.data.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
         """
         del pattern_set
+        del lazy
+        del projection
         return {}
 
     def load(self, data):
@@ -0,0 +1,161 @@
+"""
+Kernel CI PostgreSQL report database - connection pool
+"""
+
+import logging
+import threading
+import time
+import psycopg2
+import psycopg2.extras
+import psycopg2.extensions
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+
+class Pool:
+    """
+    A process-wide pool of connections to a PostgreSQL database, keeping a
+    limited number of idle connections warm for reuse, checking their health
+    before handing them out, and replacing broken ones.
+    """
+
+    # Minimum number of seconds a connection should be idle to have its
+    # health checked with a query before reuse
+    CHECK_IDLE_TIME = 5
+
+    # A map of (params, size, idle_timeout) tuples and created pools
+    _POOLS = {}
+    # The lock protecting the map of created pools
+    _POOLS_LOCK = threading.Lock()
+
+    @classmethod
+    def get(cls, params, size, idle_timeout):
+        """
+        Get the pool of connections with the specified parameters, creating
+        it, if it doesn't exist yet.
+
+        Args:
+            params:         The libpq connection string to connect with.
+            size:           The maximum number of idle connections to keep.
+            idle_timeout:   The maximum number of seconds to keep an idle
+                            connection for.
+
+        Returns:
+            The connection pool.
+        """
+        key = (params, size, idle_timeout)
+        with cls._POOLS_LOCK:
+            if key not in cls._POOLS:
+                cls._POOLS[key] = cls(params, size, idle_timeout)
+            return cls._POOLS[key]
+
+    def __init__(self, params, size, idle_timeout):
+        """
+        Initialize the connection pool.
+
+        Args:
+            params:         The libpq connection string to connect with.
+            size:           The maximum number of idle connections to keep.
+            idle_timeout:   The maximum number of seconds to keep an idle
+                            connection for.
+        """
+        assert isinstance(params, str)
+        assert isinstance(size, int) and size >= 0
+        assert isinstance(idle_timeout, (int, float)) and idle_timeout > 0
+        self.params = params
+        self.size = size
+        self.idle_timeout = idle_timeout
+        # A list of idle connections and the times they were released at,
+        # most recently released last
+        self.idle = []
+        self.lock = threading.Lock()
+        # The number of times the database schema was changed through the
+        # pool's connections, invalidating statements prepared on them
+        self.schema_generation = 0
+
+    def connect(self):
+        """
+        Create a new connection, bypassing the pool.
+
+        Returns:
+            The created connection (psycopg2.extras.LoggingConnection).
+        """
+        conn = psycopg2.connect(
+            self.params,
+            connection_factory=psycopg2.extras.LoggingConnection
+        )
+        # Specify the logger to the LoggingConnection
+        # It logs with DEBUG level, judging from the source (but not the docs)
+        conn.initialize(LOGGER)
+        # Set session timezone to UTC, overriding local settings
+        with conn, conn.cursor() as cursor:
+            cursor.execute("SET SESSION TIME ZONE 'UTC'")
+        return conn
+
+    @staticmethod
+    def is_healthy(conn, check):
+        """
+        Check if a connection is usable.
+
+        Args:
+            conn:   The connection to check.
+            check:  True if the server should be queried to check the
+                    connection, false if only the local state should be
+                    checked.
+
+        Returns:
+            True if the connection is usable, false otherwise.
+        """
+        if conn.closed or conn.get_transaction_status() != \
+                psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if check:
+            try:
+                with conn, conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+            except psycopg2.Error:
+                return False
+        return True
+
+    def acquire(self):
+        """
+        Acquire a healthy connection from the pool, connecting anew, if there
+        are no idle connections left.
+
+        Returns:
+            The acquired connection (psycopg2.extras.LoggingConnection).
+        """
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                conn, released = self.idle.pop()
+            idle_time = time.monotonic() - released
+            if idle_time < self.idle_timeout and \
+               self.is_healthy(conn, idle_time >= self.CHECK_IDLE_TIME):
+                return conn
+            LOGGER.debug("Discarding stale connection %r", conn)
+            conn.close()
+        return self.connect()
+
+    def release(self, conn):
+        """
+        Release a connection acquired from the pool, keeping it for reuse, if
+        it's healthy and the pool is not full, and closing it otherwise.
+
+        Args:
+            conn:   The connection to release.
+        """
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            # Drop connections idle for too long, oldest first
+            while self.idle and now - self.idle[0][1] >= self.idle_timeout:
+                expired.append(self.idle.pop(0)[0])
+            if len(self.idle) < self.size and self.is_healthy(conn, False):
+                self.idle.append((conn, now))
+            else:
+                expired.append(conn)
+        for expired_conn in expired:
+            expired_conn.close()
@@ -2,7 +2,86 @@
 Kernel CI PostgreSQL report database - misc schema definitions
 """
 import json
-from kcidb.db.sql.schema import Constraint, Column, Table as _SQLTable
+from kcidb.db.sql.schema import Constraint, Column, Table as _SQLTable, \
+    CompressedTextColumn as _CompressedTextColumn, \
+    CompressedJSONColumn as _CompressedJSONColumn, \
+    LookupColumn as _LookupColumn
+
+# Translation table escaping strings for the COPY text format
+_COPY_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    "\b": "\\b",
+    "\f": "\\f",
+    "\n": "\\n",
+    "\r": "\\r",
+    "\t": "\\t",
+    "\v": "\\v",
+})
+
+
+def format_copy_value(value):
+    """
+    Format a packed column value for the COPY text format.
+
+    Args:
+        value:  The packed value to format.
+
+    Returns:
+        The formatted value string.
+    """
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if isinstance(value, bytes):
+        return "\\\\x" + value.hex()
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class CopyReader:
+    # We only need to read, pylint: disable=too-few-public-methods
+    """
+    A file-like object reading packed rows formatted for the COPY text
+    format, for use with cursor.copy_expert().
+    """
+
+    def __init__(self, row_seq):
+        """
+        Initialize the reader.
+
+        Args:
+            row_seq:    The sequence of packed rows (lists of values) to read.
+        """
+        self.row_iter = iter(row_seq)
+        self.buffer = ""
+
+    def read(self, size=-1):
+        """
+        Read formatted rows.
+
+        Args:
+            size:   The maximum number of characters to read, or a negative
+                    number to read everything.
+
+        Returns:
+            The read string, empty at the end of the rows.
+        """
+        lines = [self.buffer]
+        length = len(self.buffer)
+        for row in self.row_iter:
+            line = "\t".join(map(format_copy_value, row)) + "\n"
+            lines.append(line)
+            length += len(line)
+            if 0 <= size <= length:
+                break
+        data = "".join(lines)
+        if size < 0:
+            self.buffer = ""
+            return data
+        self.buffer = data[size:]
+        return data[:size]
 
 
 class BoolColumn(Column):
@@ -82,6 +161,95 @@ class JSONColumn(Column):
         super().__init__("JSONB", constraint=constraint)
 
 
+class CompressedTextColumn(_CompressedTextColumn):
+    """A compressed text column schema"""
+
+    def __init__(self, constraint=None):
+        """
+        Initialize the column schema.
+
+        Args:
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+        """
+        assert constraint is None or isinstance(constraint, Constraint)
+        super().__init__("BYTEA", constraint=constraint)
+
+
+class CompressedJSONColumn(_CompressedJSONColumn):
+    """A compressed JSON column schema"""
+
+    def __init__(self, constraint=None):
+        """
+        Initialize the column schema.
+
+        Args:
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+        """
+        assert constraint is None or isinstance(constraint, Constraint)
+        super().__init__("BYTEA", constraint=constraint)
+
+
+class LookupColumn(_LookupColumn):
+    """A column schema referencing text values in a lookup table"""
+
+    def __init__(self, lookup, constraint=None, type="INTEGER"):
+        """
+        Initialize the column schema.
+
+        Args:
+            lookup:         The name of the lookup table.
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+            type:           The name of the integer type to use for the
+                            references and the lookup table IDs.
+        """
+        assert constraint is None or isinstance(constraint, Constraint)
+        assert type in ("SMALLINT", "INTEGER", "BIGINT")
+        super().__init__(type, lookup, constraint=constraint)
+
+    def format_create_lookup(self):
+        """
+        Format the "CREATE" command for the lookup table.
+
+        Returns:
+            The formatted "CREATE" command.
+        """
+        return f"CREATE TABLE IF NOT EXISTS {self.lookup} (\n" \
+            f"    id {self.type} GENERATED BY DEFAULT AS IDENTITY " \
+            "PRIMARY KEY,\n" \
+            "    value TEXT NOT NULL UNIQUE\n" \
+            ")"
+
+    def format_insert_lookup(self, values):
+        """
+        Format the "INSERT" command adding missing values to the lookup
+        table. Only tries inserting values not in the table already, so
+        conflicts don't use up IDs.
+
+        Args:
+            values: The "SELECT" command returning the distinct, non-NULL
+                    values to add, one per row.
+
+        Returns:
+            The formatted "INSERT" command.
+        """
+        assert isinstance(values, str)
+        return f"INSERT INTO {self.lookup} (value)\n" \
+            "SELECT new.value FROM (\n" + \
+            "    " + values.replace("\n", "\n    ") + "\n" + \
+            ") AS new(value)\n" \
+            "WHERE NOT EXISTS (\n" \
+            f"    SELECT FROM {self.lookup} AS old " \
+            "WHERE old.value = new.value\n" \
+            ")\n" \
+            "ON CONFLICT DO NOTHING"
+
+
 class TimestampColumn(Column):
     """A timestamp column schema"""
 
@@ -155,3 +323,77 @@ class Table(_SQLTable):
         """
         # TODO: Switch to hardcoding "_" key_sep in base class
         super().__init__("%s", columns, primary_key, key_sep="_")
+
+    def format_create_staging(self, name):
+        """
+        Format the "CREATE" command for a temporary, transaction-scoped table
+        staging rows for merging into this table with the command formatted
+        by format_merge(). The staging table has no constraints, stores
+        packed values in place of lookup references, and numbers the rows in
+        the order they are loaded.
+
+        Args:
+            name:   The name of the staging table to create.
+
+        Returns:
+            The formatted "CREATE" command.
+        """
+        assert isinstance(name, str)
+        return f"CREATE TEMPORARY TABLE {name} (\n    " + \
+            ",\n    ".join(
+                f"{column.name} " + (
+                    "TEXT" if column in self.lookup_columns
+                    else column.schema.type
+                )
+                for column in self.columns
+            ) + ",\n    _seq BIGSERIAL\n) ON COMMIT DROP"
+
+    def format_copy(self, name):
+        """
+        Format the "COPY" command for streaming rows packed by the pack()
+        method and formatted by CopyReader into a (staging) table.
+
+        Args:
+            name:   The name of the target table of the command.
+
+        Returns:
+            The formatted "COPY" command.
+        """
+        assert isinstance(name, str)
+        return f"COPY {name} ({self.columns_list}) FROM STDIN"
+
+    def format_merge(self, name, staging_name, prio_db):
+        """
+        Format the "INSERT/UPDATE" command merging the rows of a staging
+        table created with the command formatted by format_create_staging()
+        into this table, observing the same deduplication logic as loading
+        the rows one-by-one with the command formatted by format_insert().
+        Requires the "first" and "last" aggregate functions.
+
+        Args:
+            name:           The name of the target table of the command.
+            staging_name:   The name of the staging table to merge.
+            prio_db:        If true, format the command so that the values
+                            already in the database, and then earlier-loaded
+                            values take priority, and vice versa otherwise.
+        Returns:
+            The formatted "INSERT/UPDATE" command.
+        """
+        assert isinstance(name, str)
+        assert isinstance(staging_name, str)
+        aggregate = "first" if prio_db else "last"
+        return \
+            f"INSERT INTO {name} (\n" + \
+            ",\n".join(f"    {c.name}" for c in self.columns) + \
+            "\n)\nSELECT\n" + \
+            ",\n".join(
+                "    " + c.schema.format_value(
+                    f"{staging_name}.{c.name}" if self.is_key_column(c) else
+                    f"{aggregate}({staging_name}.{c.name} ORDER BY _seq)"
+                )
+                for c in self.columns
+            ) + \
+            f"\nFROM {staging_name}\nGROUP BY " + \
+            ", ".join(
+                c.name for c in self.columns if self.is_key_column(c)
+            ) + "\n" + self.format_on_conflict(name, prio_db)
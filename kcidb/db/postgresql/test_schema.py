@@ -0,0 +1,56 @@
+"""kcidb.db.postgresql.schema module tests"""
+
+from kcidb.db.postgresql.schema import format_copy_value, CopyReader
+
+
+def test_format_copy_value():
+    """Check packed values are formatted for COPY correctly"""
+    assert format_copy_value(None) == "\\N"
+    assert format_copy_value(True) == "t"
+    assert format_copy_value(False) == "f"
+    assert format_copy_value(0) == "0"
+    assert format_copy_value(1) == "1"
+    assert format_copy_value(-12) == "-12"
+    assert format_copy_value(1.5) == "1.5"
+    assert format_copy_value("") == ""
+    assert format_copy_value("abc") == "abc"
+    assert format_copy_value("N") == "N"
+    # A string looking like NULL is escaped, and can't be mistaken for it
+    assert format_copy_value("\\N") == "\\\\N"
+    assert format_copy_value("a\tb\nc\rd") == "a\\tb\\nc\\rd"
+    assert format_copy_value("\b\f\v") == "\\b\\f\\v"
+    assert format_copy_value("back\\slash") == "back\\\\slash"
+    assert format_copy_value("юникод") == "юникод"
+    assert format_copy_value(b"") == "\\\\x"
+    assert format_copy_value(b"\x00\xffA") == "\\\\x00ff41"
+
+
+def test_copy_reader():
+    """Check the COPY reader formats rows correctly in any size chunks"""
+    rows = [
+        ["a", 1, None, True],
+        ["b\tc", 2.5, b"\x01", False],
+        ["", 0, "\\N", None],
+    ]
+    expected = "a\t1\t\\N\tt\n" \
+        "b\\tc\t2.5\t\\\\x01\tf\n" \
+        "\t0\t\\\\N\t\\N\n"
+    assert CopyReader(rows).read() == expected
+    assert CopyReader([]).read() == ""
+    assert CopyReader([]).read(10) == ""
+    for size in (1, 2, 3, 7, len(expected) - 1, len(expected), 1000):
+        reader = CopyReader(iter(rows))
+        chunks = []
+        while True:
+            chunk = reader.read(size)
+            if not chunk:
+                break
+            assert len(chunk) <= size
+            chunks.append(chunk)
+        assert "".join(chunks) == expected, f"Size {size}"
+        assert reader.read() == ""
+    # Reading everything after a partial read returns the rest
+    reader = CopyReader(rows)
+    assert reader.read(5) == expected[:5]
+    assert reader.read() == expected[5:]
+    assert reader.read() == ""
@@ -1,6 +1,8 @@
 """Kernel CI report database - PostgreSQL schema v4.0"""
 
+import re
 import random
+import itertools
 import logging
 import textwrap
 import datetime
@@ -10,12 +12,20 @@ import psycopg2.errors
 import kcidb.io as io
 import kcidb.orm as orm
 from kcidb.misc import LIGHT_ASSERTS
+from kcidb.db.misc import parse_params_options, sort_obj_list_names
 from kcidb.db.schematic import \
     Schema as AbstractSchema, \
     Connection as AbstractConnection
+from kcidb.db.sql.cache import \
+    TABLE_IDS, ID_FIELD_NUM, StatementCache, \
+    get_pattern_shape, get_pattern_parameters, get_projection_names, \
+    get_shape_shortcut
+from kcidb.db.postgresql.pool import Pool
 from kcidb.db.postgresql.schema import \
     Constraint, BoolColumn, FloatColumn, IntegerColumn, TimestampColumn, \
-    VarcharColumn, TextColumn, JSONColumn, Table
+    VarcharColumn, TextColumn, JSONColumn, LookupColumn, Table, CopyReader
+
+# We'll manage for now, pylint: disable=too-many-lines
 
 # Module's logger
 LOGGER = logging.getLogger(__name__)
@@ -27,9 +37,36 @@ class Connection(AbstractConnection):
     Exposes PostgreSQL connection interface.
     """
 
+    # Maximum number of statements to keep prepared per connection
+    PREPARED_MAX = 256
+
     # Documentation of the connection parameters
     _PARAMS_DOC = textwrap.dedent("""\
-        Parameters: [<CONNECTION>]
+        Parameters: [<OPTIONS>][<CONNECTION>]
+
+        <OPTIONS>       A comma-separated list of <NAME>=<VALUE> options,
+                        enclosed in square brackets ('[' and ']'). Double
+                        the opening bracket to include one literally.
+                        Supported options:
+
+                        load    The data loading mode: "batch" to execute
+                                batched INSERT commands (the default), or
+                                "copy" to stream data into temporary tables
+                                with COPY, and merge them into the main
+                                ones with one command per table.
+                        fetch   The number of rows to fetch from the
+                                server at once, when dumping or querying
+                                data. Must be a positive integer.
+                                Default is 1000.
+                        pool    The maximum number of idle connections to
+                                keep open for reuse by this process.
+                                Connections are only held for the duration
+                                of a transaction, and are checked before
+                                reuse, with broken ones replaced.
+                                Default is 1.
+                        idle    The maximum number of seconds to keep an
+                                idle connection open for reuse.
+                                Default is 300.
 
         <CONNECTION>    A libpq connection string described in
                         https://www.postgresql.org/docs/current/
@@ -45,9 +82,9 @@ class Connection(AbstractConnection):
                         https://www.postgresql.org/docs/current/
                         libpq-envars.html
 
-                        If starts with an exclamation mark ('!'), the
-                        in-database data is prioritized explicitly initially,
-                        instead of randomly. Double to include one literally.
+        If the parameters start with an exclamation mark ('!'), the
+        in-database data is prioritized explicitly initially, instead of
+        randomly. Double to include one literally.
     """)
 
     def __init__(self, params):
@@ -70,32 +107,134 @@ class Connection(AbstractConnection):
                 self.load_prio_db = True
             params = params[1:]
 
+        options, params = parse_params_options(params)
+        self.load_copy = False
+        self.fetch_size = 1000
+        pool_size = 1
+        idle_timeout = 300
+        for name, value in options.items():
+            if name == "load" and value in ("batch", "copy"):
+                self.load_copy = value == "copy"
+            elif name == "fetch" and value.isdigit() and int(value) > 0:
+                self.fetch_size = int(value)
+            elif name == "pool" and value.isdigit():
+                pool_size = int(value)
+            elif name == "idle" and value.isdigit() and int(value) > 0:
+                idle_timeout = int(value)
+            else:
+                raise Exception(
+                    f"Invalid option {name}={value!r}\n\n" +
+                    self._PARAMS_DOC
+                )
+
         super().__init__(params)
-        # Create the connection
-        self.conn = psycopg2.connect(
-            params,
-            connection_factory=psycopg2.extras.LoggingConnection
-        )
-        # Specify the logger to the LoggingConnection
-        # It logs with DEBUG level, judging from the source (but not the docs)
-        self.conn.initialize(LOGGER)
-        # Set session timezone to UTC, overriding local settings
-        with self, self.cursor() as cursor:
-            cursor.execute("SET SESSION TIME ZONE 'UTC'")
+        # The pool to take connections from
+        self.pool = Pool.get(params, pool_size, idle_timeout)
+        # The connection used by the current transaction, if any
+        self.conn = None
+        # The nesting depth of the connection runtime context
+        self.depth = 0
 
     def __getattr__(self, name):
         """
-        Retrieve missing attributes from the PostgreSQL connection object.
+        Retrieve missing attributes from the PostgreSQL connection object
+        used by the current transaction.
         """
+        if name == "conn" or self.conn is None:
+            raise AttributeError(
+                f"{self.__class__.__name__!r} object has no attribute "
+                f"{name!r} outside a transaction"
+            )
         return getattr(self.conn, name)
 
     def __enter__(self):
-        """Enter the connection runtime context"""
-        return self.conn.__enter__()
+        """
+        Enter the connection runtime context, acquiring a connection from the
+        pool for the transaction, if not nested.
+        """
+        if self.depth == 0:
+            self.conn = self.pool.acquire()
+        self.depth += 1
+        try:
+            return self.conn.__enter__()
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self):
+        """
+        Leave a level of the connection runtime context, releasing the
+        connection back into the pool, if it was the outermost one.
+        """
+        self.depth -= 1
+        if self.depth == 0:
+            conn = self.conn
+            self.conn = None
+            self.pool.release(conn)
 
     def __exit__(self, exc_type, exc_value, traceback):
-        """Leave the connection runtime context"""
-        return self.conn.__exit__(exc_type, exc_value, traceback)
+        """
+        Leave the connection runtime context, releasing the connection back
+        into the pool, if not nested.
+        """
+        try:
+            return self.conn.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self._release()
+
+    def execute_prepared(self, cursor, statement, parameters):
+        """
+        Execute a statement, preparing it on the server first, if it wasn't
+        prepared for the connection used by the current transaction yet.
+        If the statement's result type was changed by a schema change made
+        elsewhere (e.g. another process), drop the statements prepared on
+        all the pool's connections, and raise the error, so the (aborted)
+        transaction could be retried with the statement prepared anew.
+
+        Args:
+            cursor:     The cursor to execute the statement with.
+            statement:  The statement to execute, with parameter placeholders
+                        formatted as "%s".
+            parameters: The list of parameters for the statement.
+        """
+        assert isinstance(statement, str)
+        assert isinstance(parameters, list)
+        # Drop the statements prepared for another schema, as their results
+        # could change type
+        if getattr(self.conn, "prepared_generation", None) != \
+                self.pool.schema_generation:
+            if getattr(self.conn, "prepared_names", None):
+                cursor.execute("DEALLOCATE ALL")
+            self.conn.prepared_names = {}
+            self.conn.prepared_generation = self.pool.schema_generation
+        names = self.conn.prepared_names
+        name = names.get(statement)
+        if name is None:
+            if len(names) >= self.PREPARED_MAX:
+                cursor.execute("DEALLOCATE ALL")
+                names.clear()
+            name = f"kcidb_prepared_{len(names)}"
+            numbers = itertools.count(1)
+            cursor.execute(
+                f"PREPARE {name} AS\n" +
+                re.sub("%s", lambda match: f"${next(numbers)}", statement)
+            )
+            names[statement] = name
+        try:
+            if parameters:
+                cursor.execute(
+                    f"EXECUTE {name} (" +
+                    ", ".join(["%s"] * len(parameters)) + ")",
+                    parameters
+                )
+            else:
+                cursor.execute(f"EXECUTE {name}")
+        # It's auto-generated, pylint: disable=no-member
+        except psycopg2.errors.FeatureNotSupported:
+            # Most likely "cached plan must not change result type"
+            with self.pool.lock:
+                self.pool.schema_generation += 1
+            raise
 
     def set_schema_version(self, version):
         """
@@ -125,6 +264,9 @@ class Connection(AbstractConnection):
                     IMMUTABLE
                     RETURN %s
                 """), (number, ))
+        # Invalidate the statements prepared on the pool's connections
+        with self.pool.lock:
+            self.pool.schema_generation += 1
 
     def get_schema_version(self):
         """
@@ -169,6 +311,10 @@ class Schema(AbstractSchema):
     # The I/O schema the database schema supports
     io = io.schema.V4_0
 
+    # The maximum number of IDs to include into queries directly, instead
+    # of loading them into a temporary table first
+    INLINE_IDS_MAX = 64
+
     # A map of table names to table definitions
     TABLES = dict(
         checkouts=Table({
@@ -228,6 +374,10 @@ class Schema(AbstractSchema):
         }),
     )
 
+    # A map of names of tables in TABLES, which are views instead, and
+    # definitions of the tables storing their data. None in this version.
+    STORAGE_TABLES = {}
+
     # Queries and their columns for each type of raw object-oriented data.
     # Both should have columns in the same order.
     # NOTE: Relying on dictionaries preserving order in Python 3.6+
@@ -236,9 +386,9 @@ class Schema(AbstractSchema):
             statement="SELECT\n"
                       "    git_commit_hash,\n"
                       "    patchset_hash,\n"
-                      "    FIRST(patchset_files),\n"
-                      "    FIRST(git_commit_name),\n"
-                      "    FIRST(contacts)\n"
+                      "    FIRST(patchset_files) AS patchset_files,\n"
+                      "    FIRST(git_commit_name) AS git_commit_name,\n"
+                      "    FIRST(contacts) AS contacts\n"
                       "FROM checkouts\n"
                       "GROUP BY git_commit_hash, patchset_hash",
             schema=Table(dict(
@@ -429,6 +579,42 @@ class Schema(AbstractSchema):
         ),
     )
 
+    @staticmethod
+    def _create_aggregates(cursor):
+        """
+        Create the "first" and "last" aggregate functions.
+
+        Args:
+            cursor: The cursor to create the functions with.
+        """
+        # Source: https://wiki.postgresql.org/wiki/First/last_(aggregate)
+        cursor.execute(textwrap.dedent("""\
+            CREATE OR REPLACE FUNCTION first_agg(anyelement, anyelement)
+            RETURNS anyelement
+            LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS
+            'SELECT $1'
+        """))
+        cursor.execute(textwrap.dedent("""\
+            CREATE OR REPLACE FUNCTION last_agg(anyelement, anyelement)
+            RETURNS anyelement
+            LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS
+            'SELECT $2';
+        """))
+        cursor.execute(textwrap.dedent("""\
+            CREATE OR REPLACE AGGREGATE first(anyelement) (
+                SFUNC = first_agg,
+                STYPE = anyelement,
+                PARALLEL = safe
+            )
+        """))
+        cursor.execute(textwrap.dedent("""\
+            CREATE OR REPLACE AGGREGATE last(anyelement) (
+                SFUNC = last_agg,
+                STYPE = anyelement,
+                PARALLEL = safe
+            )
+        """))
+
     def init(self):
         """
         Initialize the database.
@@ -442,34 +628,7 @@ class Schema(AbstractSchema):
                     raise Exception(
                         f"Failed creating table {table_name!r}"
                     ) from exc
-            # Create the "first" and "last" aggregations
-            # Source: https://wiki.postgresql.org/wiki/First/last_(aggregate)
-            cursor.execute(textwrap.dedent("""\
-                CREATE OR REPLACE FUNCTION first_agg(anyelement, anyelement)
-                RETURNS anyelement
-                LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS
-                'SELECT $1'
-            """))
-            cursor.execute(textwrap.dedent("""\
-                CREATE OR REPLACE FUNCTION last_agg(anyelement, anyelement)
-                RETURNS anyelement
-                LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS
-                'SELECT $2';
-            """))
-            cursor.execute(textwrap.dedent("""\
-                CREATE OR REPLACE AGGREGATE first(anyelement) (
-                    SFUNC = first_agg,
-                    STYPE = anyelement,
-                    PARALLEL = safe
-                )
-            """))
-            cursor.execute(textwrap.dedent("""\
-                CREATE OR REPLACE AGGREGATE last(anyelement) (
-                    SFUNC = last_agg,
-                    STYPE = anyelement,
-                    PARALLEL = safe
-                )
-            """))
+            self._create_aggregates(cursor)
 
     def cleanup(self):
         """
@@ -515,24 +674,28 @@ class Schema(AbstractSchema):
 
         obj_num = 0
         data = self.io.new()
-        with self.conn, self.conn.cursor() as cursor:
+        with self.conn:
             for table_name, table_schema in self.TABLES.items():
                 obj_list = None
-                cursor.execute(table_schema.format_dump(table_name))
-                for obj in table_schema.unpack_iter(cursor):
-                    if obj_list is None:
-                        obj_list = []
-                        data[table_name] = obj_list
-                    obj_list.append(obj)
-                    obj_num += 1
-                    if objects_per_report and \
-                            obj_num >= objects_per_report:
-                        assert self.io.is_compatible_exactly(data)
-                        assert LIGHT_ASSERTS or self.io.is_valid_exactly(data)
-                        yield data
-                        obj_num = 0
-                        data = self.io.new()
-                        obj_list = None
+                # Stream the rows with a server-side cursor
+                with self.conn.cursor(f"dump_{table_name}") as cursor:
+                    cursor.itersize = self.conn.fetch_size
+                    cursor.execute(table_schema.format_dump(table_name))
+                    for obj in table_schema.unpack_iter(cursor):
+                        if obj_list is None:
+                            obj_list = []
+                            data[table_name] = obj_list
+                        obj_list.append(obj)
+                        obj_num += 1
+                        if objects_per_report and \
+                                obj_num >= objects_per_report:
+                            assert self.io.is_compatible_exactly(data)
+                            assert LIGHT_ASSERTS or \
+                                self.io.is_valid_exactly(data)
+                            yield data
+                            obj_num = 0
+                            data = self.io.new()
+                            obj_list = None
 
         if obj_num:
             assert self.io.is_compatible_exactly(data)
@@ -572,6 +735,12 @@ class Schema(AbstractSchema):
         assert isinstance(objects_per_report, int)
         assert objects_per_report >= 0
 
+        # Stage the IDs of the objects to fetch in a temporary table, if
+        # there are too many of them, or their relatives are requested
+        staged = parents or children or any(
+            len(table_ids) > self.INLINE_IDS_MAX for table_ids in ids.values()
+        )
+
         # Build a dictionary of object list (table) names and tuples
         # containing a SELECT statement and the list of its parameters,
         # returning IDs of the objects to fetch.
@@ -580,7 +749,12 @@ class Schema(AbstractSchema):
             if not obj_list_name:
                 continue
             table_ids = ids.get(obj_list_name, [])
-            if table_ids:
+            if staged:
+                obj_list_queries[obj_list_name] = [
+                    "SELECT DISTINCT id FROM query_ids WHERE obj_list = %s\n",
+                    [obj_list_name]
+                ]
+            elif table_ids:
                 obj_list_queries[obj_list_name] = [
                     "WITH ids(id) AS (VALUES " +
                     ", ".join(["(%s)"] * len(table_ids)) +
@@ -593,100 +767,160 @@ class Schema(AbstractSchema):
                     []
                 ]
 
-        # Add referenced parents if requested
+        # Build a list of statements and their parameters, expanding the
+        # staged ID sets with referenced parents and/or children, one
+        # relation at a time, with each set complete before it's used.
+        # Duplicates are only removed when fetching, as that's cheaper than
+        # maintaining a unique index.
+        expansions = []
+        obj_list_names = sort_obj_list_names(self.io.graph)
         if parents:
-            def add_parents(obj_list_name):
-                """Add parent IDs to query results"""
+            for obj_list_name in reversed(obj_list_names):
                 obj_name = obj_list_name[:-1]
-                query = obj_list_queries[obj_list_name]
                 for child_list_name in self.io.graph[obj_list_name]:
-                    add_parents(child_list_name)
-                    child_query = obj_list_queries[child_list_name]
-                    query[0] += \
-                        f"UNION\n" \
-                        f"SELECT {child_list_name}.{obj_name}_id AS id " \
-                        f"FROM {child_list_name} " + \
-                        "INNER JOIN (\n" + \
-                        textwrap.indent(child_query[0], " " * 4) + \
-                        ") AS ids USING(id)\n"
-                    query[1] += child_query[1]
-
-            for obj_list_name in self.io.graph[""]:
-                add_parents(obj_list_name)
-
-        # Add referenced children if requested
+                    expansions.append((
+                        f"INSERT INTO query_ids\n"
+                        f"SELECT DISTINCT %s, "
+                        f"{child_list_name}.{obj_name}_id\n"
+                        f"FROM {child_list_name} INNER JOIN query_ids ON "
+                        f"{child_list_name}.id = query_ids.id\n"
+                        f"WHERE query_ids.obj_list = %s",
+                        [obj_list_name, child_list_name]
+                    ))
         if children:
-            def add_children(obj_list_name):
-                """Add child IDs to query results"""
+            for obj_list_name in obj_list_names:
                 obj_name = obj_list_name[:-1]
-                query = obj_list_queries[obj_list_name]
                 for child_list_name in self.io.graph[obj_list_name]:
-                    child_query = obj_list_queries[child_list_name]
-                    child_query[0] += \
-                        f"UNION\n" \
-                        f"SELECT {child_list_name}.id AS id " \
-                        f"FROM {child_list_name} " + \
-                        "INNER JOIN (\n" + \
-                        textwrap.indent(query[0], " " * 4) + \
-                        f") AS {obj_list_name} ON " \
-                        f"{child_list_name}.{obj_name}_id = " \
-                        f"{obj_list_name}.id\n"
-                    child_query[1] += query[1]
-                    add_children(child_list_name)
-
-            for obj_list_name in self.io.graph[""]:
-                add_children(obj_list_name)
-
-        # Fetch the data
+                    expansions.append((
+                        f"INSERT INTO query_ids\n"
+                        f"SELECT DISTINCT %s, {child_list_name}.id\n"
+                        f"FROM {child_list_name} INNER JOIN query_ids ON "
+                        f"{child_list_name}.{obj_name}_id = query_ids.id\n"
+                        f"WHERE query_ids.obj_list = %s",
+                        [child_list_name, obj_list_name]
+                    ))
+
+        # Fetch the data, refusing to interleave with other calls, as they
+        # would share the staged IDs, the cursor names, and the transaction
+        assert not self.query_iter_running, \
+            "Interleaved query_iter() calls are not supported"
+        self.query_iter_running = True
         obj_num = 0
         data = self.io.new()
-        with self.conn, self.conn.cursor() as cursor:
-            for obj_list_name, query in obj_list_queries.items():
-                table_schema = self.TABLES[obj_list_name]
-                cursor.execute(
-                    f"SELECT {table_schema.columns_list}\n"
-                    f"FROM {obj_list_name} INNER JOIN (\n" +
-                    textwrap.indent(query[0], " " * 4) +
-                    ") AS ids USING(id)\n",
-                    query[1]
-                )
-                obj_list = None
-                for obj in table_schema.unpack_iter(cursor):
-                    if obj_list is None:
-                        obj_list = []
-                        data[obj_list_name] = obj_list
-                    obj_list.append(obj)
-                    obj_num += 1
-                    if objects_per_report and \
-                            obj_num >= objects_per_report:
-                        assert self.io.is_compatible_exactly(data)
-                        assert LIGHT_ASSERTS or self.io.is_valid_exactly(data)
-                        yield data
-                        obj_num = 0
-                        data = self.io.new()
-                        obj_list = None
+        try:
+            with self.conn:
+                # Stage and expand the IDs
+                if staged:
+                    with self.conn.cursor() as cursor:
+                        cursor.execute(
+                            "CREATE TEMPORARY TABLE IF NOT EXISTS "
+                            "query_ids(obj_list TEXT, id TEXT) "
+                            "ON COMMIT DELETE ROWS"
+                        )
+                        cursor.copy_expert(
+                            "COPY query_ids FROM STDIN",
+                            CopyReader(
+                                (obj_list_name, obj_id)
+                                for obj_list_name, table_ids in ids.items()
+                                for obj_id in table_ids
+                            )
+                        )
+                        for expansion in expansions:
+                            cursor.execute(*expansion)
+                for obj_list_name, query in obj_list_queries.items():
+                    table_schema = self.TABLES[obj_list_name]
+                    obj_list = None
+                    # Stream the rows with a server-side cursor
+                    with self.conn.cursor(f"query_{obj_list_name}") as cursor:
+                        cursor.itersize = self.conn.fetch_size
+                        cursor.execute(
+                            f"SELECT {table_schema.columns_list}\n"
+                            f"FROM {obj_list_name} INNER JOIN (\n" +
+                            textwrap.indent(query[0], " " * 4) +
+                            ") AS ids USING(id)\n",
+                            query[1]
+                        )
+                        for obj in table_schema.unpack_iter(cursor):
+                            if obj_list is None:
+                                obj_list = []
+                                data[obj_list_name] = obj_list
+                            obj_list.append(obj)
+                            obj_num += 1
+                            if objects_per_report and \
+                                    obj_num >= objects_per_report:
+                                assert self.io.is_compatible_exactly(data)
+                                assert LIGHT_ASSERTS or \
+                                    self.io.is_valid_exactly(data)
+                                yield data
+                                obj_num = 0
+                                data = self.io.new()
+                                obj_list = None
+        finally:
+            self.query_iter_running = False
 
         if obj_num:
             assert self.io.is_compatible_exactly(data)
             assert LIGHT_ASSERTS or self.io.is_valid_exactly(data)
             yield data
 
+    def __init__(self, conn):
+        """
+        Initialize the database schema.
+
+        Args:
+            conn:   The connection to the database.
+        """
+        super().__init__(conn)
+        # The cache of rendered OO queries
+        self.oo_query_cache = StatementCache()
+        # True if a query_iter() call is fetching data
+        self.query_iter_running = False
+
     @classmethod
-    def _oo_query_render(cls, pattern):
+    def _oo_query_render(cls, shape):
         """
-        Render a pattern for raw OO data into a query.
+        Render a pattern shape for raw OO data into a query.
 
         Args:
-            pattern:    The pattern (instance of kcidb.orm.query.Pattern) to
-                        render.
+            shape:  The shape of the pattern to render, as returned by
+                    kcidb.db.sql.cache.get_pattern_shape().
 
         Returns:
-            The SQL query string and the query parameters.
+            The SQL query string, expecting parameters returned by
+            kcidb.db.sql.cache.get_pattern_parameters() for a pattern of
+            the shape.
         """
-        assert isinstance(pattern, orm.query.Pattern)
-        obj_type = pattern.obj_type
+        # Calm down, pylint: disable=too-many-locals
+        assert isinstance(shape, tuple) and shape
+        (type_name, child, id_num), base_shape = shape[0], shape[1:]
+        obj_type = orm.data.SCHEMA.types[type_name]
         type_query_string = cls.OO_QUERIES[obj_type.name]["statement"]
-        if pattern.obj_id_set:
+        # Specify ID types explicitly, for the statement to be prepared,
+        # converting IDs to lookup references, where necessary
+        id_formats = {
+            column.name:
+            column.schema.format_value("{}::TEXT")
+            if isinstance(column.schema, LookupColumn) else
+            "{}::" + column.schema.type
+            for column in cls.OO_QUERIES[obj_type.name]["schema"].columns
+        }
+        if id_num == TABLE_IDS:
+            obj_id_fields = obj_type.id_fields
+            query_string = \
+                f"/* {obj_type.name.capitalize()}s with table IDs */\n" + \
+                "SELECT obj.* FROM (\n" + \
+                textwrap.indent(type_query_string, " " * 4) + "\n" + \
+                ") AS obj INNER JOIN (\n" + \
+                f"    /* {obj_type.name.capitalize()} table IDs */\n" + \
+                "    SELECT " + \
+                ", ".join(
+                    id_formats[obj_id_field].format(f"id_{i}") +
+                    f" AS {obj_id_field}"
+                    for i, obj_id_field in enumerate(obj_id_fields)
+                ) + "\n" + \
+                "    FROM oo_query_ids WHERE id_set = %s::INTEGER\n" + \
+                ") AS ids USING(" + ", ".join(obj_id_fields) + ")"
+        elif id_num > 0:
             obj_id_fields = obj_type.id_fields
             query_string = \
                 f"/* {obj_type.name.capitalize()}s with pattern IDs */\n" + \
@@ -700,30 +934,36 @@ class Schema(AbstractSchema):
                 ",\n".join(
                     [
                         "        (" +
-                        ", ".join(["%s", ] * len(obj_id_fields)) +
+                        ", ".join(
+                            id_formats[obj_id_field].format("%s")
+                            for obj_id_field in obj_id_fields
+                        ) +
                         ")"
                     ] *
-                    len(pattern.obj_id_set)
+                    id_num
                 ) + \
                 "\n    ) SELECT * FROM ids\n" + \
                 ") AS ids USING(" + ", ".join(obj_id_fields) + ")"
-            query_parameters = [
-                obj_id_field
-                for obj_id in pattern.obj_id_set
-                for obj_id_field in obj_id
-            ]
         else:
             query_string = type_query_string
-            if pattern.obj_id_set is not None:
+            if id_num == 0:
                 # We cannot represent empty "VALUES"
                 query_string += " WHERE FALSE"
-            query_parameters = []
 
-        if pattern.base:
-            base_query_string, base_query_parameters = \
-                cls._oo_query_render(pattern.base)
-            base_obj_type = pattern.base.obj_type
-            if pattern.child:
+        if base_shape:
+            # Join directly to ancestors/descendants, if possible
+            shortcut = get_shape_shortcut(shape, {
+                name: query.get("ancestor_ids", {})
+                for name, query in cls.OO_QUERIES.items()
+            })
+            if shortcut:
+                base_index, column_pairs = shortcut
+                base_shape = shape[base_index:]
+            base_query_string = cls._oo_query_render(base_shape)
+            base_obj_type = orm.data.SCHEMA.types[base_shape[0][0]]
+            if shortcut:
+                base_relation = "ancestor" if child else "descendant"
+            elif child:
                 base_relation = "parent"
                 column_pairs = list(zip(
                     base_obj_type.children[obj_type.name].ref_fields,
@@ -735,6 +975,7 @@ class Schema(AbstractSchema):
                     obj_type.id_fields,
                     obj_type.children[base_obj_type.name].ref_fields
                 ))
+            if not child:
                 base_query_string = \
                     "SELECT DISTINCT " + \
                     ", ".join(b for o, b in column_pairs) + "\n" \
@@ -751,49 +992,269 @@ class Schema(AbstractSchema):
                 textwrap.indent(base_query_string, " " * 4) + "\n" + \
                 ") AS base ON " + \
                 " AND ".join(f"obj.{o} = base.{b}" for o, b in column_pairs)
-            query_parameters += base_query_parameters
 
-        return query_string, query_parameters
+        return query_string
+
+    @classmethod
+    def _oo_query_render_type(cls, obj_type, shapes, names):
+        """
+        Render a query for raw OO data of a type, matching patterns of
+        specified shapes.
+
+        Args:
+            obj_type:   The type of the objects to query
+                        (kcidb.orm.data.Type).
+            shapes:     A tuple of shapes of patterns to render, as returned
+                        by kcidb.db.sql.cache.get_pattern_shape().
+            names:      A tuple of names of the columns to retrieve, or None
+                        to retrieve all columns.
 
-    def oo_query(self, pattern_set):
+        Returns:
+            The SQL query string, expecting concatenated parameters returned
+            by kcidb.db.sql.cache.get_pattern_parameters() for patterns of
+            the shapes, in the same order.
+        """
+        schema = cls.OO_QUERIES[obj_type.name]["schema"]
+        query_strings = map(cls._oo_query_render, shapes)
+        # Project before deduplicating, to avoid fetching omitted columns,
+        # and the columns used only for joining
+        query_strings = (
+            "SELECT " +
+            ", ".join(f"obj.{c.name}" for c in schema.get_columns(names)) +
+            " FROM (\n" + textwrap.indent(query_string, " " * 4) +
+            "\n) AS obj"
+            for query_string in query_strings
+        )
+        query_string = "\nUNION\n".join(query_strings)
+        # Resolve lookup references after deduplicating
+        if any(column in schema.lookup_columns
+               for column in schema.get_columns(names)):
+            query_string = \
+                "SELECT\n" + \
+                schema.format_resolved_columns("obj", names) + \
+                "\nFROM (\n" + \
+                textwrap.indent(query_string, " " * 4) + "\n" + \
+                ") AS obj" + \
+                schema.format_resolving_joins("obj", names)
+        return query_string
+
+    def _execute_oo_queries(self, obj_type_queries, id_rows, lazy):
+        """
+        Execute formatted raw object-oriented data queries in a transaction.
+
+        Args:
+            obj_type_queries:   A dictionary of object types and tuples
+                                containing the query strings, the lists of
+                                their parameters, and the names of the
+                                columns to retrieve, as returned by
+                                get_projection_names().
+            id_rows:            A list of rows (lists) of the large ID sets
+                                the queries join, to load into a temporary
+                                table.
+            lazy:               If true, return JSON fields as
+                                kcidb.orm.data.LazyJSON instances.
+
+        Returns:
+            A dictionary of object type names and lists containing retrieved
+            objects of the corresponding type.
+        """
+        with self.conn, self.conn.cursor() as cursor:
+            # Keep JSON values encoded, if requested
+            if lazy:
+                psycopg2.extras.register_default_json(
+                    cursor, loads=orm.data.LazyJSON
+                )
+                psycopg2.extras.register_default_jsonb(
+                    cursor, loads=orm.data.LazyJSON
+                )
+            # Load large ID sets into a temporary table
+            if id_rows:
+                cursor.execute(
+                    "CREATE TEMPORARY TABLE IF NOT EXISTS " +
+                    "oo_query_ids(id_set INTEGER, " +
+                    ", ".join(f"id_{i} TEXT" for i in range(ID_FIELD_NUM)) +
+                    ") ON COMMIT DELETE ROWS"
+                )
+                cursor.copy_expert(
+                    "COPY oo_query_ids FROM STDIN", CopyReader(id_rows)
+                )
+            objs = {}
+            for obj_type, (query_string, query_parameters, names) in \
+                    obj_type_queries.items():
+                self.conn.execute_prepared(
+                    cursor, query_string, query_parameters
+                )
+                objs[obj_type.name] = list(
+                    self.OO_QUERIES[obj_type.name]["schema"].unpack_iter(
+                        cursor, drop_null=False, lazy=lazy, names=names
+                    )
+                )
+        return objs
+
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Query raw object-oriented data from the database.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
         """
+        # Calm down, pylint: disable=too-many-locals
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, orm.query.Pattern) for r in pattern_set)
+        assert orm.data.SCHEMA.is_valid_projection(projection)
+
+        # Sort patterns of each type by their shapes
+        obj_type_shaped_patterns = {}
+        for pattern in pattern_set:
+            obj_type_shaped_patterns.setdefault(pattern.obj_type, []).append(
+                (get_pattern_shape(pattern, self.INLINE_IDS_MAX), pattern)
+            )
 
-        # Render all queries for each type
+        # Render all queries for each type, collecting large ID sets
         obj_type_queries = {}
+        id_rows = []
         for obj_type in orm.data.SCHEMA.types.values():
-            for pattern in pattern_set:
-                if pattern.obj_type == obj_type:
-                    if obj_type not in obj_type_queries:
-                        obj_type_queries[obj_type] = []
-                    obj_type_queries[obj_type]. \
-                        append(self._oo_query_render(pattern))
-
-        # Execute all the queries for each type
-        with self.conn, self.conn.cursor() as cursor:
-            objs = {}
-            for obj_type, queries in obj_type_queries.items():
-                oo_query = self.OO_QUERIES[obj_type.name]
-                query_string = "\nUNION\n".join(q[0] for q in queries)
-                query_parameters = [p for q in queries for p in q[1]]
-                cursor.execute(query_string, query_parameters)
-                objs[obj_type.name] = list(
-                    oo_query["schema"].unpack_iter(cursor, drop_null=False)
-                )
+            if obj_type not in obj_type_shaped_patterns:
+                continue
+            shaped_patterns = sorted(
+                obj_type_shaped_patterns[obj_type],
+                key=lambda shaped_pattern: shaped_pattern[0]
+            )
+            shapes = tuple(shape for shape, _ in shaped_patterns)
+            names = get_projection_names(
+                self.OO_QUERIES[obj_type.name]["schema"], obj_type, projection
+            )
+            obj_type_queries[obj_type] = (
+                self.oo_query_cache.get(
+                    (obj_type.name, shapes, names),
+                    self._oo_query_render_type, obj_type, shapes, names
+                ),
+                [
+                    parameter
+                    for _, pattern in shaped_patterns
+                    for parameter in get_pattern_parameters(
+                        pattern, self.INLINE_IDS_MAX, id_rows
+                    )
+                ],
+                names
+            )
 
-        assert LIGHT_ASSERTS or orm.data.SCHEMA.is_valid(objs)
+        # Execute all the queries, once more if statements prepared earlier
+        # went stale after a schema change made elsewhere
+        try:
+            objs = self._execute_oo_queries(obj_type_queries, id_rows, lazy)
+        # It's auto-generated, pylint: disable=no-member
+        except psycopg2.errors.FeatureNotSupported:
+            objs = self._execute_oo_queries(obj_type_queries, id_rows, lazy)
+
+        LOGGER.debug("OO query cache: %r", self.oo_query_cache)
+        assert LIGHT_ASSERTS or orm.data.SCHEMA.is_valid(objs, projection)
         return objs
 
+    def _prepare_rows(self, cursor, table_name, rows):
+        """
+        Prepare packed rows for loading into a table with the "INSERT"
+        command, e.g. replace values with lookup references. Does nothing
+        by default.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES the rows are
+                        packed for (by its storage table, if any).
+            rows:       The list of packed rows (lists) to prepare.
+        """
+
+    def _prepare_staged(self, cursor, table_name, staging_name):
+        """
+        Prepare rows in a staging table for merging into a table, e.g. add
+        missing values to lookup tables. Does nothing by default.
+
+        Args:
+            cursor:         The cursor to use for accessing the database.
+            table_name:     The name of the table in TABLES the staging
+                            table is created for (by its storage table,
+                            if any).
+            staging_name:   The name of the staging table.
+        """
+
+    def _after_merge(self, cursor, table_name, keys):
+        """
+        Update the database after objects were loaded into a table, e.g.
+        the data derived from them. Does nothing by default.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES the objects were
+                        loaded into.
+            keys:       A list of the loaded objects' IDs, as stored in
+                        the table (or its storage table, if any).
+        """
+
+    def _load_table(self, cursor, table_name, obj_list):
+        """
+        Load objects into a table (or its storage table, if any), as a part
+        of the load() transaction.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES to load into.
+            obj_list:   The list of the objects to load.
+        """
+        # Load into the storage table, if the table is a view
+        if table_name in self.STORAGE_TABLES:
+            table_schema = self.STORAGE_TABLES[table_name]
+            target_name = "_" + table_name
+        else:
+            table_schema = self.TABLES[table_name]
+            target_name = table_name
+        id_column = table_schema.get_columns(("id",))[0]
+        if self.conn.load_copy:
+            staging_name = table_name + "_staging"
+            cursor.execute(table_schema.format_create_staging(staging_name))
+            cursor.copy_expert(
+                table_schema.format_copy(staging_name),
+                CopyReader(table_schema.pack_iter(obj_list)),
+                size=65536
+            )
+            self._prepare_staged(cursor, table_name, staging_name)
+            cursor.execute(
+                table_schema.format_merge(
+                    target_name, staging_name, self.conn.load_prio_db
+                )
+            )
+            cursor.execute(
+                "SELECT DISTINCT " +
+                id_column.schema.format_value(f"{staging_name}.id") +
+                f" FROM {staging_name}"
+            )
+            keys = [key for key, in cursor.fetchall()]
+        else:
+            rows = list(table_schema.pack_iter(obj_list))
+            self._prepare_rows(cursor, table_name, rows)
+            psycopg2.extras.execute_batch(
+                cursor,
+                table_schema.format_insert(
+                    target_name, self.conn.load_prio_db
+                ),
+                rows
+            )
+            id_index = table_schema.columns.index(id_column)
+            keys = list({row[id_index] for row in rows})
+        self._after_merge(cursor, table_name, keys)
+
     def load(self, data):
         """
         Load data into the database.
@@ -805,15 +1266,9 @@ class Schema(AbstractSchema):
         assert self.io.is_compatible_directly(data)
         assert LIGHT_ASSERTS or self.io.is_valid_exactly(data)
         with self.conn, self.conn.cursor() as cursor:
-            for table_name, table_schema in self.TABLES.items():
+            for table_name in self.TABLES:
                 if table_name in data:
-                    psycopg2.extras.execute_batch(
-                        cursor,
-                        table_schema.format_insert(
-                            table_name, self.conn.load_prio_db
-                        ),
-                        table_schema.pack_iter(data[table_name])
-                    )
+                    self._load_table(cursor, table_name, data[table_name])
         # Flip priority for the next load to maintain (rough)
         # parity with non-determinism of BigQuery's ANY_VALUE()
         self.conn.load_prio_db = not self.conn.load_prio_db
@@ -0,0 +1,73 @@
+"""Kernel CI report database - PostgreSQL schema v4.2"""
+
+import logging
+import kcidb.io as io
+from kcidb.db.sql.schema import Index
+from .v04_01 import Schema as PreviousSchema
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+
+class Schema(PreviousSchema):
+    """PostgreSQL database schema v4.2"""
+
+    # The schema's version.
+    version = (4, 2)
+    # The I/O schema the database schema supports
+    io = io.schema.V4_1
+
+    # A map of index names to index definitions
+    INDEXES = dict(
+        checkouts_revision=Index(
+            "checkouts", ["git_commit_hash", "patchset_hash"]
+        ),
+        builds_checkout_id=Index("builds", ["checkout_id"]),
+        tests_build_id=Index("tests", ["build_id"]),
+        # Match the version-resolving window ordering
+        issues_id_version=Index("issues", ["id", "version DESC"]),
+        incidents_issue_id_version=Index(
+            "incidents", ["issue_id", "issue_version DESC"]
+        ),
+        incidents_build_id=Index("incidents", ["build_id"]),
+        incidents_test_id=Index("incidents", ["test_id"]),
+    )
+
+    @classmethod
+    def _create_indexes(cls, conn):
+        """
+        Create all the schema's indexes missing from the database.
+
+        Args:
+            conn:   Connection to the database to create the indexes in.
+                    The database must have all the schema's tables created.
+        """
+        assert isinstance(conn, cls.Connection)
+        with conn, conn.cursor() as cursor:
+            for index_name, index_schema in cls.INDEXES.items():
+                try:
+                    cursor.execute(index_schema.format_create(index_name))
+                except Exception as exc:
+                    raise Exception(
+                        f"Failed creating index {index_name!r}"
+                    ) from exc
+
+    @classmethod
+    def _inherit(cls, conn):
+        """
+        Inerit the database data from the previous schema version (if any).
+
+        Args:
+            conn:   Connection to the database to inherit. The database must
+                    comply with the previous version of the schema.
+        """
+        assert isinstance(conn, cls.Connection)
+        cls._create_indexes(conn)
+
+    def init(self):
+        """
+        Initialize the database.
+        The database must be uninitialized.
+        """
+        super().init()
+        self._create_indexes(self.conn)
@@ -0,0 +1,253 @@
+"""Kernel CI report database - PostgreSQL schema v4.3"""
+
+import logging
+import kcidb.io as io
+from kcidb.misc import merge_dicts
+from kcidb.db.postgresql.schema import \
+    Constraint, BoolColumn, FloatColumn, IntegerColumn, TimestampColumn, \
+    TextColumn, JSONColumn, CompressedTextColumn, CompressedJSONColumn, \
+    Table, CopyReader
+from .v04_02 import Schema as PreviousSchema
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+
+class Schema(PreviousSchema):
+    """PostgreSQL database schema v4.3"""
+
+    # The schema's version.
+    version = (4, 3)
+    # The I/O schema the database schema supports
+    io = io.schema.V4_1
+
+    # A map of table names to table definitions
+    # Log excerpts, "misc" data, and file lists are stored compressed
+    TABLES = dict(
+        checkouts=Table({
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "tree_name": TextColumn(),
+            "git_repository_url": TextColumn(),
+            "git_commit_hash": TextColumn(),
+            "git_commit_name": TextColumn(),
+            "git_repository_branch": TextColumn(),
+            "patchset_files": CompressedJSONColumn(),
+            "patchset_hash": TextColumn(),
+            "message_id": TextColumn(),
+            "comment": TextColumn(),
+            "start_time": TimestampColumn(),
+            "contacts": JSONColumn(),
+            "log_url": TextColumn(),
+            "log_excerpt": CompressedTextColumn(),
+            "valid": BoolColumn(),
+            "misc": CompressedJSONColumn(),
+        }),
+        builds=Table({
+            "checkout_id": TextColumn(constraint=Constraint.NOT_NULL),
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "comment": TextColumn(),
+            "start_time": TimestampColumn(),
+            "duration": FloatColumn(),
+            "architecture": TextColumn(),
+            "command": TextColumn(),
+            "compiler": TextColumn(),
+            "input_files": CompressedJSONColumn(),
+            "output_files": CompressedJSONColumn(),
+            "config_name": TextColumn(),
+            "config_url": TextColumn(),
+            "log_url": TextColumn(),
+            "log_excerpt": CompressedTextColumn(),
+            "valid": BoolColumn(),
+            "misc": CompressedJSONColumn(),
+        }),
+        tests=Table({
+            "build_id": TextColumn(constraint=Constraint.NOT_NULL),
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "environment.comment": TextColumn(),
+            "environment.misc": CompressedJSONColumn(),
+            "path": TextColumn(),
+            "comment": TextColumn(),
+            "log_url": TextColumn(),
+            "log_excerpt": CompressedTextColumn(),
+            "status": TextColumn(),
+            "waived": BoolColumn(),
+            "start_time": TimestampColumn(),
+            "duration": FloatColumn(),
+            "output_files": CompressedJSONColumn(),
+            "misc": CompressedJSONColumn()
+        }),
+        issues=Table({
+            "id": TextColumn(constraint=Constraint.NOT_NULL),
+            "version": IntegerColumn(constraint=Constraint.NOT_NULL),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "report_url": TextColumn(),
+            "report_subject": TextColumn(),
+            "culprit.code": BoolColumn(),
+            "culprit.tool": BoolColumn(),
+            "culprit.harness": BoolColumn(),
+            "build_valid": BoolColumn(),
+            "test_status": TextColumn(),
+            "comment": TextColumn(),
+            "misc": CompressedJSONColumn()
+        }, primary_key=["id", "version"]),
+        incidents=Table({
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "issue_id": TextColumn(constraint=Constraint.NOT_NULL),
+            "issue_version": IntegerColumn(constraint=Constraint.NOT_NULL),
+            "build_id": TextColumn(),
+            "test_id": TextColumn(),
+            "present": BoolColumn(),
+            "comment": TextColumn(),
+            "misc": CompressedJSONColumn(),
+        }),
+    )
+
+    # Queries and their columns for each type of raw object-oriented data.
+    # Both should have columns in the same order.
+    # NOTE: Relying on dictionaries preserving order in Python 3.6+
+    OO_QUERIES = merge_dicts(
+        PreviousSchema.OO_QUERIES,
+        revision=merge_dicts(
+            PreviousSchema.OO_QUERIES["revision"],
+            schema=Table(dict(
+                git_commit_hash=TextColumn(),
+                patchset_hash=TextColumn(),
+                patchset_files=CompressedJSONColumn(),
+                git_commit_name=TextColumn(),
+                contacts=JSONColumn(),
+            )),
+        ),
+        checkout=merge_dicts(
+            PreviousSchema.OO_QUERIES["checkout"],
+            schema=Table(dict(
+                id=TextColumn(),
+                git_commit_hash=TextColumn(),
+                patchset_hash=TextColumn(),
+                origin=TextColumn(),
+                git_repository_url=TextColumn(),
+                git_repository_branch=TextColumn(),
+                tree_name=TextColumn(),
+                message_id=TextColumn(),
+                start_time=TimestampColumn(),
+                log_url=TextColumn(),
+                log_excerpt=CompressedTextColumn(),
+                comment=TextColumn(),
+                valid=BoolColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+        build=merge_dicts(
+            PreviousSchema.OO_QUERIES["build"],
+            schema=Table(dict(
+                id=TextColumn(),
+                checkout_id=TextColumn(),
+                origin=TextColumn(),
+                start_time=TimestampColumn(),
+                duration=FloatColumn(),
+                architecture=TextColumn(),
+                command=TextColumn(),
+                compiler=TextColumn(),
+                input_files=CompressedJSONColumn(),
+                output_files=CompressedJSONColumn(),
+                config_name=TextColumn(),
+                config_url=TextColumn(),
+                log_url=TextColumn(),
+                log_excerpt=CompressedTextColumn(),
+                comment=TextColumn(),
+                valid=BoolColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+        test=merge_dicts(
+            PreviousSchema.OO_QUERIES["test"],
+            schema=Table(dict(
+                id=TextColumn(),
+                build_id=TextColumn(),
+                origin=TextColumn(),
+                path=TextColumn(),
+                environment_comment=TextColumn(),
+                environment_misc=CompressedJSONColumn(),
+                log_url=TextColumn(),
+                log_excerpt=CompressedTextColumn(),
+                status=TextColumn(),
+                waived=BoolColumn(),
+                start_time=TimestampColumn(),
+                duration=FloatColumn(),
+                output_files=CompressedJSONColumn(),
+                comment=TextColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+        issue=merge_dicts(
+            PreviousSchema.OO_QUERIES["issue"],
+            schema=Table(dict(
+                id=TextColumn(),
+                version=IntegerColumn(),
+                origin=TextColumn(),
+                report_url=TextColumn(),
+                report_subject=TextColumn(),
+                culprit_code=BoolColumn(),
+                culprit_tool=BoolColumn(),
+                culprit_harness=BoolColumn(),
+                build_valid=BoolColumn(),
+                test_status=TextColumn(),
+                comment=TextColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+        incident=merge_dicts(
+            PreviousSchema.OO_QUERIES["incident"],
+            schema=Table(dict(
+                id=TextColumn(),
+                origin=TextColumn(),
+                issue_id=TextColumn(),
+                issue_version=IntegerColumn(),
+                build_id=TextColumn(),
+                test_id=TextColumn(),
+                comment=TextColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+    )
+
+    @classmethod
+    def _inherit(cls, conn):
+        """
+        Inerit the database data from the previous schema version (if any).
+
+        Args:
+            conn:   Connection to the database to inherit. The database must
+                    comply with the previous version of the schema.
+        """
+        assert isinstance(conn, cls.Connection)
+        # Rebuild the tables, compressing the data
+        with conn, conn.cursor() as cursor:
+            for table_name, table_schema in cls.TABLES.items():
+                prev_table_schema = PreviousSchema.TABLES[table_name]
+                cursor.execute(
+                    f"ALTER TABLE {table_name} RENAME TO _{table_name}"
+                )
+                # Free the primary key constraint name for the new table
+                cursor.execute(
+                    f"ALTER TABLE _{table_name} "
+                    f"DROP CONSTRAINT IF EXISTS {table_name}_pkey"
+                )
+                cursor.execute(table_schema.format_create(table_name))
+                # Stream the rows with a server-side cursor
+                with conn.cursor(f"inherit_{table_name}") as dump_cursor:
+                    dump_cursor.itersize = conn.fetch_size
+                    dump_cursor.execute(
+                        prev_table_schema.format_dump("_" + table_name)
+                    )
+                    cursor.copy_expert(
+                        table_schema.format_copy(table_name),
+                        CopyReader(table_schema.pack_iter(
+                            prev_table_schema.unpack_iter(dump_cursor)
+                        ))
+                    )
+                cursor.execute(f"DROP TABLE _{table_name}")
+        cls._create_indexes(conn)
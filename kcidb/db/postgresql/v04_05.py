@@ -0,0 +1,263 @@
+"""Kernel CI report database - PostgreSQL schema v4.5"""
+
+import logging
+import kcidb.io as io
+from kcidb.misc import merge_dicts
+from kcidb.db.sql.schema import Index
+from kcidb.db.postgresql.schema import \
+    Constraint, BoolColumn, FloatColumn, TimestampColumn, TextColumn, \
+    CompressedTextColumn, CompressedJSONColumn, LookupColumn, Table
+from .v04_04 import Schema as PreviousSchema
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+
+# It's OK, pylint: disable=too-many-ancestors
+class Schema(PreviousSchema):
+    """PostgreSQL database schema v4.5"""
+
+    # The schema's version.
+    version = (4, 5)
+    # The I/O schema the database schema supports
+    io = io.schema.V4_1
+
+    # A map of names of tables in TABLES, which are views instead, and
+    # definitions of the tables storing their data. Each storage table is
+    # named after its view, with an underscore prepended. IDs of checkouts
+    # and builds are stored in lookup tables, and their integer keys are
+    # used for referencing the objects and joining the tables. Tests also
+    # store the keys of their checkouts (copied from their builds), to be
+    # found without joining the builds.
+    STORAGE_TABLES = merge_dicts(
+        PreviousSchema.STORAGE_TABLES,
+        tests=Table({
+            "build_id": LookupColumn(
+                "_build_ids",
+                constraint=Constraint.NOT_NULL,
+                type="BIGINT"
+            ),
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "environment.comment": TextColumn(),
+            "environment.misc": CompressedJSONColumn(),
+            "path": TextColumn(),
+            "comment": TextColumn(),
+            "log_url": TextColumn(),
+            "log_excerpt": CompressedTextColumn(),
+            "status": TextColumn(),
+            "waived": BoolColumn(),
+            "start_time": TimestampColumn(),
+            "duration": FloatColumn(),
+            "output_files": CompressedJSONColumn(),
+            "misc": CompressedJSONColumn(),
+            "checkout_id": LookupColumn("_checkout_ids", type="BIGINT"),
+        }),
+    )
+
+    # A map of names of tables in STORAGE_TABLES storing checkout keys of
+    # their (non-child) objects, and the names of the tables of their
+    # parents, and the columns referencing the parents. Parents come before
+    # their children.
+    CHECKOUT_PARENTS = dict(
+        tests=("builds", "build_id"),
+    )
+
+    # A map of index names to index definitions
+    INDEXES = merge_dicts(
+        PreviousSchema.INDEXES,
+        tests_checkout_id=Index("_tests", ["checkout_id"]),
+    )
+
+    # Queries and their columns for each type of raw object-oriented data.
+    # Both should have columns in the same order.
+    # The queries can return extra columns after those, storing IDs of
+    # ancestors of the specified types, which can be joined directly.
+    # NOTE: Relying on dictionaries preserving order in Python 3.6+
+    OO_QUERIES = merge_dicts(
+        PreviousSchema.OO_QUERIES,
+        test=merge_dicts(
+            PreviousSchema.OO_QUERIES["test"],
+            statement="SELECT\n"
+                      "    id,\n"
+                      "    build_id,\n"
+                      "    origin,\n"
+                      "    path,\n"
+                      "    environment_comment,\n"
+                      "    environment_misc,\n"
+                      "    log_url,\n"
+                      "    log_excerpt,\n"
+                      "    status,\n"
+                      "    waived,\n"
+                      "    start_time,\n"
+                      "    duration,\n"
+                      "    output_files,\n"
+                      "    comment,\n"
+                      "    misc,\n"
+                      "    checkout_id\n"
+                      "FROM _tests",
+            ancestor_ids=dict(checkout=("checkout_id",)),
+        ),
+    )
+
+    @classmethod
+    def _format_update_checkouts(cls, table_name, by_parent=True):
+        """
+        Format the "UPDATE" command copying checkout keys to objects of a
+        table from their parents (or NULL, if the parents are missing),
+        where they differ, for the parents (or the objects themselves) with
+        specified keys, returning the keys of the updated objects.
+
+        Args:
+            table_name: The name of the table in CHECKOUT_PARENTS to
+                        update the objects of.
+            by_parent:  True if the keys are of the parents, False if
+                        they're of the objects themselves.
+
+        Returns:
+            The formatted "UPDATE" command, expecting the list of
+            (parent or own) keys as the parameter.
+        """
+        parent_name, ref_name = cls.CHECKOUT_PARENTS[table_name]
+        key_name = ref_name if by_parent else "id"
+        parent_checkout_id = \
+            f"(SELECT checkout_id FROM _{parent_name} AS parent " \
+            f"WHERE parent.id = _{table_name}.{ref_name})"
+        return \
+            f"UPDATE _{table_name} SET\n" \
+            f"    checkout_id = {parent_checkout_id}\n" \
+            f"WHERE {key_name} = ANY(%s) AND\n" \
+            f"    checkout_id IS DISTINCT FROM {parent_checkout_id}\n" \
+            "RETURNING id"
+
+    @classmethod
+    def _inherit(cls, conn):
+        """
+        Inerit the database data from the previous schema version (if any).
+
+        Args:
+            conn:   Connection to the database to inherit. The database must
+                    comply with the previous version of the schema.
+        """
+        assert isinstance(conn, cls.Connection)
+        # Add the checkout keys to tests, and copy them from builds
+        with conn, conn.cursor() as cursor:
+            for table_name, (parent_name, ref_name) in \
+                    cls.CHECKOUT_PARENTS.items():
+                column = cls.STORAGE_TABLES[table_name].get_columns(
+                    ("checkout_id",)
+                )[0]
+                cursor.execute(
+                    f"ALTER TABLE _{table_name} ADD COLUMN " +
+                    column.name + " " +
+                    column.schema.format_nameless_def()
+                )
+                cursor.execute(
+                    f"UPDATE _{table_name} SET\n"
+                    "    checkout_id = parent.checkout_id\n"
+                    f"FROM _{parent_name} AS parent\n"
+                    f"WHERE parent.id = _{table_name}.{ref_name}"
+                )
+        cls._create_indexes(conn)
+
+    def _prepare_rows(self, cursor, table_name, rows):
+        """
+        Prepare packed rows for loading into a table with the "INSERT"
+        command: add checkout keys from the (stored) parents, so that
+        merging them changes as few as possible.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES the rows are
+                        packed for (by its storage table, if any).
+            rows:       The list of packed rows (lists) to prepare.
+        """
+        super()._prepare_rows(cursor, table_name, rows)
+        if table_name not in self.CHECKOUT_PARENTS:
+            return
+        parent_name, ref_name = self.CHECKOUT_PARENTS[table_name]
+        table_schema = self.STORAGE_TABLES[table_name]
+        ref_index, checkout_index = (
+            table_schema.columns.index(column)
+            for column in table_schema.get_columns((ref_name, "checkout_id"))
+        )
+        cursor.execute(
+            f"SELECT id, checkout_id FROM _{parent_name} WHERE id = ANY(%s)",
+            (list({row[ref_index] for row in rows}),)
+        )
+        checkout_ids = dict(cursor.fetchall())
+        for row in rows:
+            row[checkout_index] = checkout_ids.get(row[ref_index])
+
+    def _prepare_staged(self, cursor, table_name, staging_name):
+        """
+        Prepare rows in a staging table for merging into a table: add
+        checkout IDs from the (stored) parents, so that merging them
+        changes as few as possible.
+
+        Args:
+            cursor:         The cursor to use for accessing the database.
+            table_name:     The name of the table in TABLES the staging
+                            table is created for (by its storage table,
+                            if any).
+            staging_name:   The name of the staging table.
+        """
+        super()._prepare_staged(cursor, table_name, staging_name)
+        if table_name not in self.CHECKOUT_PARENTS:
+            return
+        parent_name, ref_name = self.CHECKOUT_PARENTS[table_name]
+        ref_column, checkout_column = self.STORAGE_TABLES[table_name]. \
+            get_columns((ref_name, "checkout_id"))
+        cursor.execute(
+            f"UPDATE {staging_name} SET checkout_id = (\n"
+            "    SELECT lookup.value\n"
+            f"    FROM _{parent_name} AS parent\n"
+            f"    INNER JOIN {checkout_column.schema.lookup} AS lookup\n"
+            "        ON lookup.id = parent.checkout_id\n"
+            "    WHERE parent.id = " +
+            ref_column.schema.format_value(f"{staging_name}.{ref_name}") +
+            "\n)"
+        )
+
+    def _propagate_checkouts(self, cursor, parent_name, keys):
+        """
+        Copy checkout keys from objects to their descendants, where they
+        differ.
+
+        Args:
+            cursor:         The cursor to use for updating the descendants.
+            parent_name:    The name of the table containing the objects.
+            keys:           A list of keys of the objects to copy from.
+        """
+        for table_name, (table_parent_name, _) in \
+                self.CHECKOUT_PARENTS.items():
+            if table_parent_name == parent_name and keys:
+                cursor.execute(self._format_update_checkouts(table_name),
+                               (keys,))
+                self._propagate_checkouts(
+                    cursor, table_name, [key for key, in cursor.fetchall()]
+                )
+
+    def _after_merge(self, cursor, table_name, keys):
+        """
+        Update the database after objects were loaded into a table: copy
+        checkout keys to the loaded objects from their (stored) parents,
+        and then to the descendants of the objects updated.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES the objects were
+                        loaded into.
+            keys:       A list of the loaded objects' IDs, as stored in
+                        the table (or its storage table, if any).
+        """
+        super()._after_merge(cursor, table_name, keys)
+        # Derive the checkout keys from the parent references, as merged,
+        # instead of loading them, to keep them consistent
+        if table_name in self.CHECKOUT_PARENTS and keys:
+            cursor.execute(
+                self._format_update_checkouts(table_name, by_parent=False),
+                (keys,)
+            )
+            keys = [key for key, in cursor.fetchall()]
+        self._propagate_checkouts(cursor, table_name, keys)
@@ -1,5 +1,7 @@
 """Kernel CI reporting database - driver with discrete schemas"""
 
+import os
+import time
 import inspect
 from abc import ABCMeta, ABC, abstractmethod
 import kcidb.io as io
@@ -8,6 +10,11 @@ from kcidb.db.misc import UnsupportedSchema
 from kcidb.misc import LIGHT_ASSERTS
 from kcidb.db.abstract import Driver as AbstractDriver
 
+# The number of seconds to keep the database metadata (the schema version)
+# cached for by default. Zero to disable caching. The last modification time
+# is never cached, as other processes' loads change it.
+METADATA_TTL = float(os.environ.get("KCIDB_DB_METADATA_TTL_SEC", "0"))
+
 
 class MetaConnection(ABCMeta):
     """Connection metaclass"""
@@ -49,6 +56,46 @@ class Connection(ABC, metaclass=MetaConnection):
             NotFound        - the database does not exist,
         """
         assert params is None or isinstance(params, str)
+        # The number of seconds to keep the metadata cached for
+        self.metadata_ttl = METADATA_TTL
+        # A dictionary of names of cached metadata, and tuples containing
+        # their values and expiration times (time.monotonic())
+        self.metadata_cache = {}
+
+    def get_cached_metadata(self, name, retrieve):
+        """
+        Get a piece of the connected database's metadata from the cache,
+        retrieving and caching it, if missing or expired.
+
+        Args:
+            name:       The name of the metadata to get.
+            retrieve:   A function retrieving the metadata from the
+                        database, called with no arguments, if the cached
+                        value cannot be used.
+
+        Returns:
+            The (possibly cached) metadata value.
+        """
+        assert isinstance(name, str)
+        assert callable(retrieve)
+        now = time.monotonic()
+        try:
+            value, expires = self.metadata_cache[name]
+            if now < expires:
+                return value
+        except KeyError:
+            pass
+        value = retrieve()
+        if self.metadata_ttl > 0:
+            self.metadata_cache[name] = (value, now + self.metadata_ttl)
+        return value
+
+    def invalidate_metadata(self):
+        """
+        Drop all the cached metadata of the connected database, forcing its
+        retrieval next time. To be called after modifying the database.
+        """
+        self.metadata_cache.clear()
 
     @abstractmethod
     def set_schema_version(self, version):
@@ -98,7 +145,9 @@ class Connection(ABC, metaclass=MetaConnection):
         Returns:
             True if the database is initialized, False otherwise.
         """
-        return self.get_schema_version() is not None
+        return self.get_cached_metadata(
+            "schema_version", self.get_schema_version
+        ) is not None
 
 
 class MetaSchema(ABCMeta):
@@ -241,6 +290,13 @@ class Schema(ABC, metaclass=MetaSchema):
         The database must be initialized.
         """
 
+    def compact(self):
+        """
+        Compact the database, rewriting its data into a more efficient
+        storage, without changing what is stored.
+        The database must be initialized. Does nothing by default.
+        """
+
     @abstractmethod
     def dump_iter(self, objects_per_report):
         """
@@ -290,7 +346,7 @@ class Schema(ABC, metaclass=MetaSchema):
         assert objects_per_report >= 0
 
     @abstractmethod
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Query raw object-oriented data from the database.
         The database must be initialized.
@@ -298,6 +354,15 @@ class Schema(ABC, metaclass=MetaSchema):
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
@@ -305,6 +370,7 @@ class Schema(ABC, metaclass=MetaSchema):
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, orm.query.Pattern)
                    for r in pattern_set)
+        assert orm.data.SCHEMA.is_valid_projection(projection)
 
     @abstractmethod
     def load(self, data):
@@ -385,7 +451,9 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
         assert params is None or isinstance(params, str)
         super().__init__(params)
         self.conn = self.LatestSchema.Connection(params)
-        version = self.conn.get_schema_version()
+        version = self.conn.get_cached_metadata(
+            "schema_version", self.conn.get_schema_version
+        )
         # If the database is not initialized with a schema
         if version is None:
             self.schema = None
@@ -428,8 +496,11 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
         else:
             raise Exception("Schema version {version!r} is not available")
         self.schema = schema(self.conn)
-        self.schema.init()
-        self.conn.set_schema_version(version)
+        try:
+            self.schema.init()
+            self.conn.set_schema_version(version)
+        finally:
+            self.conn.invalidate_metadata()
 
     def cleanup(self):
         """
@@ -437,8 +508,11 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
         The database must be initialized.
         """
         assert self.is_initialized()
-        self.schema.conn.set_schema_version(None)
-        self.schema.cleanup()
+        try:
+            self.schema.conn.set_schema_version(None)
+            self.schema.cleanup()
+        finally:
+            self.conn.invalidate_metadata()
         self.schema = None
 
     def empty(self):
@@ -449,6 +523,15 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
         assert self.is_initialized()
         self.schema.empty()
 
+    def compact(self):
+        """
+        Compact the driven database, rewriting its data into a more
+        efficient storage, without changing what is stored.
+        The database must be initialized.
+        """
+        assert self.is_initialized()
+        self.schema.compact()
+
     def get_last_modified(self):
         """
         Get the time the data in the driven database was last modified.
@@ -521,12 +604,15 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
             raise Exception("Target schema is not a driver's newer schema")
 
         # Inherit data through all newer versions up to the target one
-        for schema in newer_schemas:
-            # The metaclass makes sure each schema has its own _inherit()
-            # It's OK, we're friends, pylint: disable=protected-access
-            schema._inherit(self.conn)
-            self.conn.set_schema_version(schema.version)
-            self.schema = schema(self.conn)
+        try:
+            for schema in newer_schemas:
+                # The metaclass makes sure each schema has its own _inherit()
+                # It's OK, we're friends, pylint: disable=protected-access
+                schema._inherit(self.conn)
+                self.conn.set_schema_version(schema.version)
+                self.schema = schema(self.conn)
+        finally:
+            self.conn.invalidate_metadata()
 
     def dump_iter(self, objects_per_report):
         """
@@ -578,7 +664,7 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
             ids, children, parents, objects_per_report
         )
 
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Query raw object-oriented data from the database.
         The database must be initialized.
@@ -586,6 +672,15 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
@@ -593,8 +688,9 @@ class Driver(AbstractDriver, metaclass=MetaDriver):
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, orm.query.Pattern)
                    for r in pattern_set)
+        assert orm.data.SCHEMA.is_valid_projection(projection)
         assert self.is_initialized()
-        return self.schema.oo_query(pattern_set)
+        return self.schema.oo_query(pattern_set, lazy, projection)
 
     def load(self, data):
         """
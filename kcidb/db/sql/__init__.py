@@ -1,3 +1,3 @@
 """Kernel CI report database - abstract SQL driver"""
 
-from kcidb.db.sql import schema  # noqa: F401
+from kcidb.db.sql import schema, cache  # noqa: F401
@@ -0,0 +1,242 @@
+"""
+Kernel CI report database - SQL statement cache
+"""
+
+from collections import OrderedDict
+import kcidb.orm as orm
+
+# The number of IDs returned by get_id_bucket() for ID sets which should be
+# loaded into a table instead of being rendered into a query
+TABLE_IDS = -2
+
+# The maximum number of ID fields in any object type, i.e. the number of ID
+# field columns in a table of IDs
+ID_FIELD_NUM = max(
+    len(obj_type.id_fields) for obj_type in orm.data.SCHEMA.types.values()
+)
+
+
+def get_id_bucket(obj_id_set, max_inline=0):
+    """
+    Get the number of object IDs a query would be rendered for, to match a
+    set of object IDs. Queries are rendered for ID numbers rounded up to the
+    nearest power of two, to limit the number of distinct queries.
+
+    Args:
+        obj_id_set: The set of object IDs to match, or None to match all
+                    objects.
+        max_inline: The maximum number of IDs to render into a query,
+                    instead of loading them into a table. Zero for no limit.
+
+    Returns:
+        The number of IDs to render the query for, zero for the empty set,
+        -1 for None, or TABLE_IDS for sets over the "max_inline" limit.
+    """
+    assert obj_id_set is None or isinstance(obj_id_set, (set, frozenset))
+    assert isinstance(max_inline, int) and max_inline >= 0
+    if obj_id_set is None:
+        return -1
+    if not obj_id_set:
+        return 0
+    if max_inline and len(obj_id_set) > max_inline:
+        return TABLE_IDS
+    return 1 << (len(obj_id_set) - 1).bit_length()
+
+
+def get_pattern_shape(pattern, max_inline=0):
+    """
+    Get the "shape" of a pattern: the part determining the query rendered
+    for it, but not the query parameters.
+
+    Args:
+        pattern:    The pattern (kcidb.orm.query.Pattern) to get the shape
+                    of.
+        max_inline: The maximum number of IDs to render into a query,
+                    instead of loading them into a table. Zero for no limit.
+
+    Returns:
+        A tuple of tuples, one for the pattern and each of its bases, in
+        order, each containing the object type name, the boolean "child"
+        flag (false, if there's no base), and the number of IDs to render
+        the query for, as returned by get_id_bucket().
+    """
+    assert isinstance(pattern, orm.query.Pattern)
+    shape = []
+    while pattern is not None:
+        shape.append((
+            pattern.obj_type.name,
+            pattern.child and pattern.base is not None,
+            get_id_bucket(pattern.obj_id_set, max_inline)
+        ))
+        pattern = pattern.base
+    return tuple(shape)
+
+
+def get_pattern_parameters(pattern, max_inline=0, id_rows=None):
+    """
+    Get the parameters for the query rendered for a pattern's shape.
+
+    Args:
+        pattern:    The pattern (kcidb.orm.query.Pattern) to get the query
+                    parameters for.
+        max_inline: The maximum number of IDs to render into a query,
+                    instead of loading them into a table. Zero for no limit.
+        id_rows:    The list to append rows of the ID table to, for the ID
+                    sets over the "max_inline" limit. Each row has the
+                    number of the ID set, followed by ID_FIELD_NUM ID field
+                    values, padded with None. Cannot be None, if
+                    "max_inline" is not zero.
+
+    Returns:
+        A list of the ID field values for the pattern and each of its bases,
+        in order, padded with None values up to the number of IDs returned
+        by get_id_bucket(). A set loaded into the ID table is represented
+        with its number instead.
+    """
+    assert isinstance(pattern, orm.query.Pattern)
+    assert isinstance(max_inline, int) and max_inline >= 0
+    assert isinstance(id_rows, list) or not max_inline
+    parameters = []
+    while pattern is not None:
+        id_num = get_id_bucket(pattern.obj_id_set, max_inline)
+        if id_num == TABLE_IDS:
+            id_set_num = id_rows[-1][0] + 1 if id_rows else 0
+            padding = \
+                (None,) * (ID_FIELD_NUM - len(pattern.obj_type.id_fields))
+            for obj_id in pattern.obj_id_set:
+                id_rows.append((id_set_num, *obj_id, *padding))
+            parameters.append(id_set_num)
+        elif id_num > 0:
+            for obj_id in pattern.obj_id_set:
+                parameters.extend(obj_id)
+            parameters.extend(
+                [None] * (len(pattern.obj_type.id_fields) *
+                          (id_num - len(pattern.obj_id_set)))
+            )
+        pattern = pattern.base
+    return parameters
+
+
+def get_shape_shortcut(shape, ancestor_columns):
+    """
+    Find the longest shortcut joining the objects of the first level of a
+    pattern shape directly to the objects of a further level, skipping the
+    levels in between. Possible when the skipped levels match all objects,
+    and the objects of one of the two joined levels store IDs of their
+    ancestors at the other level.
+
+    Args:
+        shape:              The shape of the pattern, as returned by
+                            get_pattern_shape().
+        ancestor_columns:   A dictionary of object type names, and
+                            dictionaries of names of their ancestor types,
+                            and tuples of names of the columns storing the
+                            ancestor's ID fields, in order.
+
+    Returns:
+        None if there's no shortcut, or a tuple containing the index of the
+        level to join to, and a list of pairs of names of the columns to
+        join on: of the first level, and of the level joined to.
+    """
+    assert isinstance(shape, tuple) and shape
+    assert isinstance(ancestor_columns, dict)
+    type_name, child, _ = shape[0]
+    shortcut = None
+    for index in range(1, len(shape)):
+        base_type_name, base_child, base_id_num = shape[index]
+        if index > 1 and child:
+            columns = ancestor_columns.get(type_name, {}).get(base_type_name)
+            if columns:
+                shortcut = index, list(zip(
+                    columns,
+                    orm.data.SCHEMA.types[base_type_name].id_fields
+                ))
+        elif index > 1:
+            columns = ancestor_columns.get(base_type_name, {}).get(type_name)
+            if columns:
+                shortcut = index, list(zip(
+                    orm.data.SCHEMA.types[type_name].id_fields,
+                    columns
+                ))
+        # Only skip levels going the same direction, and matching all objects
+        if base_child != child or base_id_num != -1:
+            break
+    return shortcut
+
+
+def get_projection_names(table, obj_type, projection):
+    """
+    Get the names of the columns to retrieve for raw OO data of a type,
+    according to a projection.
+
+    Args:
+        table:      The schema (kcidb.db.sql.schema.Table) of the raw OO data
+                    of the type.
+        obj_type:   The type of the objects (kcidb.orm.data.Type).
+        projection: A dictionary of object type names and sets of names of
+                    fields to retrieve for objects of those types, or None to
+                    retrieve all fields.
+
+    Returns:
+        A tuple of names of the columns to retrieve, in the table's order,
+        or None to retrieve all the columns.
+    """
+    assert isinstance(obj_type, orm.data.Type)
+    assert orm.data.SCHEMA.is_valid_projection(projection)
+    fields = obj_type.get_projected_fields(projection)
+    if len(fields) == len(obj_type.fields):
+        return None
+    return tuple(
+        column.name for column in table.columns if column.name in fields
+    )
+
+
+class StatementCache:
+    """
+    A size-limited cache of rendered statements, evicting the least-recently
+    used ones, and counting hits and misses.
+    """
+
+    def __init__(self, max_size=256):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size:   The maximum number of statements to keep.
+        """
+        assert isinstance(max_size, int) and max_size > 0
+        self.max_size = max_size
+        self.statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render, *args):
+        """
+        Retrieve a statement from the cache, rendering and caching it, if
+        missing.
+
+        Args:
+            key:    The hashable key of the statement (e.g. its shape).
+            render: A function returning the rendered statement, called with
+                    the remaining arguments, if the statement is not cached.
+            args:   The arguments to call the render function with.
+
+        Returns:
+            The rendered statement.
+        """
+        try:
+            statement = self.statements[key]
+            self.statements.move_to_end(key)
+            self.hits += 1
+        except KeyError:
+            statement = render(*args)
+            self.statements[key] = statement
+            if len(self.statements) > self.max_size:
+                self.statements.popitem(last=False)
+            self.misses += 1
+        return statement
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} " \
+            f"statements={len(self.statements)} " \
+            f"hits={self.hits} misses={self.misses}>"
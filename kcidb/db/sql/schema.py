@@ -3,7 +3,11 @@ Kernel CI report database - generic SQL schema definitions
 """
 
 import re
+import json
+import zlib
 from enum import Enum
+from types import MappingProxyType
+from kcidb.orm.data import LazyJSON
 
 
 class Constraint(Enum):
@@ -31,6 +35,16 @@ class Column:
         """
         return value
 
+    def unpack_lazy(self, value):
+        """
+        Unpack the database representation of the column value into the JSON
+        representation, possibly lazily, deferring expensive decoding (such
+        as of JSON) until the value is accessed. Can return an object to be
+        decoded later instead of the value, e.g. a kcidb.orm.data.LazyJSON.
+        Unpacks eagerly with unpack() by default.
+        """
+        return self.unpack(value)
+
     def __init__(self, type, constraint=None):
         """
         Initialize the column schema.
@@ -58,6 +72,163 @@ class Column:
             nameless_def += " " + self.constraint.value
         return nameless_def
 
+    def format_value(self, expression):
+        """
+        Format an expression converting a packed value into the value stored
+        in the column.
+
+        Args:
+            expression: The expression producing the packed value.
+
+        Returns:
+            The formatted expression.
+        """
+        # Placate older pylint
+        assert self
+        assert isinstance(expression, str)
+        return expression
+
+
+class CompressedTextColumn(Column):
+    """
+    A column storing text in a binary type, compressed with zlib, unless it's
+    too short to benefit. Each value starts with a byte specifying its
+    format, followed by the UTF-8-encoded text, compressed or not.
+    """
+
+    # The format byte of uncompressed values
+    FORMAT_RAW = b"\0"
+    # The format byte of zlib-compressed values
+    FORMAT_ZLIB = b"z"
+    # The minimum length of UTF-8-encoded text to try compressing, bytes
+    MIN_SIZE = 64
+    # The zlib compression level
+    LEVEL = 6
+
+    @classmethod
+    def compress(cls, text):
+        """
+        Compress a text string into the column's binary format.
+
+        Args:
+            text:   The text string to compress.
+
+        Returns:
+            The compressed binary string.
+        """
+        data = text.encode()
+        if len(data) >= cls.MIN_SIZE:
+            compressed_data = zlib.compress(data, cls.LEVEL)
+            if len(compressed_data) < len(data):
+                return cls.FORMAT_ZLIB + compressed_data
+        return cls.FORMAT_RAW + data
+
+    @classmethod
+    def decompress(cls, value):
+        """
+        Decompress a text string from the column's binary format.
+
+        Args:
+            value:  The compressed binary string, or another bytes-like
+                    object (such as a memoryview).
+
+        Returns:
+            The decompressed text string.
+        """
+        # Memoryviews of some formats don't compare equal to bytes
+        format_byte = bytes(value[:1])
+        if format_byte == cls.FORMAT_ZLIB:
+            return zlib.decompress(value[1:]).decode()
+        assert format_byte == cls.FORMAT_RAW
+        return str(value[1:], "utf-8")
+
+    @staticmethod
+    def pack(value):
+        """
+        Pack the JSON representation of the column value into the database
+        representation.
+        """
+        return CompressedTextColumn.compress(value)
+
+    @staticmethod
+    def unpack(value):
+        """
+        Unpack the database representation of the column value into the JSON
+        representation.
+        """
+        return CompressedTextColumn.decompress(value)
+
+
+class CompressedJSONColumn(CompressedTextColumn):
+    """
+    A column storing JSON-encoded values in a binary type, compressed the
+    same way as in CompressedTextColumn.
+    """
+
+    @staticmethod
+    def pack(value):
+        """
+        Pack the JSON representation of the column value into the database
+        representation.
+        """
+        return CompressedTextColumn.compress(json.dumps(value))
+
+    @staticmethod
+    def unpack(value):
+        """
+        Unpack the database representation of the column value into the JSON
+        representation.
+        """
+        return json.loads(CompressedTextColumn.decompress(value))
+
+    def unpack_lazy(self, value):
+        """
+        Unpack the database representation of the column value into the JSON
+        representation, lazily, decompressing, but keeping it encoded until
+        accessed.
+        """
+        return LazyJSON(CompressedTextColumn.decompress(value))
+
+
+class LookupColumn(Column):
+    """
+    A column storing integer references to values in a lookup table,
+    instead of the (repeating) values themselves. Each lookup table has an
+    integer primary key "id" column, and a unique "value" column. Packed
+    values have to be replaced with references before inserting them with
+    the "INSERT" command formatted by Table.format_insert().
+    """
+
+    def __init__(self, type, lookup, constraint=None):
+        """
+        Initialize the column schema.
+
+        Args:
+            type:           The name of the database type to use
+                            for this column.
+            lookup:         The name of the lookup table.
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+        """
+        assert isinstance(lookup, str)
+        super().__init__(type, constraint=constraint)
+        self.lookup = lookup
+
+    def format_value(self, expression):
+        """
+        Format an expression converting a packed value into the value stored
+        in the column.
+
+        Args:
+            expression: The expression producing the packed value.
+
+        Returns:
+            The formatted expression.
+        """
+        assert isinstance(expression, str)
+        return f"(SELECT id FROM {self.lookup} WHERE value = {expression})"
+
 
 class TableColumn:
     """A column within a table schema"""
@@ -105,6 +276,7 @@ class TableColumn:
 
 class Table:
     """A table schema"""
+    # It's OK, pylint: disable=too-many-instance-attributes
 
     def __init__(self, placeholder, columns, primary_key=None, key_sep="_"):
         """
@@ -154,6 +326,11 @@ class Table:
         ]
         # A string of comma-separated column names for use in commands
         self.columns_list = ", ".join(column.name for column in self.columns)
+        # A list of columns storing references to lookup tables
+        self.lookup_columns = [
+            column for column in self.columns
+            if isinstance(column.schema, LookupColumn)
+        ]
         # A list of columns in the explicitly-specified primary key
         self.primary_key = None if primary_key is None else [
             column
@@ -161,6 +338,159 @@ class Table:
             for column in self.columns
             if column.name == column_name
         ]
+        # A dictionary of argument tuples and formatted statements
+        self.statements = {}
+        # A function packing objects, specialized for the columns
+        self._pack = self._compile_packer()
+        # A dictionary of ("drop_null", "lazy", "names") argument tuples and
+        # functions unpacking objects, specialized for the columns,
+        # compiled on demand
+        self._unpack = {}
+
+    def _compile(self, name, lines, namespace):
+        """
+        Compile a function specialized for the table.
+
+        Args:
+            name:       The name of the function.
+            lines:      A list of the function's source lines.
+            namespace:  A dictionary of global names available to the
+                        function, and their values. Will have the function
+                        added.
+
+        Returns:
+            The compiled function.
+        """
+        assert isinstance(name, str)
+        assert isinstance(lines, list)
+        assert isinstance(namespace, dict)
+        code = compile("\n".join(lines) + "\n",
+                       f"<{self.__class__.__name__}.{name}>", "exec")
+        # It's our own code, pylint: disable=exec-used
+        exec(code, namespace)
+        return namespace[name]
+
+    def _compile_packer(self):
+        """
+        Compile a function packing a JSON object into its database
+        representation, the way pack() does, but with the columns' nested
+        keys and value packers resolved at compile time.
+
+        Returns:
+            The compiled function, accepting an object, and returning the
+            packed object.
+        """
+        # An immutable empty dictionary to descend into for missing nodes
+        namespace = dict(EMPTY=MappingProxyType({}))
+        lines = ["def pack(obj):"]
+        # A dictionary of node key tuples and names of their variables
+        node_vars = {(): "obj"}
+        value_vars = []
+        for index, column in enumerate(self.columns):
+            keys = tuple(column.keys[:-1])
+            for depth in range(1, len(keys) + 1):
+                if keys[:depth] not in node_vars:
+                    node_vars[keys[:depth]] = f"n{len(node_vars)}"
+                    lines.append(
+                        f"    {node_vars[keys[:depth]]} = "
+                        f"{node_vars[keys[:depth - 1]]}."
+                        f"get({keys[depth - 1]!r}, EMPTY)"
+                    )
+            value_var = f"v{index}"
+            lines.append(f"    {value_var} = "
+                         f"{node_vars[keys]}.get({column.keys[-1]!r})")
+            if column.schema.pack is not Column.pack:
+                namespace[f"pack{index}"] = column.schema.pack
+                lines.append(f"    if {value_var} is not None:")
+                lines.append(f"        {value_var} = "
+                             f"pack{index}({value_var})")
+            value_vars.append(value_var)
+        lines.append("    return [" + ", ".join(value_vars) + "]")
+        return self._compile("pack", lines, namespace)
+
+    def _compile_unpacker(self, drop_null, lazy, names):
+        """
+        Compile a function unpacking a database representation of an object
+        into its JSON representation, the way unpack() does, but with the
+        columns' nested keys and value unpackers resolved at compile time.
+
+        Args:
+            drop_null:  Drop fields with NULL values, if true.
+                        Keep them otherwise.
+            lazy:       Unpack the values with the columns' unpack_lazy(),
+                        if true, and with unpack() otherwise.
+            names:      A tuple of names of the columns in the database
+                        representation, in the table's order, or None, if it
+                        has all the columns.
+
+        Returns:
+            The compiled function, accepting a packed object, and returning
+            the unpacked object.
+        """
+        # Calm down, pylint: disable=too-many-locals
+        columns = self.columns if names is None else [
+            column for column in self.columns if column.name in names
+        ]
+        assert names is None or len(columns) == len(names)
+        namespace = {}
+        value_vars = [f"v{index}" for index in range(len(columns))]
+        # A dictionary of node key tuples and names of their variables,
+        # parents first
+        node_vars = {(): "unpacked_obj"}
+        for column in columns:
+            for depth in range(1, len(column.keys)):
+                node_vars.setdefault(tuple(column.keys[:depth]),
+                                     f"n{len(node_vars)}")
+        # A set of key tuples of nodes created unconditionally so far
+        created_nodes = {()}
+
+        def format_node_creation(keys, indent):
+            """
+            Format lines creating a node and its missing parents: the first
+            time it's needed, if NULL fields are dropped, and right away
+            otherwise.
+            """
+            if keys in created_nodes:
+                return []
+            creation = [
+                f"{indent}{node_vars[keys]} = "
+                f"{node_vars[keys[:-1]]}[{keys[-1]!r}] = {{}}"
+            ]
+            if not drop_null:
+                created_nodes.add(keys)
+                return format_node_creation(keys[:-1], indent) + creation
+            return [f"{indent}if {node_vars[keys]} is None:"] + \
+                format_node_creation(keys[:-1], indent + "    ") + \
+                ["    " + creation[0]]
+
+        lines = ["def unpack(obj):"]
+        lines.append("    " + "".join(v + ", " for v in value_vars) + "= obj")
+        lines.append("    unpacked_obj = {}")
+        if drop_null:
+            lines.extend(f"    {node_var} = None"
+                         for node_var in list(node_vars.values())[1:])
+        for column, value_var in zip(columns, value_vars):
+            unpack = column.schema.unpack
+            if lazy and \
+               type(column.schema).unpack_lazy is not Column.unpack_lazy:
+                unpack = column.schema.unpack_lazy
+            if unpack is Column.unpack:
+                value = value_var
+            else:
+                namespace[f"unpack_{value_var}"] = unpack
+                value = f"unpack_{value_var}({value_var})"
+                if not drop_null:
+                    value += f" if {value_var} is not None else None"
+            indent = "    "
+            if drop_null:
+                lines.append(f"    if {value_var} is not None:")
+                indent += "    "
+            keys = tuple(column.keys[:-1])
+            lines.extend(format_node_creation(keys, indent))
+            lines.append(f"{indent}{node_vars[keys]}"
+                         f"[{column.keys[-1]!r}] = {value}")
+        lines.append("    return unpacked_obj")
+        return self._compile("unpack", lines, namespace)
 
     def format_create(self, name):
         """
@@ -200,16 +530,146 @@ class Table:
             parameters packed by the pack() method.
         """
         assert isinstance(name, str)
+        key = ("insert", name, prio_db)
+        if key not in self.statements:
+            self.statements[key] = \
+                f"INSERT INTO {name} (\n" + \
+                ",\n".join(f"    {c.name}" for c in self.columns) + \
+                "\n)\nVALUES (\n    " + \
+                ", ".join((self.placeholder, ) * len(self.columns)) + \
+                "\n)\n" + self.format_on_conflict(name, prio_db)
+        return self.statements[key]
+
+    def format_insert_select(self, name, source_name):
+        """
+        Format the "INSERT" command copying all rows of a table with the same
+        columns, but storing packed values in place of lookup references,
+        into a table with this schema.
+
+        Args:
+            name:           The name of the target table of the command.
+            source_name:    The name of the table to copy the rows from.
+
+        Returns:
+            The formatted "INSERT" command.
+        """
+        assert isinstance(name, str)
+        assert isinstance(source_name, str)
+        return f"INSERT INTO {name} ({self.columns_list})\nSELECT\n" + \
+            ",\n".join(
+                "    " + c.schema.format_value(f"{source_name}.{c.name}")
+                for c in self.columns
+            ) + f"\nFROM {source_name}"
+
+    def get_columns(self, names=None):
+        """
+        Get a list of table columns with specified names.
+
+        Args:
+            names:  A sequence of names of the columns to get, in the order
+                    to return them, or None to get all columns.
+
+        Returns:
+            The list of the columns (TableColumn instances).
+        """
+        if names is None:
+            return self.columns
+        columns = {column.name: column for column in self.columns}
+        return [columns[name] for name in names]
+
+    def format_resolved_columns(self, name, names=None):
+        """
+        Format the list of "SELECT" command expressions returning table
+        columns, with lookup references resolved to their values, when
+        accompanied by the joins formatted with format_resolving_joins().
+
+        Args:
+            name:   The name (or alias) of the table in the command.
+            names:  A sequence of names of the columns to return, or None
+                    to return all columns.
+
+        Returns:
+            The formatted expressions, one indented expression per line.
+        """
+        assert isinstance(name, str)
+        return ",\n".join(
+            f"    _{c.name}.value AS {c.name}"
+            if c in self.lookup_columns else
+            f"    {name}.{c.name} AS {c.name}"
+            for c in self.get_columns(names)
+        )
+
+    def format_resolving_joins(self, name, names=None):
+        """
+        Format the "JOIN" clauses resolving lookup references for the
+        expressions formatted with format_resolved_columns().
+
+        Args:
+            name:   The name (or alias) of the table in the command.
+            names:  A sequence of names of the columns to resolve, or None
+                    to resolve all columns.
+
+        Returns:
+            The formatted clauses, each starting with a newline.
+        """
+        assert isinstance(name, str)
+        return "".join(
+            f"\nLEFT JOIN {c.schema.lookup} AS _{c.name} "
+            f"ON _{c.name}.id = {name}.{c.name}"
+            for c in self.get_columns(names)
+            if c in self.lookup_columns
+        )
+
+    def format_select_resolved(self, name, names=None):
+        """
+        Format the "SELECT" command returning all rows of the table, with
+        lookup references resolved to their values, e.g. for defining a
+        view with packed values.
+
+        Args:
+            name:   The name of the target table of the command.
+            names:  A sequence of names of the columns to return, or None
+                    to return all columns.
+
+        Returns:
+            The formatted "SELECT" command.
+        """
+        assert isinstance(name, str)
+        return "SELECT\n" + self.format_resolved_columns(name, names) + \
+            f"\nFROM {name}" + self.format_resolving_joins(name, names)
+
+    def is_key_column(self, column):
+        """
+        Check if a column belongs to the table's primary key.
+
+        Args:
+            column: The column to check (a TableColumn instance).
+
+        Returns:
+            True if the column is a part of the primary key, False otherwise.
+        """
+        assert isinstance(column, TableColumn)
+        return column.schema.constraint == Constraint.PRIMARY_KEY or \
+            column in (self.primary_key or [])
+
+    def format_on_conflict(self, name, prio_db):
+        """
+        Format the "ON CONFLICT" clause for an "INSERT" command loading rows
+        into a database, observing deduplication logic.
+
+        Args:
+            name:       The name of the target table of the command.
+            prio_db:    If true, format the UPDATE part of the clause so that
+                        the values already in the database take priority over
+                        the loaded ones, and vice versa otherwise.
+        Returns:
+            The formatted "ON CONFLICT" clause.
+        """
+        assert isinstance(name, str)
         return \
-            f"INSERT INTO {name} (\n" + \
-            ",\n".join(f"    {c.name}" for c in self.columns) + \
-            "\n)\nVALUES (\n    " + \
-            ", ".join((self.placeholder, ) * len(self.columns)) + \
-            "\n)\nON CONFLICT (" + \
+            "ON CONFLICT (" + \
             ", ".join(
-                c.name for c in self.columns
-                if c.schema.constraint == Constraint.PRIMARY_KEY or
-                c in (self.primary_key or [])
+                c.name for c in self.columns if self.is_key_column(c)
             ) + ") DO UPDATE SET\n" + \
             ",\n".join(
                 f"    {c.name} = COALESCE(" + (
@@ -217,9 +677,7 @@ class Table:
                     if prio_db else
                     f"excluded.{c.name}, {name}.{c.name}"
                 ) + ")"
-                for c in self.columns
-                if c.schema.constraint != Constraint.PRIMARY_KEY and
-                c not in (self.primary_key or [])
+                for c in self.columns if not self.is_key_column(c)
             )
 
     def format_dump(self, name):
@@ -234,7 +692,10 @@ class Table:
             The formatted "SELECT" command.
         """
         assert isinstance(name, str)
-        return f"SELECT {self.columns_list} FROM {name}"
+        key = ("dump", name)
+        if key not in self.statements:
+            self.statements[key] = f"SELECT {self.columns_list} FROM {name}"
+        return self.statements[key]
 
     def format_delete(self, name):
         """
@@ -264,20 +725,7 @@ class Table:
             The packed object.
         """
         assert isinstance(obj, dict)
-        packed_obj = []
-        for column in self.columns:
-            node = obj
-            for i, key in enumerate(column.keys):
-                if key in node:
-                    if i + 1 == len(column.keys):
-                        packed_obj.append(column.schema.pack(node[key]))
-                        break
-                    node = node[key]
-                    assert isinstance(node, dict)
-                else:
-                    packed_obj.append(None)
-                    break
-        return packed_obj
+        return self._pack(obj)
 
     def pack_iter(self, obj_seq):
         """
@@ -291,10 +739,32 @@ class Table:
         Returns:
             The generator packing the object sequence.
         """
-        for obj in obj_seq:
-            yield self.pack(obj)
+        return map(self._pack, obj_seq)
+
+    def _get_unpacker(self, drop_null, lazy, names):
+        """
+        Get a function unpacking a database representation of an object,
+        specialized for the columns, compiling it, if not done yet.
+
+        Args:
+            drop_null:  Drop fields with NULL values, if true.
+                        Keep them otherwise.
+            lazy:       Unpack the values with the columns' unpack_lazy(),
+                        if true, and with unpack() otherwise.
+            names:      A tuple of names of the columns in the database
+                        representation, in the table's order, or None, if it
+                        has all the columns.
+
+        Returns:
+            The function unpacking an object.
+        """
+        assert names is None or isinstance(names, tuple)
+        key = (bool(drop_null), bool(lazy), names)
+        if key not in self._unpack:
+            self._unpack[key] = self._compile_unpacker(*key)
+        return self._unpack[key]
 
-    def unpack(self, obj, drop_null=True):
+    def unpack(self, obj, drop_null=True, lazy=False, names=None):
         """
         Unpack a database representation of an object into its JSON
         representation.
@@ -303,24 +773,18 @@ class Table:
             obj:        The object to unpack.
             drop_null:  Drop fields with NULL values, if true.
                         Keep them otherwise.
+            lazy:       Unpack values lazily with the columns'
+                        unpack_lazy(), if true, eagerly otherwise.
+            names:      A tuple of names of the columns the object contains,
+                        in the table's order, or None, if it contains all
+                        the columns.
 
         Returns:
             The unpacked object.
         """
-        unpacked_obj = {}
-        for column, value in zip(self.columns, obj):
-            if value is None and drop_null:
-                continue
-            node = unpacked_obj
-            for key in column.keys[:-1]:
-                if key not in node:
-                    node[key] = {}
-                node = node[key]
-            node[column.keys[-1]] = \
-                None if value is None else column.schema.unpack(value)
-        return unpacked_obj
-
-    def unpack_iter(self, obj_seq, drop_null=True):
+        return self._get_unpacker(drop_null, lazy, names)(obj)
+
+    def unpack_iter(self, obj_seq, drop_null=True, lazy=False, names=None):
         """
         Create a generator unpacking database object representations from
         the specified sequence into their JSON representation.
@@ -329,9 +793,47 @@ class Table:
             obj_seq:    The object sequence to create the generator for.
             drop_null:  Drop fields with NULL values, if true.
                         Keep them otherwise.
+            lazy:       Unpack values lazily with the columns'
+                        unpack_lazy(), if true, eagerly otherwise.
+            names:      A tuple of names of the columns the objects contain,
+                        in the table's order, or None, if they contain all
+                        the columns.
 
         Returns:
             The generator unpacking the object sequence.
         """
-        for obj in obj_seq:
-            yield self.unpack(obj, drop_null)
+        return map(self._get_unpacker(drop_null, lazy, names), obj_seq)
+
+
+class Index:
+    """An index schema"""
+
+    def __init__(self, table, columns):
+        """
+        Initialize the index schema.
+
+        Args:
+            table:      The name of the table being indexed.
+            columns:    A list of (quoted) names of the table's columns to
+                        index, in order. Each can be followed by the sort
+                        order ("ASC" or "DESC"), separated by a space.
+        """
+        assert isinstance(table, str)
+        assert isinstance(columns, list) and columns
+        assert all(isinstance(column, str) for column in columns)
+        self.table = table
+        self.columns = columns
+
+    def format_create(self, name):
+        """
+        Format the "CREATE" command for the index.
+
+        Args:
+            name:   The name of the index to create.
+
+        Returns:
+            The formatted "CREATE" command.
+        """
+        assert isinstance(name, str)
+        return f"CREATE INDEX IF NOT EXISTS {name} ON {self.table} (" + \
+            ", ".join(self.columns) + ")"
@@ -0,0 +1,100 @@
+"""kcidb.db.sql.cache module tests"""
+
+from unittest.mock import Mock
+import pytest
+from kcidb.orm.query import Pattern
+from kcidb.db.sql.cache import TABLE_IDS, get_id_bucket, \
+    get_pattern_shape, get_shape_shortcut, StatementCache
+
+# Columns of builds and tests storing their revision IDs
+ANCESTOR_COLUMNS = {
+    type_name: dict(revision=("git_commit_hash", "patchset_hash"))
+    for type_name in ("build", "test")
+}
+
+
+def get_shortcut(string, obj_id_set_list=None):
+    """Get the shortcut for the shape of a single-pattern string"""
+    pattern_set = Pattern.parse(string, obj_id_set_list)
+    assert len(pattern_set) == 1
+    return get_shape_shortcut(get_pattern_shape(pattern_set.pop()),
+                              ANCESTOR_COLUMNS)
+
+
+def test_shape_shortcut():
+    """Check shortcuts are found only across levels matching all objects"""
+    revision_id = ("a" * 40, "")
+    revision_columns = [("git_commit_hash", "git_commit_hash"),
+                        ("patchset_hash", "patchset_hash")]
+    # Descendants
+    assert get_shortcut(">revision%>checkout>build>test#",
+                        [{revision_id}]) == (3, revision_columns)
+    assert get_shortcut(">revision%>checkout>build#",
+                        [{revision_id}]) == (2, revision_columns)
+    assert get_shortcut(">revision%>checkout>build%>test#",
+                        [{revision_id}, {("b",)}]) is None
+    assert get_shortcut(">revision%>checkout#", [{revision_id}]) is None
+    assert get_shortcut(">checkout%>build>test#", [{("c",)}]) is None
+    # Ancestors, the furthest one
+    assert get_shortcut(">test%<build<checkout<revision#",
+                        [{("t",)}]) == (3, revision_columns)
+    assert get_shortcut(">build%<checkout<revision#",
+                        [{("b",)}]) == (2, revision_columns)
+    assert get_shortcut(">test%<build%<checkout<revision#",
+                        [{("t",)}, {("b",)}]) == (2, revision_columns)
+    assert get_shortcut(">test%<build<checkout%<revision#",
+                        [{("t",)}, {("c",)}]) is None
+    # Direction changes
+    assert get_shortcut(">checkout%<revision>checkout>build#",
+                        [{("c",)}]) == (2, revision_columns)
+    assert get_shortcut(">revision%>checkout>build<checkout#",
+                        [{revision_id}]) is None
+
+
+def test_id_bucket():
+    """Check ID set sizes are rounded up to powers of two, up to a limit"""
+    assert get_id_bucket(None) == -1
+    assert get_id_bucket(None, 4) == -1
+    assert get_id_bucket(set()) == 0
+    assert get_id_bucket(frozenset(), 4) == 0
+    for size, bucket in ((1, 1), (2, 2), (3, 4), (4, 4), (5, 8),
+                         (8, 8), (9, 16), (1000, 1024), (1025, 2048)):
+        id_set = {(str(i),) for i in range(size)}
+        assert get_id_bucket(id_set) == bucket, f"Size {size}"
+        assert get_id_bucket(frozenset(id_set)) == bucket, f"Size {size}"
+        assert get_id_bucket(id_set, size) == bucket, f"Size {size}"
+        assert get_id_bucket(id_set, size - 1 or 1) == \
+            (bucket if size == 1 else TABLE_IDS), f"Size {size}"
+    # Different sizes in the same bucket have the same shape
+    assert get_pattern_shape(Pattern.parse(
+        ">checkout%#", [{("a",), ("b",), ("c",)}]
+    ).pop()) == get_pattern_shape(Pattern.parse(
+        ">checkout%#", [{("a",), ("b",), ("c",), ("d",)}]
+    ).pop())
+
+
+def test_statement_cache():
+    """Check statements are cached, counted, and evicted in LRU order"""
+    cache = StatementCache(max_size=2)
+    render = Mock(side_effect=lambda *args: "SELECT " + ", ".join(args))
+    assert cache.get("a", render, "1") == "SELECT 1"
+    assert cache.get("a", render, "2") == "SELECT 1"
+    assert (cache.hits, cache.misses, render.call_count) == (1, 1, 1)
+    assert cache.get("b", render, "2", "3") == "SELECT 2, 3"
+    assert (cache.hits, cache.misses, render.call_count) == (1, 2, 2)
+    # Use "a", making "b" the least-recently used one, and evict it
+    assert cache.get("a", render) == "SELECT 1"
+    assert cache.get("c", render, "4") == "SELECT 4"
+    assert list(cache.statements) == ["a", "c"]
+    assert (cache.hits, cache.misses, render.call_count) == (2, 3, 3)
+    assert cache.get("b", render, "5") == "SELECT 5"
+    assert list(cache.statements) == ["c", "b"]
+    assert (cache.hits, cache.misses, render.call_count) == (2, 4, 4)
+    assert repr(cache) == \
+        "<StatementCache statements=2 hits=2 misses=4>"
+    # Failed rendering caches nothing
+    render.side_effect = Exception("Failed")
+    with pytest.raises(Exception, match="Failed"):
+        cache.get("d", render)
+    assert list(cache.statements) == ["c", "b"]
+    assert (cache.hits, cache.misses) == (2, 4)
@@ -0,0 +1,127 @@
+"""kcidb.db.sql.schema module tests"""
+
+import json
+from kcidb.db.sql.schema import Table, Column, LookupColumn, \
+    CompressedTextColumn, CompressedJSONColumn
+
+
+class UpperColumn(Column):
+    """A column storing strings in upper case"""
+
+    @staticmethod
+    def pack(value):
+        """Pack a string into upper case"""
+        return value.upper()
+
+    @staticmethod
+    def unpack(value):
+        """Unpack an upper case string into lower case"""
+        return value.lower()
+
+
+TABLE = Table("?", {
+    "id": Column("TEXT"),
+    "a.b.c": UpperColumn("TEXT"),
+    "x": Column("TEXT"),
+    "a.d": Column("TEXT"),
+    "a.b.e": UpperColumn("TEXT"),
+})
+
+
+def test_pack():
+    """Check objects are packed correctly"""
+    assert TABLE.pack({}) == [None] * 5
+    assert TABLE.pack(dict(id="1", a=dict(b=dict(e="e")))) == \
+        ["1", None, None, None, "E"]
+    assert list(TABLE.pack_iter([
+        dict(id="1", a=dict(b=dict(c="c", e="e"), d="d"), x="x"),
+        dict(x="x", a=dict(d="d")),
+    ])) == [
+        ["1", "C", "x", "d", "E"],
+        [None, None, "x", "d", None],
+    ]
+
+
+def test_unpack():
+    """Check objects are unpacked correctly, with and without NULLs"""
+    assert TABLE.unpack([None] * 5) == {}
+    assert TABLE.unpack([None] * 5, drop_null=False) == \
+        dict(id=None, a=dict(b=dict(c=None, e=None), d=None), x=None)
+    # Check the order of keys is preserved
+    assert json.dumps(TABLE.unpack(["1", None, "x", "d", "E"])) == \
+        json.dumps(dict(id="1", x="x", a=dict(d="d", b=dict(e="e"))))
+    assert list(TABLE.unpack_iter([
+        ["1", "C", "x", "d", "E"],
+        [None, "C", None, None, None],
+    ])) == [
+        dict(id="1", a=dict(b=dict(c="c", e="e"), d="d"), x="x"),
+        dict(a=dict(b=dict(c="c"))),
+    ]
+    # Check objects with some of the columns are unpacked correctly
+    assert TABLE.unpack(["1", "E"], names=("id", "a_b_e")) == \
+        dict(id="1", a=dict(b=dict(e="e")))
+    assert TABLE.unpack(["x", None], drop_null=False, names=("x", "a_d")) == \
+        dict(x="x", a=dict(d=None))
+
+
+def test_statements():
+    """Check formatted statements are reused"""
+    assert TABLE.format_dump("t") is TABLE.format_dump("t")
+    assert TABLE.format_insert("t", True) is TABLE.format_insert("t", True)
+    assert TABLE.format_insert("t", True) != TABLE.format_insert("t", False)
+
+
+def test_compressed():
+    """Check compressed columns round-trip values"""
+    text_column = CompressedTextColumn("BLOB")
+    json_column = CompressedJSONColumn("BLOB")
+    # Short values are stored raw
+    assert text_column.pack("abc") == b"\0abc"
+    assert text_column.unpack(b"\0abc") == "abc"
+    assert text_column.unpack(memoryview(b"\0abc")) == "abc"
+    # Long compressible values are compressed
+    text = "Kernel panic - not syncing: Fatal exception\n" * 100
+    packed = text_column.pack(text)
+    assert packed[:1] == b"z"
+    assert len(packed) < len(text) // 10
+    assert text_column.unpack(packed) == text
+    assert text_column.unpack(memoryview(packed)) == text
+    assert text_column.unpack(memoryview(packed).cast("c")) == text
+    # Non-ASCII text survives
+    assert text_column.unpack(text_column.pack("\u2603" * 100)) == \
+        "\u2603" * 100
+    # JSON values are encoded, compressed, and decoded lazily on demand
+    misc = dict(config=["CONFIG_X=y"] * 100, retries=2)
+    packed = json_column.pack(misc)
+    assert packed[:1] == b"z"
+    assert json_column.unpack(packed) == misc
+    assert json_column.unpack_lazy(packed).decode() == misc
+    assert json_column.unpack(json_column.pack(None)) is None
+
+
+def test_lookup():
+    """Check lookup columns are resolved by the statements"""
+    table = Table("?", {
+        "id": Column("TEXT"),
+        "origin": LookupColumn("INTEGER", "origins"),
+    })
+    assert table.lookup_columns == table.columns[1:]
+    # Packed values are stored as is
+    assert table.pack(dict(id="1", origin="o")) == ["1", "o"]
+    assert table.format_insert_select("t", "s") == \
+        "INSERT INTO t (id, origin)\nSELECT\n" \
+        "    s.id,\n" \
+        "    (SELECT id FROM origins WHERE value = s.origin)\n" \
+        "FROM s"
+    assert table.format_select_resolved("t") == \
+        "SELECT\n" \
+        "    t.id AS id,\n" \
+        "    _origin.value AS origin\n" \
+        "FROM t\n" \
+        "LEFT JOIN origins AS _origin ON _origin.id = t.origin"
+    # Only the requested columns are resolved
+    assert table.format_resolved_columns("obj", ("origin",)) == \
+        "    _origin.value AS origin"
+    assert table.format_resolving_joins("obj", ("id",)) == ""
+    assert table.format_resolving_joins("obj", ("origin", "id")) == \
+        "\nLEFT JOIN origins AS _origin ON _origin.id = obj.origin"
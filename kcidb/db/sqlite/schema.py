@@ -3,7 +3,11 @@ Kernel CI SQLite report database miscellaneous schema definitions.
 """
 import json
 import dateutil.parser
-from kcidb.db.sql.schema import Constraint, Column, Table as _SQLTable
+from kcidb.orm.data import LazyJSON
+from kcidb.db.sql.schema import Constraint, Column, Table as _SQLTable, \
+    CompressedTextColumn as _CompressedTextColumn, \
+    CompressedJSONColumn as _CompressedJSONColumn, \
+    LookupColumn as _LookupColumn
 
 
 class BoolColumn(Column):
@@ -81,6 +85,13 @@ class JSONColumn(TextColumn):
         """
         return json.loads(value) if value is not None else None
 
+    def unpack_lazy(self, value):
+        """
+        Unpack the SQLite representation of the column value into the JSON
+        representation, lazily, keeping it encoded until accessed.
+        """
+        return LazyJSON(value) if value is not None else None
+
     def __init__(self, constraint=None):
         """
         Initialize the column description.
@@ -95,6 +106,82 @@ class JSONColumn(TextColumn):
         super().__init__(constraint=constraint)
 
 
+class CompressedTextColumn(_CompressedTextColumn):
+    """A compressed text column"""
+
+    def __init__(self, constraint=None):
+        """
+        Initialize the column description.
+
+        Args:
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+        """
+        assert constraint is None or isinstance(constraint, Constraint)
+        super().__init__("BLOB", constraint=constraint)
+
+
+class CompressedJSONColumn(_CompressedJSONColumn):
+    """A compressed JSON-encoded column"""
+
+    def __init__(self, constraint=None):
+        """
+        Initialize the column description.
+
+        Args:
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+        """
+        assert constraint is None or isinstance(constraint, Constraint)
+        super().__init__("BLOB", constraint=constraint)
+
+
+class LookupColumn(_LookupColumn):
+    """A column referencing text values in a lookup table"""
+
+    def __init__(self, lookup, constraint=None):
+        """
+        Initialize the column description.
+
+        Args:
+            lookup:         The name of the lookup table.
+            constraint:     The column's constraint.
+                            A member of the Constraint enum, or None,
+                            meaning no constraint.
+        """
+        assert constraint is None or isinstance(constraint, Constraint)
+        super().__init__("INTEGER", lookup, constraint=constraint)
+
+    def format_create_lookup(self):
+        """
+        Format the "CREATE" command for the lookup table.
+
+        Returns:
+            The formatted "CREATE" command.
+        """
+        return f"CREATE TABLE IF NOT EXISTS {self.lookup} (\n" \
+            "    id INTEGER PRIMARY KEY,\n" \
+            "    value TEXT NOT NULL UNIQUE\n" \
+            ")"
+
+    def format_insert_lookup(self, values):
+        """
+        Format the "INSERT" command adding missing values to the lookup
+        table.
+
+        Args:
+            values: The "VALUES" or the "SELECT" clause returning the
+                    (non-NULL) values to add, one per row.
+
+        Returns:
+            The formatted "INSERT" command.
+        """
+        assert isinstance(values, str)
+        return f"INSERT OR IGNORE INTO {self.lookup} (value) {values}"
+
+
 class TimestampColumn(TextColumn):
     """A normalized timestamp column"""
 
@@ -151,3 +238,88 @@ class Table(_SQLTable):
             The formatted "CREATE" command.
         """
         return super().format_create(name) + " WITHOUT ROWID"
+
+    def format_create_staging(self, name):
+        """
+        Format the "CREATE" command for a temporary table staging rows for
+        merging into this table with the command formatted by
+        format_merge(). The staging table has no constraints, stores packed
+        values in place of lookup references, and keeps the rows in the
+        order they are loaded, by their row IDs.
+
+        Args:
+            name:   The name of the staging table to create.
+
+        Returns:
+            The formatted "CREATE" command.
+        """
+        assert isinstance(name, str)
+        return f"CREATE TEMPORARY TABLE {name} (\n    " + \
+            ",\n    ".join(
+                f"{column.name} " + (
+                    "TEXT" if column in self.lookup_columns
+                    else column.schema.type
+                )
+                for column in self.columns
+            ) + "\n)"
+
+    def format_insert_staging(self, name):
+        """
+        Format the "INSERT" command template for adding rows packed by the
+        pack() method into a staging table created with the command
+        formatted by format_create_staging().
+
+        Args:
+            name:   The name of the staging table.
+
+        Returns:
+            The formatted "INSERT" command template.
+        """
+        assert isinstance(name, str)
+        return f"INSERT INTO {name} ({self.columns_list})\nVALUES (" + \
+            ", ".join((self.placeholder, ) * len(self.columns)) + ")"
+
+    def format_merge(self, name, staging_name, prio_db):
+        """
+        Format the "INSERT/UPDATE" command merging the rows of a staging
+        table created with the command formatted by format_create_staging()
+        into this table, observing the same deduplication logic as loading
+        the rows one-by-one with the command formatted by format_insert().
+        The rows are merged in the order of their keys (for locality), and
+        rows with the same key - in the order they were staged. Rows already
+        in the table are only updated, if any of their values change.
+
+        Args:
+            name:           The name of the target table of the command.
+            staging_name:   The name of the staging table to merge.
+            prio_db:        If true, format the command so that the values
+                            already in the database, and then earlier-loaded
+                            values take priority, and vice versa otherwise.
+        Returns:
+            The formatted "INSERT/UPDATE" command.
+        """
+        assert isinstance(name, str)
+        assert isinstance(staging_name, str)
+        return \
+            f"INSERT INTO {name} (\n" + \
+            ",\n".join(f"    {c.name}" for c in self.columns) + \
+            "\n)\nSELECT\n" + \
+            ",\n".join(
+                "    " + c.schema.format_value(f"{staging_name}.{c.name}")
+                for c in self.columns
+            ) + \
+            f"\nFROM {staging_name}\nORDER BY " + \
+            ", ".join(
+                str(i + 1) for i, c in enumerate(self.columns)
+                if self.is_key_column(c)
+            ) + f", {staging_name}.rowid\n" + \
+            self.format_on_conflict(name, prio_db) + \
+            "\nWHERE\n" + \
+            " OR\n".join(
+                f"    {name}.{c.name} IS NULL AND "
+                f"excluded.{c.name} IS NOT NULL"
+                if prio_db else
+                f"    excluded.{c.name} IS NOT NULL AND "
+                f"excluded.{c.name} IS NOT {name}.{c.name}"
+                for c in self.columns if not self.is_key_column(c)
+            )
@@ -2,20 +2,26 @@
 
 import random
 import textwrap
-from functools import reduce
 import datetime
 import logging
 import sqlite3
+import urllib.parse
 import kcidb.io as io
 import kcidb.orm as orm
 from kcidb.misc import LIGHT_ASSERTS
+from kcidb.db.misc import parse_params_options, sort_obj_list_names
 from kcidb.db.schematic import \
     Schema as AbstractSchema, \
     Connection as AbstractConnection
+from kcidb.db.sql.cache import \
+    TABLE_IDS, ID_FIELD_NUM, StatementCache, \
+    get_pattern_shape, get_pattern_parameters, get_projection_names, \
+    get_shape_shortcut
 from kcidb.db.sqlite.schema import \
     Constraint, Column, BoolColumn, IntegerColumn, TextColumn, \
     JSONColumn, TimestampColumn, Table
 
+# We'll manage for now, pylint: disable=too-many-lines
 
 # Module's logger
 LOGGER = logging.getLogger(__name__)
@@ -29,16 +35,55 @@ class Connection(AbstractConnection):
 
     # Documentation of the connection parameters
     _PARAMS_DOC = textwrap.dedent("""\
-        Parameters: <DATABASE>
+        Parameters: [<OPTIONS>]<DATABASE>
+
+        <OPTIONS>       A comma-separated list of <NAME>=<VALUE> options,
+                        enclosed in square brackets ('[' and ']'). Double
+                        the opening bracket to include one literally.
+                        Unspecified options other than "load" leave the
+                        SQLite defaults, or the settings persisted in the
+                        database, intact.
+                        Supported options:
+
+                        load    The data loading mode: "batch" to execute
+                                an INSERT command for each row (the
+                                default), or "stage" to insert rows into
+                                temporary tables first, and merge them
+                                into the main ones with one command per
+                                table.
+                        journal The journal mode: "delete", "truncate",
+                                "persist", "memory", "wal", or "off".
+                                The "wal" mode is persisted in the
+                                database file, speeds up loading, and
+                                lets other connections read while data is
+                                being loaded.
+                        sync    The synchronization level: "off",
+                                "normal", "full", or "extra". With the
+                                "wal" journal mode, "normal" is safe from
+                                corruption, but can lose the last loads on
+                                power failure.
+                        mmap    The maximum number of bytes of the
+                                database file to access via memory
+                                mapping. Zero disables memory mapping.
+                        cache   The page cache size: the number of pages,
+                                if positive, or the number of KiB, if
+                                negative.
+                        temp    Where to store temporary tables and
+                                indexes: "default", "file", or "memory".
+                        mode    The mode to open the database file in:
+                                "rw" to read and write (the default),
+                                "ro" to only read, or "immutable" to only
+                                read, assuming nothing modifies the file
+                                while it is open, and so skipping locking.
 
         <DATABASE>      A path-like object giving the pathname (absolute or
                         relative to the current working directory) of the
                         database file to be opened. Use ":memory:" to create
                         and use an in-memory database.
 
-                        If starts with an exclamation mark ('!'), the
-                        in-database data is prioritized explicitly initially,
-                        instead of randomly. Double to include one literally.
+        If the parameters start with an exclamation mark ('!'), the
+        in-database data is prioritized explicitly initially, instead of
+        randomly. Double to include one literally.
     """)
 
     def __init__(self, params):
@@ -50,6 +95,7 @@ class Connection(AbstractConnection):
                             access. See Connection._PARAMS_DOC for
                             documentation. Cannot be None (must be specified).
         """
+        # It's OK, pylint: disable=too-many-branches
         assert params is None or isinstance(params, str)
         if params is None:
             raise Exception("Parameters must be specified\n\n" +
@@ -61,13 +107,59 @@ class Connection(AbstractConnection):
                 self.load_prio_db = True
             params = params[1:]
 
+        options, params = parse_params_options(params)
+        # PRAGMA names and values to set for the connection
+        pragmas = {}
+        mode = "rw"
+        self.load_stage = False
+        for name, value in options.items():
+            if name == "load" and value in ("batch", "stage"):
+                self.load_stage = value == "stage"
+            elif name == "journal" and value in ("delete", "truncate",
+                                                 "persist", "memory",
+                                                 "wal", "off"):
+                pragmas["journal_mode"] = value
+            elif name == "sync" and value in ("off", "normal",
+                                              "full", "extra"):
+                pragmas["synchronous"] = value
+            elif name == "mmap" and value.isdigit():
+                pragmas["mmap_size"] = int(value)
+            elif name == "cache" and value.lstrip("-").isdigit():
+                pragmas["cache_size"] = int(value)
+            elif name == "temp" and value in ("default", "file", "memory"):
+                pragmas["temp_store"] = value
+            elif name == "mode" and value in ("rw", "ro", "immutable"):
+                mode = value
+            else:
+                raise Exception(
+                    f"Invalid option {name}={value!r}\n\n" +
+                    self._PARAMS_DOC
+                )
+        if mode != "rw" and params == ":memory:":
+            raise Exception(
+                f"Cannot open an in-memory database in {mode!r} mode\n\n" +
+                self._PARAMS_DOC
+            )
+
         super().__init__(params)
 
-        # Create the connection
-        self.conn = sqlite3.connect(params)
-        self.conn.set_trace_callback(
-            lambda s: LOGGER.debug("Executing:\n%s", s)
-        )
+        # Create the connection, allowing its use from other threads (one
+        # at a time), e.g. for parallel loading by the mux driver
+        if mode == "rw":
+            self.conn = sqlite3.connect(params, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(
+                "file:" + urllib.parse.quote(params) +
+                ("?mode=ro" if mode == "ro" else "?immutable=1"),
+                uri=True, check_same_thread=False
+            )
+        for pragma, value in pragmas.items():
+            self.conn.execute(f"PRAGMA {pragma} = {value}").fetchall()
+        # Only format executed statements if they would be logged
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            self.conn.set_trace_callback(
+                lambda s: LOGGER.debug("Executing:\n%s", s)
+            )
 
     def __getattr__(self, name):
         """Retrieve missing attributes from the SQLite connection object"""
@@ -151,6 +243,10 @@ class Schema(AbstractSchema):
     # The I/O schema the database schema supports
     io = io.schema.V4_0
 
+    # The maximum number of IDs to include into queries directly, instead
+    # of loading them into a temporary table first
+    INLINE_IDS_MAX = 64
+
     # A map of table names and descriptions
     TABLES = dict(
         checkouts=Table({
@@ -210,6 +306,10 @@ class Schema(AbstractSchema):
         }),
     )
 
+    # A map of names of tables in TABLES, which are views instead, and
+    # definitions of the tables storing their data. None in this version.
+    STORAGE_TABLES = {}
+
     # Queries and their columns for each type of raw object-oriented data.
     # Both should have columns in the same order.
     # NOTE: Relying on dictionaries preserving order in Python 3.6+
@@ -536,6 +636,16 @@ class Schema(AbstractSchema):
         assert isinstance(objects_per_report, int)
         assert objects_per_report >= 0
 
+        # Stage the IDs of the objects to fetch in a temporary table, if
+        # there are too many of them, or their relatives are requested
+        staged = parents or children or any(
+            len(table_ids) > self.INLINE_IDS_MAX for table_ids in ids.values()
+        )
+        # Tell the staged IDs apart from those of other (interleaved) calls
+        if staged:
+            query_num = self.query_num
+            self.query_num += 1
+
         # Build a dictionary of object list (table) names and tuples
         # containing a SELECT statement and the list of its parameters,
         # returning IDs of the objects to fetch.
@@ -544,7 +654,13 @@ class Schema(AbstractSchema):
             if not obj_list_name:
                 continue
             table_ids = ids.get(obj_list_name, [])
-            if table_ids:
+            if staged:
+                obj_list_queries[obj_list_name] = [
+                    "SELECT id FROM query_ids "
+                    "WHERE query_num = ? AND obj_list = ?\n",
+                    [query_num, obj_list_name]
+                ]
+            elif table_ids:
                 obj_list_queries[obj_list_name] = [
                     "WITH ids(id) AS (VALUES " +
                     ", ".join(["(?)"] * len(table_ids)) +
@@ -557,105 +673,167 @@ class Schema(AbstractSchema):
                     []
                 ]
 
-        # Add referenced parents if requested
+        # Build a list of statements and their parameters, expanding the
+        # staged ID sets with referenced parents and/or children, one
+        # relation at a time, with each set complete before it's used
+        expansions = []
+        obj_list_names = sort_obj_list_names(self.io.graph)
         if parents:
-            def add_parents(obj_list_name):
-                """Add parent IDs to query results"""
+            for obj_list_name in reversed(obj_list_names):
                 obj_name = obj_list_name[:-1]
-                query = obj_list_queries[obj_list_name]
                 for child_list_name in self.io.graph[obj_list_name]:
-                    add_parents(child_list_name)
-                    child_query = obj_list_queries[child_list_name]
-                    query[0] += \
-                        f"UNION\n" \
-                        f"SELECT {child_list_name}.{obj_name}_id AS id " \
-                        f"FROM {child_list_name} " + \
-                        "INNER JOIN (\n" + \
-                        textwrap.indent(child_query[0], " " * 4) + \
-                        ") USING(id)\n"
-                    query[1] += child_query[1]
-
-            for obj_list_name in self.io.graph[""]:
-                add_parents(obj_list_name)
-
-        # Add referenced children if requested
+                    expansions.append((
+                        f"INSERT OR IGNORE INTO query_ids\n"
+                        f"SELECT ?, ?, {child_list_name}.{obj_name}_id\n"
+                        f"FROM {child_list_name} INNER JOIN query_ids ON "
+                        f"{child_list_name}.id = query_ids.id\n"
+                        f"WHERE query_ids.query_num = ? AND "
+                        f"query_ids.obj_list = ? AND "
+                        f"{child_list_name}.{obj_name}_id IS NOT NULL",
+                        [query_num, obj_list_name, query_num, child_list_name]
+                    ))
         if children:
-            def add_children(obj_list_name):
-                """Add child IDs to query results"""
+            for obj_list_name in obj_list_names:
                 obj_name = obj_list_name[:-1]
-                query = obj_list_queries[obj_list_name]
                 for child_list_name in self.io.graph[obj_list_name]:
-                    child_query = obj_list_queries[child_list_name]
-                    child_query[0] += \
-                        f"UNION\n" \
-                        f"SELECT {child_list_name}.id AS id " \
-                        f"FROM {child_list_name} " + \
-                        "INNER JOIN (\n" + \
-                        textwrap.indent(query[0], " " * 4) + \
-                        f") AS {obj_list_name} ON " \
-                        f"{child_list_name}.{obj_name}_id = " \
-                        f"{obj_list_name}.id\n"
-                    child_query[1] += query[1]
-                    add_children(child_list_name)
-
-            for obj_list_name in self.io.graph[""]:
-                add_children(obj_list_name)
+                    expansions.append((
+                        f"INSERT OR IGNORE INTO query_ids\n"
+                        f"SELECT ?, ?, {child_list_name}.id\n"
+                        f"FROM {child_list_name} INNER JOIN query_ids ON "
+                        f"{child_list_name}.{obj_name}_id = query_ids.id\n"
+                        f"WHERE query_ids.query_num = ? AND "
+                        f"query_ids.obj_list = ?",
+                        [query_num, child_list_name, query_num, obj_list_name]
+                    ))
 
         # Fetch the data
         obj_num = 0
         data = self.io.new()
-        with self.conn:
-            cursor = self.conn.cursor()
-            try:
-                for obj_list_name, query in obj_list_queries.items():
-                    table_schema = self.TABLES[obj_list_name]
-                    query_parameters = query[1]
-                    query_string = \
-                        f"SELECT {table_schema.columns_list}\n" \
-                        f" FROM {obj_list_name} INNER JOIN (\n" + \
-                        textwrap.indent(query[0], " " * 4) + \
-                        ") USING(id)\n"
-                    result = cursor.execute(query_string, query_parameters)
-                    obj_list = None
-                    for obj in table_schema.unpack_iter(result):
-                        if obj_list is None:
-                            obj_list = []
-                            data[obj_list_name] = obj_list
-                        obj_list.append(obj)
-                        obj_num += 1
-                        if objects_per_report and \
-                                obj_num >= objects_per_report:
-                            assert self.io.is_compatible_exactly(data)
-                            assert LIGHT_ASSERTS or \
-                                self.io.is_valid_exactly(data)
-                            yield data
-                            obj_num = 0
-                            data = self.io.new()
-                            obj_list = None
-            finally:
-                cursor.close()
+        try:
+            # Stage and expand the IDs, in a separate transaction, so that
+            # transactions of interleaved calls don't affect them
+            if staged:
+                with self.conn:
+                    cursor = self.conn.cursor()
+                    try:
+                        cursor.execute(
+                            "CREATE TEMPORARY TABLE IF NOT EXISTS "
+                            "query_ids(query_num INT, obj_list TEXT, "
+                            "id TEXT, PRIMARY KEY(query_num, obj_list, id))"
+                        )
+                        cursor.executemany(
+                            "INSERT OR IGNORE INTO query_ids "
+                            "VALUES (?, ?, ?)",
+                            (
+                                (query_num, obj_list_name, obj_id)
+                                for obj_list_name, table_ids in ids.items()
+                                for obj_id in table_ids
+                            )
+                        )
+                        for expansion in expansions:
+                            cursor.execute(*expansion)
+                    finally:
+                        cursor.close()
+            with self.conn:
+                cursor = self.conn.cursor()
+                try:
+                    for obj_list_name, query in obj_list_queries.items():
+                        table_schema = self.TABLES[obj_list_name]
+                        query_parameters = query[1]
+                        query_string = \
+                            f"SELECT {table_schema.columns_list}\n" \
+                            f" FROM {obj_list_name} INNER JOIN (\n" + \
+                            textwrap.indent(query[0], " " * 4) + \
+                            ") USING(id)\n"
+                        result = cursor.execute(query_string,
+                                                query_parameters)
+                        obj_list = None
+                        for obj in table_schema.unpack_iter(result):
+                            if obj_list is None:
+                                obj_list = []
+                                data[obj_list_name] = obj_list
+                            obj_list.append(obj)
+                            obj_num += 1
+                            if objects_per_report and \
+                                    obj_num >= objects_per_report:
+                                assert self.io.is_compatible_exactly(data)
+                                assert LIGHT_ASSERTS or \
+                                    self.io.is_valid_exactly(data)
+                                yield data
+                                obj_num = 0
+                                data = self.io.new()
+                                obj_list = None
+                finally:
+                    cursor.close()
+        finally:
+            # Remove the staged IDs
+            if staged:
+                with self.conn:
+                    cursor = self.conn.cursor()
+                    try:
+                        cursor.execute(
+                            "DELETE FROM query_ids WHERE query_num = ?",
+                            (query_num,)
+                        )
+                    finally:
+                        cursor.close()
 
         if obj_num:
             assert self.io.is_compatible_exactly(data)
             assert LIGHT_ASSERTS or self.io.is_valid_exactly(data)
             yield data
 
+    def __init__(self, conn):
+        """
+        Initialize the database schema.
+
+        Args:
+            conn:   The connection to the database.
+        """
+        super().__init__(conn)
+        # The cache of rendered OO queries
+        self.oo_query_cache = StatementCache()
+        # The number of the next query_iter() call staging IDs
+        self.query_num = 0
+
     @classmethod
-    def _oo_query_render(cls, pattern):
+    def _oo_query_render(cls, shape):
         """
-        Render a pattern for raw OO data into a query.
+        Render a pattern shape for raw OO data into a query.
 
         Args:
-            pattern:    The pattern (instance of kcidb.orm.query.Pattern) to
-                        render.
+            shape:  The shape of the pattern to render, as returned by
+                    kcidb.db.sql.cache.get_pattern_shape().
 
         Returns:
-            The SQL query string and the query parameters.
+            The SQL query string, expecting parameters returned by
+            kcidb.db.sql.cache.get_pattern_parameters() for a pattern of
+            the shape.
         """
-        assert isinstance(pattern, orm.query.Pattern)
-        obj_type = pattern.obj_type
+        # Calm down, pylint: disable=too-many-locals
+        assert isinstance(shape, tuple) and shape
+        (type_name, child, id_num), base_shape = shape[0], shape[1:]
+        obj_type = orm.data.SCHEMA.types[type_name]
         type_query_string = cls.OO_QUERIES[obj_type.name]["statement"]
-        if pattern.obj_id_set:
+        # Schemas of the columns, for converting IDs to lookup references
+        column_schemas = {
+            column.name: column.schema
+            for column in cls.OO_QUERIES[obj_type.name]["schema"].columns
+        }
+        if id_num == TABLE_IDS:
+            obj_id_fields = obj_type.id_fields
+            query_string = "SELECT obj.* FROM (\n" + \
+                textwrap.indent(type_query_string, " " * 4) + "\n" + \
+                ") AS obj INNER JOIN (\n" + \
+                "    SELECT " + \
+                ", ".join(
+                    column_schemas[obj_id_field].format_value(f"id_{i}") +
+                    f" AS {obj_id_field}"
+                    for i, obj_id_field in enumerate(obj_id_fields)
+                ) + \
+                " FROM oo_query_ids WHERE id_set = ?\n" + \
+                ") AS ids USING(" + ", ".join(obj_id_fields) + ")"
+        elif id_num > 0:
             obj_id_fields = obj_type.id_fields
             query_string = "SELECT obj.* FROM (\n" + \
                 textwrap.indent(type_query_string, " " * 4) + "\n" + \
@@ -664,28 +842,35 @@ class Schema(AbstractSchema):
                 ", ".join(obj_id_fields) + \
                 ") AS (VALUES " + \
                 ",\n".join(
-                    ["    (" + ", ".join("?" * len(obj_id_fields)) + ")"] *
-                    len(pattern.obj_id_set)
+                    [
+                        "    (" +
+                        ", ".join(
+                            column_schemas[obj_id_field].format_value("?")
+                            for obj_id_field in obj_id_fields
+                        ) +
+                        ")"
+                    ] *
+                    id_num
                 ) + \
                 ") SELECT * FROM ids\n" + \
                 ") AS ids USING(" + ", ".join(obj_id_fields) + ")"
-            query_parameters = [
-                obj_id_field
-                for obj_id in pattern.obj_id_set
-                for obj_id_field in obj_id
-            ]
         else:
             query_string = type_query_string
-            if pattern.obj_id_set is not None:
+            if id_num == 0:
                 # We cannot represent empty "VALUES"
                 query_string += " WHERE 0"
-            query_parameters = []
 
-        if pattern.base:
-            base_query_string, base_query_parameters = \
-                cls._oo_query_render(pattern.base)
-            base_obj_type = pattern.base.obj_type
-            if pattern.child:
+        if base_shape:
+            base_obj_type = orm.data.SCHEMA.types[base_shape[0][0]]
+            # Join directly to ancestors/descendants, if possible
+            shortcut = get_shape_shortcut(shape, {
+                name: query.get("ancestor_ids", {})
+                for name, query in cls.OO_QUERIES.items()
+            })
+            if shortcut:
+                base_index, column_pairs = shortcut
+                base_shape = shape[base_index:]
+            elif child:
                 column_pairs = zip(
                     base_obj_type.children[obj_type.name].ref_fields,
                     base_obj_type.id_fields
@@ -695,6 +880,15 @@ class Schema(AbstractSchema):
                     obj_type.id_fields,
                     obj_type.children[base_obj_type.name].ref_fields
                 )
+            base_query_string = cls._oo_query_render(base_shape)
+            if shortcut:
+                # Keep the (fewer) distinct base IDs apart, to be joined
+                # first, and to look the objects up by their ancestors
+                base_query_string = \
+                    "SELECT DISTINCT " + \
+                    ", ".join(b for o, b in column_pairs) + " FROM (\n" + \
+                    textwrap.indent(base_query_string, " " * 4) + "\n" + \
+                    ")"
 
             query_string = "SELECT obj.* FROM (\n" + \
                 textwrap.indent(query_string, " " * 4) + "\n" + \
@@ -704,70 +898,238 @@ class Schema(AbstractSchema):
                 " AND ".join(
                     [f"obj.{o} = base.{b}" for o, b in column_pairs]
                 )
-            query_parameters += base_query_parameters
 
-        return query_string, query_parameters
+        return query_string
+
+    @classmethod
+    def _oo_query_render_type(cls, obj_type, shapes, names):
+        """
+        Render a query for raw OO data of a type, matching patterns of
+        specified shapes.
+
+        Args:
+            obj_type:   The type of the objects to query
+                        (kcidb.orm.data.Type).
+            shapes:     A tuple of shapes of patterns to render, as returned
+                        by kcidb.db.sql.cache.get_pattern_shape().
+            names:      A tuple of names of the columns to retrieve, or None
+                        to retrieve all columns.
+
+        Returns:
+            The SQL query string, expecting concatenated parameters returned
+            by kcidb.db.sql.cache.get_pattern_parameters() for patterns of
+            the shapes, in the same order.
+        """
+        schema = cls.OO_QUERIES[obj_type.name]["schema"]
+        # Resolve lookup references only for the retrieved objects
+        return "SELECT\n" + \
+            schema.format_resolved_columns("obj", names) + \
+            "\nFROM (\n" + \
+            textwrap.indent(
+                cls.OO_QUERIES[obj_type.name]["statement"],
+                "    "
+            ) + "\n" + \
+            ") AS obj INNER JOIN (\n" + \
+            "    SELECT DISTINCT " + \
+            ", ".join(obj_type.id_fields) + \
+            " FROM (\n" + \
+            textwrap.indent(
+                "\nUNION ALL\n".join(map(cls._oo_query_render, shapes)),
+                " " * 8
+            ) + "\n" + \
+            "    )\n" + \
+            ") AS ids USING(" + ", ".join(obj_type.id_fields) + ")" + \
+            schema.format_resolving_joins("obj", names)
 
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Query raw object-oriented data from the database.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             objects of the corresponding type.
         """
+        # Calm down, pylint: disable=too-many-locals
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, orm.query.Pattern) for r in pattern_set)
+        assert orm.data.SCHEMA.is_valid_projection(projection)
+
+        # Sort patterns of each type by their shapes
+        obj_type_shaped_patterns = {}
+        for pattern in pattern_set:
+            obj_type_shaped_patterns.setdefault(pattern.obj_type, []).append(
+                (get_pattern_shape(pattern, self.INLINE_IDS_MAX), pattern)
+            )
 
-        # Render all queries for each type
+        # Render all queries for each type, collecting large ID sets
         obj_type_queries = {}
+        id_rows = []
         for obj_type in orm.data.SCHEMA.types.values():
-            for pattern in pattern_set:
-                # TODO: Avoid adding the same patterns multiple times
-                if pattern.obj_type == obj_type:
-                    if obj_type not in obj_type_queries:
-                        obj_type_queries[obj_type] = []
-                    obj_type_queries[obj_type]. \
-                        append(self._oo_query_render(pattern))
+            if obj_type not in obj_type_shaped_patterns:
+                continue
+            shaped_patterns = sorted(
+                obj_type_shaped_patterns[obj_type],
+                key=lambda shaped_pattern: shaped_pattern[0]
+            )
+            shapes = tuple(shape for shape, _ in shaped_patterns)
+            names = get_projection_names(
+                self.OO_QUERIES[obj_type.name]["schema"], obj_type, projection
+            )
+            obj_type_queries[obj_type] = (
+                self.oo_query_cache.get(
+                    (obj_type.name, shapes, names),
+                    self._oo_query_render_type, obj_type, shapes, names
+                ),
+                [
+                    parameter
+                    for _, pattern in shaped_patterns
+                    for parameter in get_pattern_parameters(
+                        pattern, self.INLINE_IDS_MAX, id_rows
+                    )
+                ],
+                names
+            )
 
         # Execute all the queries
         with self.conn:
             cursor = self.conn.cursor()
             try:
+                # Load large ID sets into a temporary table
+                if id_rows:
+                    cursor.execute(
+                        "CREATE TEMPORARY TABLE IF NOT EXISTS " +
+                        "oo_query_ids(id_set INT, " +
+                        ", ".join(
+                            f"id_{i} TEXT" for i in range(ID_FIELD_NUM)
+                        ) + ")"
+                    )
+                    cursor.execute("DELETE FROM oo_query_ids")
+                    cursor.executemany(
+                        "INSERT INTO oo_query_ids VALUES (" +
+                        ", ".join("?" * (ID_FIELD_NUM + 1)) + ")",
+                        id_rows
+                    )
                 objs = {}
-                for obj_type, queries in obj_type_queries.items():
-                    query_string = "SELECT obj.* FROM (\n" + \
-                        textwrap.indent(
-                            self.OO_QUERIES[obj_type.name]["statement"],
-                            "    "
-                        ) + "\n" + \
-                        ") AS obj INNER JOIN (\n" + \
-                        "    SELECT DISTINCT " + \
-                        ", ".join(obj_type.id_fields) + \
-                        " FROM (\n" + \
-                        textwrap.indent(
-                            "\nUNION ALL\n".join(q[0] for q in queries),
-                            " " * 8
-                        ) + "\n" + \
-                        "    )\n" + \
-                        ") AS ids USING(" + ", ".join(obj_type.id_fields) + ")"
-                    query_parameters = reduce(lambda x, y: x + y,
-                                              (q[1] for q in queries))
+                for obj_type, (query_string, query_parameters, names) in \
+                        obj_type_queries.items():
                     objs[obj_type.name] = list(
                         self.OO_QUERIES[obj_type.name]["schema"].unpack_iter(
                             cursor.execute(query_string, query_parameters),
-                            drop_null=False
+                            drop_null=False, lazy=lazy, names=names
                         )
                     )
+                if id_rows:
+                    cursor.execute("DELETE FROM oo_query_ids")
             finally:
                 cursor.close()
 
-        assert LIGHT_ASSERTS or orm.data.SCHEMA.is_valid(objs)
+        LOGGER.debug("OO query cache: %r", self.oo_query_cache)
+        assert LIGHT_ASSERTS or orm.data.SCHEMA.is_valid(objs, projection)
         return objs
 
+    def _prepare_rows(self, cursor, table_name, rows):
+        """
+        Prepare packed rows for loading into a table with the "INSERT"
+        command, e.g. replace values with lookup references. Does nothing
+        by default.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES the rows are
+                        packed for (by its storage table, if any).
+            rows:       The list of packed rows (lists) to prepare.
+        """
+
+    def _prepare_staged(self, cursor, table_name, staging_name):
+        """
+        Prepare rows in a staging table for merging into a table, e.g. add
+        missing values to lookup tables. Does nothing by default.
+
+        Args:
+            cursor:         The cursor to use for accessing the database.
+            table_name:     The name of the table in TABLES the staging
+                            table is created for (by its storage table,
+                            if any).
+            staging_name:   The name of the staging table.
+        """
+
+    def _after_merge(self, cursor, table_name, keys):
+        """
+        Update the database after objects were loaded into a table, e.g.
+        the data derived from them. Does nothing by default.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES the objects were
+                        loaded into.
+            keys:       A list of the loaded objects' IDs, as stored in
+                        the table (or its storage table, if any).
+        """
+
+    def _load_table(self, cursor, table_name, obj_list):
+        """
+        Load objects into a table (or its storage table, if any), as a part
+        of the load() transaction.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES to load into.
+            obj_list:   The list of the objects to load.
+        """
+        # Load into the storage table, if the table is a view
+        if table_name in self.STORAGE_TABLES:
+            table_schema = self.STORAGE_TABLES[table_name]
+            target_name = "_" + table_name
+        else:
+            table_schema = self.TABLES[table_name]
+            target_name = table_name
+        id_column = table_schema.get_columns(("id",))[0]
+        if self.conn.load_stage:
+            staging_name = table_name + "_staging"
+            cursor.execute(f"DROP TABLE IF EXISTS temp.{staging_name}")
+            cursor.execute(table_schema.format_create_staging(staging_name))
+            cursor.executemany(
+                table_schema.format_insert_staging(staging_name),
+                table_schema.pack_iter(obj_list)
+            )
+            self._prepare_staged(cursor, table_name, staging_name)
+            cursor.execute(
+                table_schema.format_merge(
+                    target_name, staging_name, self.conn.load_prio_db
+                )
+            )
+            cursor.execute(
+                "SELECT DISTINCT " +
+                id_column.schema.format_value(f"{staging_name}.id") +
+                f" FROM {staging_name}"
+            )
+            keys = [key for key, in cursor.fetchall()]
+            cursor.execute(f"DROP TABLE temp.{staging_name}")
+        else:
+            rows = list(table_schema.pack_iter(obj_list))
+            self._prepare_rows(cursor, table_name, rows)
+            cursor.executemany(
+                table_schema.format_insert(
+                    target_name, self.conn.load_prio_db
+                ),
+                rows
+            )
+            id_index = table_schema.columns.index(id_column)
+            keys = list({row[id_index] for row in rows})
+        self._after_merge(cursor, table_name, keys)
+
     def load(self, data):
         """
         Load data into the database.
@@ -781,14 +1143,9 @@ class Schema(AbstractSchema):
         with self.conn:
             cursor = self.conn.cursor()
             try:
-                for table_name, table_schema in self.TABLES.items():
+                for table_name in self.TABLES:
                     if table_name in data:
-                        cursor.executemany(
-                            table_schema.format_insert(
-                                table_name, self.conn.load_prio_db
-                            ),
-                            table_schema.pack_iter(data[table_name])
-                        )
+                        self._load_table(cursor, table_name, data[table_name])
             finally:
                 cursor.close()
         # Flip priority for the next load to maintain (rough)
@@ -0,0 +1,497 @@
+"""Kernel CI report database - SQLite schema v4.4"""
+
+import json
+import logging
+import kcidb.io as io
+from kcidb.misc import merge_dicts
+from kcidb.db.sql.schema import Index
+from kcidb.db.sqlite.schema import \
+    Constraint, Column, BoolColumn, IntegerColumn, TextColumn, JSONColumn, \
+    CompressedTextColumn, CompressedJSONColumn, LookupColumn, \
+    TimestampColumn, Table
+from .v04_03 import Schema as PreviousSchema
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+
+class Schema(PreviousSchema):
+    """SQLite database schema v4.4"""
+
+    # The schema's version.
+    version = (4, 4)
+    # The I/O schema the database schema supports
+    io = io.schema.V4_1
+
+    # A map of names of tables in TABLES, which are views instead, and
+    # definitions of the tables storing their data. Each storage table is
+    # named after its view, with an underscore prepended. IDs of checkouts
+    # and builds are stored in lookup tables, and their integer keys are
+    # used for referencing the objects and joining the tables. Tests are only
+    # referenced by incidents, and keep their textual IDs, to avoid storing
+    # each of them twice.
+    STORAGE_TABLES = dict(
+        checkouts=Table({
+            "id": LookupColumn("_checkout_ids",
+                               constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "tree_name": TextColumn(),
+            "git_repository_url": TextColumn(),
+            "git_commit_hash": TextColumn(),
+            "git_commit_name": TextColumn(),
+            "git_repository_branch": TextColumn(),
+            "patchset_files": CompressedJSONColumn(),
+            "patchset_hash": TextColumn(),
+            "message_id": TextColumn(),
+            "comment": TextColumn(),
+            "start_time": TimestampColumn(),
+            "contacts": JSONColumn(),
+            "log_url": TextColumn(),
+            "log_excerpt": CompressedTextColumn(),
+            "valid": BoolColumn(),
+            "misc": CompressedJSONColumn(),
+        }),
+        builds=Table({
+            "checkout_id": LookupColumn("_checkout_ids",
+                                        constraint=Constraint.NOT_NULL),
+            "id": LookupColumn("_build_ids",
+                               constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "comment": TextColumn(),
+            "start_time": TimestampColumn(),
+            "duration": Column("REAL"),
+            "architecture": TextColumn(),
+            "command": TextColumn(),
+            "compiler": TextColumn(),
+            "input_files": CompressedJSONColumn(),
+            "output_files": CompressedJSONColumn(),
+            "config_name": TextColumn(),
+            "config_url": TextColumn(),
+            "log_url": TextColumn(),
+            "log_excerpt": CompressedTextColumn(),
+            "valid": BoolColumn(),
+            "misc": CompressedJSONColumn(),
+        }),
+        tests=Table({
+            "build_id": LookupColumn("_build_ids",
+                                     constraint=Constraint.NOT_NULL),
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "environment.comment": TextColumn(),
+            "environment.misc": CompressedJSONColumn(),
+            "path": TextColumn(),
+            "comment": TextColumn(),
+            "log_url": TextColumn(),
+            "log_excerpt": CompressedTextColumn(),
+            "status": TextColumn(),
+            "waived": BoolColumn(),
+            "start_time": TimestampColumn(),
+            "duration": Column("REAL"),
+            "output_files": CompressedJSONColumn(),
+            "misc": CompressedJSONColumn()
+        }),
+        incidents=Table({
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "origin": TextColumn(constraint=Constraint.NOT_NULL),
+            "issue_id": TextColumn(constraint=Constraint.NOT_NULL),
+            "issue_version": IntegerColumn(constraint=Constraint.NOT_NULL),
+            "build_id": LookupColumn("_build_ids"),
+            "test_id": TextColumn(),
+            "present": BoolColumn(),
+            "comment": TextColumn(),
+            "misc": CompressedJSONColumn(),
+        }),
+    )
+
+    # A map of lookup table names and definitions of (one of) the columns
+    # referencing them
+    LOOKUPS = {
+        column.schema.lookup: column.schema
+        for table_schema in STORAGE_TABLES.values()
+        for column in table_schema.lookup_columns
+    }
+
+    # A map of index names and descriptions
+    INDEXES = dict(
+        checkouts_revision=Index(
+            "_checkouts", ["git_commit_hash", "patchset_hash"]
+        ),
+        builds_checkout_id=Index("_builds", ["checkout_id"]),
+        tests_build_id=Index("_tests", ["build_id"]),
+        incidents_issue_id=Index("_incidents", ["issue_id"]),
+        incidents_build_id=Index("_incidents", ["build_id"]),
+        incidents_test_id=Index("_incidents", ["test_id"]),
+    )
+
+    # Queries and their columns for each type of raw object-oriented data.
+    # Both should have columns in the same order.
+    # The queries read the storage tables directly, returning lookup
+    # references to be resolved for the retrieved objects only, and letting
+    # the objects be joined using the integer keys.
+    # NOTE: Relying on dictionaries preserving order in Python 3.6+
+    OO_QUERIES = merge_dicts(
+        PreviousSchema.OO_QUERIES,
+        revision=merge_dicts(
+            PreviousSchema.OO_QUERIES["revision"],
+            statement="SELECT\n"
+                      "    git_commit_hash,\n"
+                      "    patchset_hash,\n"
+                      "    patchset_files,\n"
+                      "    git_commit_name,\n"
+                      "    contacts\n"
+                      "FROM _checkouts\n"
+                      "GROUP BY git_commit_hash, patchset_hash",
+        ),
+        checkout=dict(
+            statement="SELECT\n"
+                      "    id,\n"
+                      "    git_commit_hash,\n"
+                      "    patchset_hash,\n"
+                      "    origin,\n"
+                      "    git_repository_url,\n"
+                      "    git_repository_branch,\n"
+                      "    tree_name,\n"
+                      "    message_id,\n"
+                      "    start_time,\n"
+                      "    log_url,\n"
+                      "    log_excerpt,\n"
+                      "    comment,\n"
+                      "    valid,\n"
+                      "    misc\n"
+                      "FROM _checkouts",
+            schema=Table(dict(
+                id=LookupColumn("_checkout_ids"),
+                git_commit_hash=TextColumn(),
+                patchset_hash=TextColumn(),
+                origin=TextColumn(),
+                git_repository_url=TextColumn(),
+                git_repository_branch=TextColumn(),
+                tree_name=TextColumn(),
+                message_id=TextColumn(),
+                start_time=TimestampColumn(),
+                log_url=TextColumn(),
+                log_excerpt=CompressedTextColumn(),
+                comment=TextColumn(),
+                valid=BoolColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+        build=dict(
+            statement="SELECT\n"
+                      "    id,\n"
+                      "    checkout_id,\n"
+                      "    origin,\n"
+                      "    start_time,\n"
+                      "    duration,\n"
+                      "    architecture,\n"
+                      "    command,\n"
+                      "    compiler,\n"
+                      "    input_files,\n"
+                      "    output_files,\n"
+                      "    config_name,\n"
+                      "    config_url,\n"
+                      "    log_url,\n"
+                      "    log_excerpt,\n"
+                      "    comment,\n"
+                      "    valid,\n"
+                      "    misc\n"
+                      "FROM _builds",
+            schema=Table(dict(
+                id=LookupColumn("_build_ids"),
+                checkout_id=LookupColumn("_checkout_ids"),
+                origin=TextColumn(),
+                start_time=TimestampColumn(),
+                duration=Column("REAL"),
+                architecture=TextColumn(),
+                command=TextColumn(),
+                compiler=TextColumn(),
+                input_files=CompressedJSONColumn(),
+                output_files=CompressedJSONColumn(),
+                config_name=TextColumn(),
+                config_url=TextColumn(),
+                log_url=TextColumn(),
+                log_excerpt=CompressedTextColumn(),
+                comment=TextColumn(),
+                valid=BoolColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+        test=dict(
+            statement="SELECT\n"
+                      "    id,\n"
+                      "    build_id,\n"
+                      "    origin,\n"
+                      "    path,\n"
+                      "    \"environment.comment\" AS environment_comment,\n"
+                      "    \"environment.misc\" AS environment_misc,\n"
+                      "    log_url,\n"
+                      "    log_excerpt,\n"
+                      "    status,\n"
+                      "    waived,\n"
+                      "    start_time,\n"
+                      "    duration,\n"
+                      "    output_files,\n"
+                      "    comment,\n"
+                      "    misc\n"
+                      "FROM _tests",
+            schema=Table(dict(
+                id=TextColumn(),
+                build_id=LookupColumn("_build_ids"),
+                origin=TextColumn(),
+                path=TextColumn(),
+                environment_comment=TextColumn(),
+                environment_misc=CompressedJSONColumn(),
+                log_url=TextColumn(),
+                log_excerpt=CompressedTextColumn(),
+                status=TextColumn(),
+                waived=BoolColumn(),
+                start_time=TimestampColumn(),
+                duration=Column("REAL"),
+                output_files=CompressedJSONColumn(),
+                comment=TextColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+        incident=dict(
+            statement="SELECT\n"
+                      "    id,\n"
+                      "    origin,\n"
+                      "    issue_id,\n"
+                      "    issue_version,\n"
+                      "    build_id,\n"
+                      "    test_id,\n"
+                      "    comment,\n"
+                      "    misc\n"
+                      "FROM (\n"
+                      "    SELECT\n"
+                      "        id,\n"
+                      "        origin,\n"
+                      "        issue_id,\n"
+                      "        issue_version,\n"
+                      "        build_id,\n"
+                      "        test_id,\n"
+                      "        present,\n"
+                      "        comment,\n"
+                      "        misc,\n"
+                      "        DENSE_RANK() OVER (\n"
+                      "            PARTITION BY\n"
+                      "                issue_id, build_id, test_id\n"
+                      "            ORDER BY issue_version DESC\n"
+                      "        ) AS precedence\n"
+                      "    FROM _incidents\n"
+                      ")\n"
+                      "WHERE precedence = 1 AND present",
+            schema=Table(dict(
+                id=TextColumn(),
+                origin=TextColumn(),
+                issue_id=TextColumn(),
+                issue_version=IntegerColumn(),
+                build_id=LookupColumn("_build_ids"),
+                test_id=TextColumn(),
+                comment=TextColumn(),
+                misc=CompressedJSONColumn(),
+            )),
+        ),
+    )
+
+    @classmethod
+    def _format_create_view(cls, table_name):
+        """
+        Format the "CREATE" command for a view presenting a storage table as
+        a table in TABLES, with the columns of the latter.
+
+        Args:
+            table_name: The name of the table in TABLES to create the view
+                        for.
+
+        Returns:
+            The formatted "CREATE" command.
+        """
+        assert table_name in cls.STORAGE_TABLES
+        return f"CREATE VIEW IF NOT EXISTS {table_name} AS\n" + \
+            cls.STORAGE_TABLES[table_name].format_select_resolved(
+                "_" + table_name,
+                [column.name for column in cls.TABLES[table_name].columns]
+            )
+
+    @classmethod
+    def _inherit(cls, conn):
+        """
+        Inerit the database data from the previous schema version (if any).
+
+        Args:
+            conn:   Connection to the database to inherit. The database must
+                    comply with the previous version of the schema.
+        """
+        assert isinstance(conn, cls.Connection)
+        # Move the data into the storage tables, replacing the tables with
+        # views
+        with conn:
+            cursor = conn.cursor()
+            try:
+                for lookup_column in cls.LOOKUPS.values():
+                    cursor.execute(lookup_column.format_create_lookup())
+                for table_name, storage_schema in cls.STORAGE_TABLES.items():
+                    storage_name = "_" + table_name
+                    for column in storage_schema.lookup_columns:
+                        cursor.execute(column.schema.format_insert_lookup(
+                            f"SELECT DISTINCT {column.name} "
+                            f"FROM {table_name} "
+                            f"WHERE {column.name} IS NOT NULL"
+                        ))
+                    cursor.execute(storage_schema.format_create(storage_name))
+                    cursor.execute(storage_schema.format_insert_select(
+                        storage_name, table_name
+                    ))
+                    cursor.execute(f"DROP TABLE {table_name}")
+                    cursor.execute(cls._format_create_view(table_name))
+            finally:
+                cursor.close()
+        cls._create_indexes(conn)
+        # Return the space freed by replacing IDs to the filesystem
+        cursor = conn.cursor()
+        try:
+            cursor.execute("VACUUM")
+        finally:
+            cursor.close()
+
+    def init(self):
+        """
+        Initialize the database. The database must be empty uninitialized.
+        """
+        with self.conn:
+            cursor = self.conn.cursor()
+            try:
+                for lookup_column in self.LOOKUPS.values():
+                    cursor.execute(lookup_column.format_create_lookup())
+                for table_name, table_schema in self.TABLES.items():
+                    try:
+                        if table_name in self.STORAGE_TABLES:
+                            cursor.execute(
+                                self.STORAGE_TABLES[table_name].
+                                format_create("_" + table_name)
+                            )
+                            cursor.execute(
+                                self._format_create_view(table_name)
+                            )
+                        else:
+                            cursor.execute(
+                                table_schema.format_create(table_name)
+                            )
+                    except Exception as exc:
+                        raise Exception(
+                            f"Failed creating table {table_name!r}"
+                        ) from exc
+            finally:
+                cursor.close()
+        self._create_indexes(self.conn)
+
+    def cleanup(self):
+        """
+        Cleanup (deinitialize) the database, removing all data.
+        The database must be initialized.
+        """
+        with self.conn:
+            cursor = self.conn.cursor()
+            try:
+                for name in self.TABLES:
+                    if name in self.STORAGE_TABLES:
+                        cursor.execute(f"DROP VIEW IF EXISTS {name}")
+                        cursor.execute(f"DROP TABLE IF EXISTS _{name}")
+                    else:
+                        cursor.execute(f"DROP TABLE IF EXISTS {name}")
+                for lookup in self.LOOKUPS:
+                    cursor.execute(f"DROP TABLE IF EXISTS {lookup}")
+            finally:
+                cursor.close()
+
+    def empty(self):
+        """
+        Empty the database, removing all data.
+        The database must be initialized.
+        """
+        with self.conn:
+            cursor = self.conn.cursor()
+            try:
+                for name, schema in self.TABLES.items():
+                    if name in self.STORAGE_TABLES:
+                        cursor.execute(
+                            self.STORAGE_TABLES[name].format_delete("_" + name)
+                        )
+                    else:
+                        cursor.execute(schema.format_delete(name))
+                for lookup in self.LOOKUPS:
+                    cursor.execute(f"DELETE FROM {lookup}")
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def _store_lookups(cursor, table_schema, rows):
+        """
+        Add values of the lookup columns missing from their lookup tables,
+        and replace the values in packed rows with references.
+
+        Args:
+            cursor:         The cursor to use for accessing the lookup
+                            tables.
+            table_schema:   The schema of the table the rows are packed for.
+            rows:           The list of packed rows (lists) to replace the
+                            values in.
+        """
+        for index, column in enumerate(table_schema.columns):
+            if column not in table_schema.lookup_columns:
+                continue
+            # Pass the values as a JSON array to avoid a query per value
+            values = json.dumps(list({row[index] for row in rows} - {None}))
+            cursor.execute(
+                column.schema.format_insert_lookup(
+                    "SELECT value FROM json_each(?)"
+                ),
+                (values,)
+            )
+            cursor.execute(
+                f"SELECT value, id FROM {column.schema.lookup} "
+                "WHERE value IN (SELECT value FROM json_each(?))",
+                (values,)
+            )
+            ids = dict(cursor.fetchall())
+            ids[None] = None
+            for row in rows:
+                row[index] = ids[row[index]]
+
+    def _prepare_rows(self, cursor, table_name, rows):
+        """
+        Prepare packed rows for loading into a table with the "INSERT"
+        command: add missing values to lookup tables, and replace them with
+        references.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES the rows are
+                        packed for (by its storage table, if any).
+            rows:       The list of packed rows (lists) to prepare.
+        """
+        super()._prepare_rows(cursor, table_name, rows)
+        if table_name in self.STORAGE_TABLES:
+            self._store_lookups(cursor, self.STORAGE_TABLES[table_name], rows)
+
+    def _prepare_staged(self, cursor, table_name, staging_name):
+        """
+        Prepare rows in a staging table for merging into a table: add
+        missing values to lookup tables.
+
+        Args:
+            cursor:         The cursor to use for accessing the database.
+            table_name:     The name of the table in TABLES the staging
+                            table is created for (by its storage table,
+                            if any).
+            staging_name:   The name of the staging table.
+        """
+        super()._prepare_staged(cursor, table_name, staging_name)
+        if table_name not in self.STORAGE_TABLES:
+            return
+        for column in self.STORAGE_TABLES[table_name].lookup_columns:
+            cursor.execute(column.schema.format_insert_lookup(
+                f"SELECT DISTINCT {column.name} FROM {staging_name} "
+                f"WHERE {column.name} IS NOT NULL"
+            ))
@@ -0,0 +1,369 @@
+"""Kernel CI report database - SQLite schema v4.6"""
+
+import json
+import logging
+import kcidb.io as io
+from kcidb.misc import merge_dicts
+from kcidb.db.sql.schema import Index
+from kcidb.db.sqlite.schema import \
+    Constraint, IntegerColumn, TextColumn, LookupColumn, Table
+from .v04_05 import Schema as PreviousSchema
+
+# Module's logger
+LOGGER = logging.getLogger(__name__)
+
+
+# It's OK, pylint: disable=too-many-ancestors
+class Schema(PreviousSchema):
+    """SQLite database schema v4.6"""
+
+    # The schema's version.
+    version = (4, 6)
+    # The I/O schema the database schema supports
+    io = io.schema.V4_1
+
+    # A map of names of tables in TABLES with versioned objects, and
+    # definitions of the tables storing the keys of their latest versions,
+    # each named after its table, with an underscore prepended, and
+    # "_latest" appended. For incidents those are the present ones, of the
+    # latest issue version, for each issue, build, and test, which are
+    # stored as well, to find the incidents to replace.
+    LATEST_TABLES = dict(
+        issues=Table({
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "version": IntegerColumn(constraint=Constraint.NOT_NULL),
+        }),
+        incidents=Table({
+            "id": TextColumn(constraint=Constraint.PRIMARY_KEY),
+            "issue_id": TextColumn(constraint=Constraint.NOT_NULL),
+            "build_id": LookupColumn("_build_ids"),
+            "test_id": TextColumn(),
+        }),
+    )
+
+    # A map of index names and descriptions
+    INDEXES = {
+        name: index
+        for name, index in merge_dicts(
+            PreviousSchema.INDEXES,
+            # Match the latest incident partitioning
+            incidents_partition=Index(
+                "_incidents",
+                ["issue_id", "build_id", "test_id", "issue_version"]
+            ),
+            incidents_latest_partition=Index(
+                "_incidents_latest", ["issue_id", "build_id", "test_id"]
+            ),
+        ).items()
+        # Covered by the partitioning index
+        if name != "incidents_issue_id"
+    }
+
+    # Queries and their columns for each type of raw object-oriented data.
+    # Both should have columns in the same order.
+    # The queries of versioned objects read the latest versions from the
+    # tables maintained on loading, instead of ranking all of them.
+    # NOTE: Relying on dictionaries preserving order in Python 3.6+
+    OO_QUERIES = merge_dicts(
+        PreviousSchema.OO_QUERIES,
+        bug=merge_dicts(
+            PreviousSchema.OO_QUERIES["bug"],
+            statement="SELECT\n"
+                      "    report_url AS url,\n"
+                      "    report_subject AS subject,\n"
+                      "    MAX(\"culprit.code\") AS culprit_code,\n"
+                      "    MAX(\"culprit.tool\") AS culprit_tool,\n"
+                      "    MAX(\"culprit.harness\") AS culprit_harness\n"
+                      "FROM _issues_latest\n"
+                      "INNER JOIN issues USING (id, version)\n"
+                      "GROUP BY report_url",
+        ),
+        issue=merge_dicts(
+            PreviousSchema.OO_QUERIES["issue"],
+            statement="SELECT\n"
+                      "    id,\n"
+                      "    version,\n"
+                      "    origin,\n"
+                      "    report_url,\n"
+                      "    report_subject,\n"
+                      "    \"culprit.code\" AS culprit_code,\n"
+                      "    \"culprit.tool\" AS culprit_tool,\n"
+                      "    \"culprit.harness\" AS culprit_harness,\n"
+                      "    build_valid,\n"
+                      "    test_status,\n"
+                      "    comment,\n"
+                      "    misc\n"
+                      "FROM _issues_latest\n"
+                      "INNER JOIN issues USING (id, version)",
+        ),
+        incident=merge_dicts(
+            PreviousSchema.OO_QUERIES["incident"],
+            statement="SELECT\n"
+                      "    id,\n"
+                      "    origin,\n"
+                      "    _incidents.issue_id,\n"
+                      "    issue_version,\n"
+                      "    _incidents.build_id,\n"
+                      "    _incidents.test_id,\n"
+                      "    comment,\n"
+                      "    misc\n"
+                      "FROM _incidents_latest\n"
+                      "INNER JOIN _incidents USING (id)",
+        ),
+    )
+
+    @staticmethod
+    def _format_insert_latest_incidents(source):
+        """
+        Format the "INSERT" command adding the present incidents of the
+        latest issue version, for each issue, build, and test, out of the
+        specified incidents, to the table of the latest incidents.
+
+        Args:
+            source: The name of the table (or CTE) with the incidents to
+                    select from, with storage table columns.
+
+        Returns:
+            The formatted "INSERT" command.
+        """
+        return "INSERT INTO _incidents_latest " \
+            "(id, issue_id, build_id, test_id)\n" \
+            "SELECT id, issue_id, build_id, test_id\n" \
+            "FROM (\n" \
+            "    SELECT\n" \
+            "        id,\n" \
+            "        issue_id,\n" \
+            "        build_id,\n" \
+            "        test_id,\n" \
+            "        present,\n" \
+            "        DENSE_RANK() OVER (\n" \
+            "            PARTITION BY\n" \
+            "                issue_id, build_id, test_id\n" \
+            "            ORDER BY issue_version DESC\n" \
+            "        ) AS precedence\n" \
+            f"    FROM {source}\n" \
+            ")\n" \
+            "WHERE precedence = 1 AND present"
+
+    @classmethod
+    def _create_latest_tables(cls, conn):
+        """
+        Create the (empty) tables of the latest versions of objects.
+
+        Args:
+            conn:   Connection to the database to create the tables in.
+        """
+        assert isinstance(conn, cls.Connection)
+        with conn:
+            cursor = conn.cursor()
+            try:
+                for table_name, table_schema in cls.LATEST_TABLES.items():
+                    cursor.execute(
+                        table_schema.format_create(f"_{table_name}_latest")
+                    )
+            finally:
+                cursor.close()
+
+    @classmethod
+    def _inherit(cls, conn):
+        """
+        Inerit the database data from the previous schema version (if any).
+
+        Args:
+            conn:   Connection to the database to inherit. The database must
+                    comply with the previous version of the schema.
+        """
+        assert isinstance(conn, cls.Connection)
+        cls._create_latest_tables(conn)
+        with conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "INSERT INTO _issues_latest (id, version)\n"
+                    "SELECT id, MAX(version) FROM issues GROUP BY id"
+                )
+                cursor.execute(
+                    cls._format_insert_latest_incidents("_incidents")
+                )
+                for index_name in PreviousSchema.INDEXES:
+                    if index_name not in cls.INDEXES:
+                        cursor.execute(f"DROP INDEX {index_name}")
+            finally:
+                cursor.close()
+        cls._create_indexes(conn)
+
+    def init(self):
+        """
+        Initialize the database. The database must be empty uninitialized.
+        """
+        # Create the latest tables before the indexes on them
+        self._create_latest_tables(self.conn)
+        super().init()
+
+    def cleanup(self):
+        """
+        Cleanup (deinitialize) the database, removing all data.
+        The database must be initialized.
+        """
+        with self.conn:
+            cursor = self.conn.cursor()
+            try:
+                for table_name in self.LATEST_TABLES:
+                    cursor.execute(
+                        f"DROP TABLE IF EXISTS _{table_name}_latest"
+                    )
+            finally:
+                cursor.close()
+        super().cleanup()
+
+    def empty(self):
+        """
+        Empty the database, removing all data.
+        The database must be initialized.
+        """
+        super().empty()
+        with self.conn:
+            cursor = self.conn.cursor()
+            try:
+                for table_name, table_schema in self.LATEST_TABLES.items():
+                    cursor.execute(
+                        table_schema.format_delete(f"_{table_name}_latest")
+                    )
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def _get_incident_partitions(cursor, ids):
+        """
+        Get the partitions the latest incidents are selected from, and the
+        issue versions, for the stored incidents with specified IDs.
+
+        Args:
+            cursor: The cursor to use for accessing the incidents.
+            ids:    A list of the incident IDs.
+
+        Returns:
+            A dictionary of incident IDs and tuples containing the issue ID,
+            the build key, and the test ID of the partition, followed by the
+            issue version.
+        """
+        cursor.execute(
+            "SELECT id, issue_id, build_id, test_id, issue_version\n"
+            "FROM _incidents\n"
+            "WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps(ids),)
+        )
+        return {incident_id: tuple(partition_version)
+                for incident_id, *partition_version in cursor}
+
+    def _refresh_latest_incidents(self, cursor, min_versions):
+        """
+        Replace the latest incidents in specified partitions.
+
+        Args:
+            cursor:         The cursor to use for updating the incidents.
+            min_versions:   A dictionary of tuples containing the issue ID,
+                            the build key, and the test ID of partitions,
+                            and the minimum issue versions of the latest
+                            incidents in them.
+        """
+        partitions = \
+            "WITH partitions AS (\n" \
+            "    SELECT\n" \
+            "        json_extract(value, '$[0]') AS issue_id,\n" \
+            "        json_extract(value, '$[1]') AS build_id,\n" \
+            "        json_extract(value, '$[2]') AS test_id,\n" \
+            "        json_extract(value, '$[3]') AS min_version\n" \
+            "    FROM json_each(?)\n" \
+            ")"
+        parameters = (json.dumps([
+            [*partition, min_version]
+            for partition, min_version in min_versions.items()
+        ]),)
+        cursor.execute(
+            partitions + "\n"
+            "DELETE FROM _incidents_latest\n"
+            "WHERE id IN (\n"
+            "    SELECT _incidents_latest.id\n"
+            "    FROM partitions\n"
+            "    INNER JOIN _incidents_latest ON\n"
+            "        _incidents_latest.issue_id = partitions.issue_id AND\n"
+            "        _incidents_latest.build_id IS partitions.build_id AND\n"
+            "        _incidents_latest.test_id IS partitions.test_id\n"
+            ")",
+            parameters
+        )
+        cursor.execute(
+            partitions + ", partition_incidents AS (\n"
+            "    SELECT _incidents.*\n"
+            "    FROM partitions\n"
+            "    INNER JOIN _incidents ON\n"
+            "        _incidents.issue_id = partitions.issue_id AND\n"
+            "        _incidents.build_id IS partitions.build_id AND\n"
+            "        _incidents.test_id IS partitions.test_id AND\n"
+            "        _incidents.issue_version >= partitions.min_version\n"
+            ")\n" +
+            self._format_insert_latest_incidents("partition_incidents"),
+            parameters
+        )
+
+    def _update_latest_incidents(self, cursor, old_partitions,
+                                 new_partitions):
+        """
+        Update the latest incidents after loading incidents.
+
+        Args:
+            cursor:         The cursor to use for updating the incidents.
+            old_partitions: The partitions and the issue versions of the
+                            loaded incidents stored before loading, as
+                            returned by _get_incident_partitions().
+            new_partitions: The partitions and the issue versions of the
+                            loaded incidents stored after loading, as
+                            returned by _get_incident_partitions().
+        """
+        # The latest incidents of a partition can only be replaced with
+        # ones of the same, or higher version than the stored incidents
+        min_versions = {}
+        for partition_version in new_partitions.values():
+            partition, version = partition_version[:-1], partition_version[-1]
+            min_versions[partition] = min(
+                min_versions.get(partition, version), version
+            )
+        # Unless an incident moves to another partition
+        for incident_id, partition_version in old_partitions.items():
+            if new_partitions[incident_id][:-1] != partition_version[:-1]:
+                min_versions[partition_version[:-1]] = 0
+        if min_versions:
+            self._refresh_latest_incidents(cursor, min_versions)
+
+    def _load_table(self, cursor, table_name, obj_list):
+        """
+        Load objects into a table (or its storage table, if any), as a part
+        of the load() transaction, updating the latest issue versions and
+        incidents.
+
+        Args:
+            cursor:     The cursor to use for accessing the database.
+            table_name: The name of the table in TABLES to load into.
+            obj_list:   The list of the objects to load.
+        """
+        if table_name != "incidents":
+            super()._load_table(cursor, table_name, obj_list)
+            if table_name == "issues":
+                cursor.executemany(
+                    "INSERT INTO _issues_latest (id, version)\n"
+                    "VALUES (?, ?)\n"
+                    "ON CONFLICT (id) DO UPDATE\n"
+                    "SET version = excluded.version\n"
+                    "WHERE excluded.version > _issues_latest.version",
+                    ((obj["id"], obj["version"]) for obj in obj_list)
+                )
+            return
+        # Remember the partitions the replaced incidents were in
+        incident_ids = [obj["id"] for obj in obj_list]
+        old_partitions = self._get_incident_partitions(cursor, incident_ids)
+        super()._load_table(cursor, table_name, obj_list)
+        self._update_latest_incidents(
+            cursor, old_partitions,
+            self._get_incident_partitions(cursor, incident_ids)
+        )
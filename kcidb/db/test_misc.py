@@ -0,0 +1,31 @@
+"""kcidb.db.misc module tests"""
+
+import pytest
+from kcidb.db.misc import parse_params_options
+
+
+def test_parse_params_options():
+    """Check driver parameter option lists are parsed correctly"""
+    assert parse_params_options("") == ({}, "")
+    assert parse_params_options("db.sqlite3") == ({}, "db.sqlite3")
+    assert parse_params_options("[]db.sqlite3") == ({}, "db.sqlite3")
+    assert parse_params_options("[load=copy]host=x") == \
+        (dict(load="copy"), "host=x")
+    assert parse_params_options("[ a = 1 ,, b=2, c= ]:memory:") == \
+        (dict(a="1", b="2", c=""), ":memory:")
+    assert parse_params_options("[a=b=c]") == (dict(a="b=c"), "")
+    # Only the first list is parsed
+    assert parse_params_options("[a=1][b=2]") == (dict(a="1"), "[b=2]")
+    # A doubled opening bracket is a literal one, without options
+    assert parse_params_options("[[a=1]x") == ({}, "[a=1]x")
+    assert parse_params_options("[[") == ({}, "[")
+    # An unbracketed "=" is not an option
+    assert parse_params_options("a=1") == ({}, "a=1")
+
+
+def test_parse_params_options_invalid():
+    """Check malformed driver parameter option lists are rejected"""
+    for params in ("[", "[a=1", "[a]", "[a=1,b]", "[=1]", "[ =1]",
+                   "[a=1,a=2]", "[a=1, a =1]x"):
+        with pytest.raises(Exception):
+            parse_params_options(params)
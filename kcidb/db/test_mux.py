@@ -2,14 +2,16 @@
 
 from itertools import zip_longest
 import textwrap
+import threading
 import pytest
 from kcidb_io.schema import V1_1, V2_0, V3_0, V4_0, V4_1
 from kcidb.db.mux import Driver as MuxDriver
 from kcidb.db.null import Driver as NullDriver
-from kcidb.db.misc import UnsupportedSchema
+from kcidb.db.misc import UnsupportedSchema, LoadError
 
 
 class DummyDriver(NullDriver):
+    # It's OK, pylint: disable=too-many-instance-attributes
     """A dummy driver with configurable number of schemas"""
 
     @classmethod
@@ -89,6 +91,8 @@ class DummyDriver(NullDriver):
             0 <= (self.major / self.major_step * self.minors_per_major +
                   self.minor) < len(self.schemas)
         self.params = params
+        self.loaded = []
+        self.queried = 0
 
     def __repr__(self):
         return f"Dummy<{self.params}>"
@@ -166,6 +170,72 @@ class DummyDriver(NullDriver):
             "Target schema is older than the current schema"
         (self.major, self.minor) = target_version
 
+    def load(self, data):
+        """
+        Load data into the database.
+
+        Args:
+            data:   The JSON data to load into the database.
+                    Must adhere to the current version of I/O schema.
+        """
+        assert self.get_schema()[1].is_compatible_directly(data)
+        self.loaded.append(data)
+
+    def oo_query(self, pattern_set, lazy=False, projection=None):
+        """
+        Query raw object-oriented data from the database.
+
+        Args:
+            pattern_set:    A set of patterns ("kcidb.oo.data.Pattern"
+                            instances) matching objects to fetch.
+            lazy:           If true, JSON fields can be returned lazily.
+            projection:     The fields to retrieve, or None for all.
+        Returns:
+            A dictionary of object type names and lists containing retrieved
+            objects of the corresponding type.
+        """
+        self.queried += 1
+        return super().oo_query(pattern_set, lazy, projection)
+
+
+class FailingDriver(DummyDriver):
+    """A dummy driver failing to load data"""
+
+    def load(self, data):
+        """
+        Fail loading data into the database.
+
+        Args:
+            data:   The JSON data to fail loading.
+        """
+        raise Exception(f"Failed loading into {self!r}")
+
+    def oo_query(self, pattern_set, lazy=False, projection=None):
+        """
+        Fail querying raw object-oriented data from the database.
+
+        Args:
+            pattern_set:    The set of patterns to fail querying.
+            lazy:           Ignored.
+            projection:     Ignored.
+        """
+        del lazy
+        del projection
+        self.queried += 1
+        raise Exception(f"Failed querying {self!r}")
+
+    def dump_iter(self, objects_per_report):
+        """
+        Fail dumping all data from the database.
+
+        Args:
+            objects_per_report: The number of objects per report to fail
+                                dumping.
+        """
+        raise Exception(f"Failed dumping {self!r}")
+        # Make this a generator, pylint: disable=unreachable
+        yield from super().dump_iter(objects_per_report)
+
 
 class DummyMuxDriver(MuxDriver):
     """A driver muxing dummy drivers"""
@@ -179,7 +249,8 @@ class DummyMuxDriver(MuxDriver):
         Returns:
             A driver dictionary.
         """
-        return dict(dummy=DummyDriver)
+        return dict(dummy=DummyDriver, other=DummyDriver,
+                    failing=FailingDriver)
 
 
 def test_param_parsing():
@@ -434,3 +505,95 @@ def test_schemas():  # It's OK, pylint: disable=too-many-branches
         if version > driver.get_schema()[0]:
             driver.upgrade(version)
     assert driver.get_schema() == ((8, 1), V4_1)
+
+
+def test_load():
+    """Check that data is loaded into all drivers, sequentially or not"""
+    for options in ("", "[load=sequential]", "[load=parallel]"):
+        driver = DummyMuxDriver(f"""{options}
+            dummy:1:4:1:1:3
+            dummy:1:4:1:1:2
+            dummy:1:4:1:1:3
+        """)
+        assert driver.get_schema()[1] == V3_0
+        data = V3_0.new()
+        driver.load(data)
+        first, second, third = driver.drivers
+        # Data is only upgraded for drivers needing it, and only once
+        assert second.loaded == [data]
+        assert second.loaded[0] is data
+        assert first.loaded == [V4_0.upgrade(data)]
+        assert third.loaded[0] is first.loaded[0]
+
+    # Sequential loading stops at the first failure
+    driver = DummyMuxDriver("[load=sequential] failing dummy failing")
+    with pytest.raises(Exception) as excinfo:
+        driver.load(V1_1.new())
+    assert not isinstance(excinfo.value, LoadError)
+    assert not driver.drivers[1].loaded
+
+    # Parallel loading reports all failures, after loading the rest
+    driver = DummyMuxDriver("[load=parallel] failing dummy failing")
+    with pytest.raises(LoadError) as excinfo:
+        driver.load(V1_1.new())
+    assert [d for d, _ in excinfo.value.driver_errors] == \
+        [driver.drivers[0], driver.drivers[2]]
+    assert driver.drivers[1].loaded == [V1_1.new()]
+    # No loading threads are left running
+    assert not any(thread.name.startswith("kcidb_db_mux_load")
+                   for thread in threading.enumerate())
+
+    # Invalid options are rejected
+    with pytest.raises(Exception):
+        DummyMuxDriver("[load=random] dummy")
+    with pytest.raises(Exception):
+        DummyMuxDriver("[load=parallel,load=sequential] dummy")
+
+
+def test_read():
+    """Check that reads are routed according to the read policy"""
+    # Reading from the first driver by default
+    driver = DummyMuxDriver("dummy other")
+    driver.oo_query(set())
+    assert [d.queried for d in driver.drivers] == [1, 0]
+    driver = DummyMuxDriver("[read=first] failing dummy")
+    with pytest.raises(Exception):
+        driver.oo_query(set())
+    assert [d.queried for d in driver.drivers] == [1, 0]
+
+    # Reading from a named driver
+    driver = DummyMuxDriver("[read=other] dummy other")
+    driver.oo_query(set())
+    assert [d.queried for d in driver.drivers] == [0, 1]
+    with pytest.raises(Exception):
+        DummyMuxDriver("[read=unknown] dummy other")
+
+    # Failing over
+    driver = DummyMuxDriver("[read=failover] failing dummy")
+    assert driver.oo_query(set()) == {}
+    assert [d.queried for d in driver.drivers] == [1, 1]
+    assert list(driver.dump_iter(0)) == [V4_1.new()]
+    driver = DummyMuxDriver("[read=failover] dummy failing")
+    driver.oo_query(set())
+    assert [d.queried for d in driver.drivers] == [1, 0]
+    driver = DummyMuxDriver("[read=failover] failing failing")
+    with pytest.raises(Exception):
+        driver.oo_query(set())
+    with pytest.raises(Exception):
+        list(driver.dump_iter(0))
+
+    # Reading from the fastest driver, trying each one first
+    driver = DummyMuxDriver("[read=fastest] dummy dummy dummy")
+    for _ in range(3):
+        driver.oo_query(set())
+    assert [d.queried for d in driver.drivers] == [1, 1, 1]
+    assert all(latency is not None for latency in driver.read_latencies)
+    driver.read_latencies = [0.3, 0.1, 0.2]
+    driver.oo_query(set())
+    assert [d.queried for d in driver.drivers] == [1, 2, 1]
+    # Re-trying the drivers measured least recently, periodically
+    for _ in range(driver.READ_PROBE_PERIOD * 2 - 4):
+        driver.read_latencies = [0.3, 0.1, 0.2]
+        driver.oo_query(set())
+    assert [d.queried for d in driver.drivers] == \
+        [2, driver.READ_PROBE_PERIOD * 2 - 4, 2]
@@ -3,6 +3,7 @@ Kernel CI report object-oriented (OO) data representation.
 """
 
 import sys
+import weakref
 from abc import ABC, abstractmethod
 from functools import reduce
 from cached_property import cached_property
@@ -10,7 +11,7 @@ import kcidb.db
 from kcidb.misc import LIGHT_ASSERTS
 from kcidb.orm import Source
 from kcidb.orm.query import Pattern
-from kcidb.orm.data import Type, SCHEMA
+from kcidb.orm.data import Type, SCHEMA, LazyJSON
 
 
 class Object:
@@ -26,11 +27,13 @@ class Object:
                         references.
             type:       The type of represented object.
                         Instance of kcidb.orm.data.Type.
-            data:       The raw data of the object to represent.
+            data:       The raw data of the object to represent. Can contain
+                        lazy JSON values, to be decoded on first access, and
+                        omit fields, to be fetched on first access.
         """
         assert isinstance(client, Client)
         assert isinstance(type, Type)
-        assert LIGHT_ASSERTS or type.is_valid(data)
+        assert LIGHT_ASSERTS or type.is_valid(data, client.projection)
         self._client = client
         self._type = type
         self._data = data
@@ -75,8 +78,13 @@ class Object:
         return isinstance(other, Object) and self.get_id() == other.get_id()
 
     def __getattr__(self, name):
+        if name in self._type.fields and name not in self._data:
+            self._client.fetch_field(self, name)
         if name in self._data:
-            return self._data[name]
+            value = self._data[name]
+            if isinstance(value, LazyJSON):
+                value = self._data[name] = value.decode()
+            return value
         id = self.get_id()
         if name in self._type.parents:
             response = self._client.query(
@@ -711,10 +719,23 @@ CLASSES = dict(
 assert set(CLASSES) == set(SCHEMA.types)
 
 
+# A dictionary of object type names and sets of names of their (potentially
+# large) fields, which the client doesn't fetch until accessed, by default
+DEFERRED_FIELDS = dict(
+    checkout={"log_excerpt", "comment"},
+    build={"log_excerpt", "comment"},
+    test={"log_excerpt", "comment"},
+)
+
+assert SCHEMA.is_valid_projection(DEFERRED_FIELDS)
+
+
 class Client:
     """Object-oriented data client"""
 
-    def __init__(self, source, prefetch=True, cache=True, sort=False):
+    # It's OK, pylint: disable=too-many-arguments
+    def __init__(self, source, prefetch=True, cache=True, sort=False,
+                 lazy=True, deferred=None):
         """
         Initialize the client.
 
@@ -728,9 +749,20 @@ class Client:
                         kcidb.orm.Cache. If False, do not cache.
             sort:       If True, sort data fetched from the source (useful for
                         tests). If False, do not sort.
+            lazy:       If True, let the source keep JSON fields (such as
+                        "misc") encoded until they're accessed. If False,
+                        have them decoded by the source.
+            deferred:   A dictionary of object type names and sets of names
+                        of fields to not fetch until they're accessed, and
+                        then fetch for all objects of the type at once.
+                        None to use DEFERRED_FIELDS.
         """
         assert isinstance(source, Source)
         assert isinstance(sort, bool)
+        assert isinstance(lazy, bool)
+        if deferred is None:
+            deferred = DEFERRED_FIELDS
+        assert SCHEMA.is_valid_projection(deferred)
         self.source = source
         self.cache = None
         if cache:
@@ -739,6 +771,16 @@ class Client:
         if prefetch:
             self.source = kcidb.orm.Prefetcher(self.source)
         self.sort = sort
+        self.lazy = lazy
+        # The projection to query objects with, omitting deferred fields
+        self.projection = {
+            type_name: set(SCHEMA.types[type_name].fields) - field_names
+            for type_name, field_names in deferred.items()
+            if field_names
+        } or None
+        # A dictionary of object type names and weak dictionaries of IDs
+        # and objects in use, which were retrieved without some fields
+        self.type_id_partial_objs = {}
 
     def query(self, pattern_set):
         """
@@ -753,16 +795,24 @@ class Client:
         """
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, Pattern) for r in pattern_set)
-        data = {
-            obj_type_name: [
-                CLASSES[obj_type_name](
-                    self, SCHEMA.types[obj_type_name], obj_data
-                )
-                for obj_data in obj_data_list
-            ]
-            for obj_type_name, obj_data_list in
-            self.source.oo_query(pattern_set).items()
-        }
+        response = self.source.oo_query(pattern_set, self.lazy,
+                                        self.projection)
+        data = {}
+        for obj_type_name, obj_data_list in response.items():
+            obj_type = SCHEMA.types[obj_type_name]
+            obj_class = CLASSES[obj_type_name]
+            field_num = len(obj_type.fields)
+            id_partial_objs = self.type_id_partial_objs.setdefault(
+                obj_type_name, weakref.WeakValueDictionary()
+            )
+            objs = data[obj_type_name] = []
+            for obj_data in obj_data_list:
+                obj = obj_class(self, obj_type, obj_data)
+                # Remember the objects missing fields, while they're in use,
+                # to fetch the fields for all of them, when accessed
+                if len(obj_data) < field_num:
+                    id_partial_objs[obj.get_id()] = obj
+                objs.append(obj)
         if self.sort:
             data = {
                 type_name: sorted(objs, key=lambda obj: obj.get_id())
@@ -771,10 +821,51 @@ class Client:
             }
         return data
 
+    def fetch_field(self, obj, field_name):
+        """
+        Fetch a field omitted from an object, along with the same field
+        omitted from all other objects of the type retrieved since the last
+        cache reset, and still in use, at once, and add it to their raw data.
+
+        Args:
+            obj:        The object the field is needed for.
+            field_name: The name of the field to fetch.
+        """
+        # We own the objects, pylint: disable=protected-access
+        assert isinstance(obj, Object)
+        obj_type = obj.get_type()
+        assert field_name in obj_type.fields
+        id_partial_objs = self.type_id_partial_objs.setdefault(
+            obj_type.name, weakref.WeakValueDictionary()
+        )
+        id_partial_objs[obj.get_id()] = obj
+        id_objs = {
+            id: partial_obj for id, partial_obj in id_partial_objs.items()
+            if field_name not in partial_obj._data
+        }
+        if not id_objs:
+            return
+        response = self.source.oo_query(
+            {Pattern(None, True, obj_type, set(id_objs))},
+            self.lazy, {obj_type.name: {field_name}}
+        )
+        for fetched_obj_data in response.get(obj_type.name, []):
+            id = obj_type.get_id(fetched_obj_data)
+            if id in id_objs:
+                id_objs[id]._data[field_name] = fetched_obj_data[field_name]
+        # Forget the objects which have all their fields now
+        field_num = len(obj_type.fields)
+        for id, partial_obj in id_objs.items():
+            # Consider fields of objects gone from the source empty
+            partial_obj._data.setdefault(field_name, None)
+            if len(partial_obj._data) == field_num:
+                del id_partial_objs[id]
+
     def reset_cache(self):
         """
         Reset the cache, if enabled. No effect, if the cache was disabled.
         """
+        self.type_id_partial_objs = {}
         if self.cache:
             self.cache.reset()
 
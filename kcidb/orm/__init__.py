@@ -17,19 +17,29 @@ class Source(ABC):
     """An abstract source of raw object-oriented (OO) data"""
 
     @abstractmethod
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Retrieve raw data for objects specified via a pattern set.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             raw data of the corresponding type.
         """
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, query.Pattern) for r in pattern_set)
+        assert data.SCHEMA.is_valid_projection(projection)
 
 
 class Prefetcher(Source):
@@ -45,21 +55,31 @@ class Prefetcher(Source):
         assert isinstance(source, Source)
         self.source = source
 
-    def oo_query(self, pattern_set):
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Retrieve raw data for objects specified via a pattern set.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             raw data of the corresponding type.
         """
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, query.Pattern) for r in pattern_set)
+        assert data.SCHEMA.is_valid_projection(projection)
         # First fetch the response we were asked for
-        response = self.source.oo_query(pattern_set)
+        response = self.source.oo_query(pattern_set, lazy, projection)
         # Generate patterns for all children of fetched root objects
         prefetch_pattern_set = set()
         for obj_type_name, objs in response.items():
@@ -76,7 +96,7 @@ class Prefetcher(Source):
         # Prefetch, if generated any patterns
         if prefetch_pattern_set:
             LOGGER.info("Prefetching %r", prefetch_pattern_set)
-            self.source.oo_query(prefetch_pattern_set)
+            self.source.oo_query(prefetch_pattern_set, lazy, projection)
 
         # Return the response for the original request
         return response
@@ -103,7 +123,7 @@ class Cache(Source):
         self.type_id_objs = {type_name: {} for type_name in data.SCHEMA.types}
         self.pattern_responses = {}
 
-    def _merge_pattern_response(self, pattern, response):
+    def _merge_pattern_response(self, pattern, response, projection):
         """
         Process a response to a single-pattern query fetched from the
         underlying source, merging it with the cache.
@@ -111,6 +131,7 @@ class Cache(Source):
         Args:
             pattern:    The pattern the response was retrieved for.
             response:   The retrieved response. May be modified.
+            projection: The projection the response was retrieved with.
 
         Returns:
             The merged response.
@@ -118,7 +139,7 @@ class Cache(Source):
         # Let's get it working first, refactor later,
         # pylint: disable=too-many-locals,too-many-branches
         assert isinstance(pattern, query.Pattern)
-        assert LIGHT_ASSERTS or data.SCHEMA.is_valid(response)
+        assert LIGHT_ASSERTS or data.SCHEMA.is_valid(response, projection)
         assert len(response) <= 1
         if not response:
             response[pattern.obj_type.name] = []
@@ -126,6 +147,7 @@ class Cache(Source):
         assert type_name == pattern.obj_type.name
 
         # Merge the response and the cache
+        field_num = len(data.SCHEMA.types[type_name].fields)
         get_id = data.SCHEMA.types[type_name].get_id
         get_parent_id = data.SCHEMA.types[type_name].get_parent_id
         id_objs = self.type_id_objs[type_name]
@@ -133,12 +155,16 @@ class Cache(Source):
         base_type = None if base_pattern is None else base_pattern.obj_type
         cached = set()
         # For each object in the response
-        for obj in objs:
+        for index, obj in enumerate(objs):
             # Deduplicate or cache the object
             # We like our "id", pylint: disable=invalid-name
             id = get_id(obj)
             if id in id_objs:
-                obj = id_objs[id]
+                # Add the fields the cached object is missing, if any
+                if len(id_objs[id]) < field_num:
+                    for name, value in obj.items():
+                        id_objs[id].setdefault(name, value)
+                obj = objs[index] = id_objs[id]
                 LOGGER.debug("Deduplicated %r %r", type_name, id)
             else:
                 id_objs[id] = obj
@@ -226,19 +252,73 @@ class Cache(Source):
             )
         return response
 
-    def oo_query(self, pattern_set):
+    def _fetch_missing_fields(self, obj_type, id_objs, lazy, projection):
+        """
+        Fetch the fields requested by a projection, but missing from cached
+        objects (retrieved with a narrower projection before), from the
+        underlying source, in bulk, and add them to the objects.
+
+        Args:
+            obj_type:   The type of the objects (kcidb.orm.data.Type).
+            id_objs:    A dictionary of IDs and cached objects to complete.
+            lazy:       True if JSON fields can be fetched lazily.
+            projection: The projection the objects are requested with.
+        """
+        # Calm down, pylint: disable=too-many-locals
+        assert isinstance(obj_type, data.Type)
+        assert isinstance(id_objs, dict)
+        field_num = len(obj_type.fields)
+        fields = obj_type.get_projected_fields(projection)
+        missing_fields = set()
+        missing_id_objs = {}
+        # We like our "id", pylint: disable=invalid-name
+        for id, obj in id_objs.items():
+            if len(obj) < field_num:
+                obj_missing_fields = {f for f in fields if f not in obj}
+                if obj_missing_fields:
+                    missing_fields |= obj_missing_fields
+                    missing_id_objs[id] = obj
+        if not missing_id_objs:
+            return
+        LOGGER.debug("Fetching %r fields of %u %rs",
+                     missing_fields, len(missing_id_objs), obj_type.name)
+        response = self.source.oo_query(
+            {query.Pattern(None, True, obj_type, set(missing_id_objs))},
+            lazy, {obj_type.name: missing_fields}
+        )
+        for obj in response.get(obj_type.name, []):
+            cached_obj = missing_id_objs.get(obj_type.get_id(obj))
+            if cached_obj is not None:
+                for name, value in obj.items():
+                    cached_obj.setdefault(name, value)
+        # Consider fields of objects gone from the source empty
+        for obj in missing_id_objs.values():
+            for name in missing_fields:
+                obj.setdefault(name, None)
+
+    def oo_query(self, pattern_set, lazy=False, projection=None):
         """
         Retrieve raw data for objects specified via a pattern set.
 
         Args:
             pattern_set:    A set of patterns ("kcidb.orm.query.Pattern"
                             instances) matching objects to fetch.
+            lazy:           If true, JSON fields (such as "misc") can be
+                            returned as kcidb.orm.data.LazyJSON instances,
+                            to be decoded when needed. If false, they're
+                            returned decoded.
+            projection:     A dictionary of object type names and sets of
+                            names of fields to retrieve for objects of those
+                            types, or None to retrieve all fields. Fields
+                            identifying objects and their parents are always
+                            retrieved, others are omitted from objects.
         Returns:
             A dictionary of object type names and lists containing retrieved
             raw data of the corresponding type.
         """
         assert isinstance(pattern_set, set)
         assert all(isinstance(r, query.Pattern) for r in pattern_set)
+        assert data.SCHEMA.is_valid_projection(projection)
 
         # Start with an empty response
         response_type_id_objs = {}
@@ -253,7 +333,9 @@ class Cache(Source):
             except KeyError:
                 # Query the source and merge the response into the cache
                 pattern_response = self._merge_pattern_response(
-                    pattern, self.source.oo_query({pattern})
+                    pattern,
+                    self.source.oo_query({pattern}, lazy, projection),
+                    projection
                 )
                 LOGGER.debug("Merged into the cache: %r", pattern)
             # Merge into the overall response
@@ -264,12 +346,20 @@ class Cache(Source):
                     id_objs[get_id(obj)] = obj
                 response_type_id_objs[type_name] = id_objs
 
+        # Fetch the fields of cached objects omitted by earlier projections
+        for type_name, id_objs in response_type_id_objs.items():
+            self._fetch_missing_fields(data.SCHEMA.types[type_name],
+                                       id_objs, lazy, projection)
+
         # Return merged and validated response
         response = {
             type_name: list(id_objs.values())
             for type_name, id_objs in response_type_id_objs.items()
         }
-        assert LIGHT_ASSERTS or data.SCHEMA.is_valid(response)
+        # Decode lazy JSON values cached for earlier lazy queries, if any
+        if not lazy:
+            data.decode_lazy(response, copy=False)
+        assert LIGHT_ASSERTS or data.SCHEMA.is_valid(response, projection)
         return response
 
 
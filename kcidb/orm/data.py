@@ -3,11 +3,73 @@ The data structures and constants used by the KCIDB object-relational
 mapping system to organize Kernel CI report data into objects.
 """
 
+import json
 import jsonschema
 from kcidb.misc import LIGHT_ASSERTS
 import kcidb.io as io
 
 
+class LazyJSON:
+    """
+    A JSON value in raw object data, kept encoded until decoded explicitly
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        """
+        Initialize the lazy JSON value.
+
+        Args:
+            text:   The JSON-encoded value.
+        """
+        assert isinstance(text, str)
+        self.text = text
+
+    def decode(self):
+        """
+        Decode the JSON value.
+
+        Returns:
+            The decoded value.
+        """
+        return json.loads(self.text)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.text!r})"
+
+
+def decode_lazy(data, copy=True):
+    """
+    Decode all lazy JSON values in raw object data.
+
+    Args:
+        data:   The raw data to decode the lazy JSON values in: a dictionary
+                of object type names and lists of objects, a single object,
+                or a value of its field.
+        copy:   True if the containers with decoded values should be copied,
+                False if they should be modified in place.
+
+    Returns:
+        The data with lazy JSON values decoded.
+    """
+    if isinstance(data, LazyJSON):
+        return data.decode()
+    if isinstance(data, dict):
+        if copy:
+            data = data.copy()
+        for key, value in data.items():
+            if isinstance(value, (LazyJSON, dict, list)):
+                data[key] = decode_lazy(value, copy)
+    elif isinstance(data, list):
+        if copy:
+            data = data.copy()
+        for index, value in enumerate(data):
+            if isinstance(value, (LazyJSON, dict, list)):
+                data[index] = decode_lazy(value, copy)
+    return data
+
+
 class Relation:
     """A parent/child relation between object types"""
 
@@ -59,6 +121,11 @@ class Type:
         self.json_schema = json_schema
         # List of ID field names
         self.id_fields = id_fields
+        # A tuple of all field names
+        self.fields = tuple(json_schema["properties"])
+        # A dictionary of tuples of names of (required) projected fields,
+        # and JSON schemas for the raw data retrieved with them
+        self.projected_json_schemas = {}
         # A list of all relations
         self.relations = []
         # A map of parent type names and their relations
@@ -84,12 +151,38 @@ class Type:
         if self is relation.child:
             self.parents[relation.parent.name] = relation
 
-    def validate(self, data):
+    def get_json_schema(self, projection=None):
+        """
+        Get the JSON schema for this type's raw data, retrieved according to
+        a projection.
+
+        Args:
+            projection: A dictionary of object type names and sets of names
+                        of fields retrieved for objects of those types, or
+                        None, if all fields were retrieved.
+
+        Returns:
+            The JSON schema requiring the projected fields to be present.
+        """
+        fields = self.get_projected_fields(projection)
+        if fields == self.fields:
+            return self.json_schema
+        json_schema = self.projected_json_schemas.get(fields)
+        if json_schema is None:
+            json_schema = dict(self.json_schema, required=list(fields))
+            self.projected_json_schemas[fields] = json_schema
+        return json_schema
+
+    def validate(self, data, projection=None):
         """
         Validate a type's data against its JSON schema.
 
         Args:
-            data:   The data to validate.
+            data:       The data to validate. Can contain lazy JSON values.
+            projection: A dictionary of object type names and sets of names
+                        of fields retrieved for objects of those types, or
+                        None, if all fields were retrieved, and must be
+                        present.
 
         Returns:
             The validated (but unmodified) data.
@@ -105,22 +198,27 @@ class Type:
             # TODO Remove once we stop supporting Python 3.6
             format_checker = jsonschema.draft7_format_checker
 
-        jsonschema.validate(instance=data, schema=self.json_schema,
+        jsonschema.validate(instance=decode_lazy(data),
+                            schema=self.get_json_schema(projection),
                             format_checker=format_checker)
         return data
 
-    def is_valid(self, data):
+    def is_valid(self, data, projection=None):
         """
         Check if a type's data is valid according to its JSON schema.
 
         Args:
-            data:   The data to check.
+            data:       The data to check.
+            projection: A dictionary of object type names and sets of names
+                        of fields retrieved for objects of those types, or
+                        None, if all fields were retrieved, and must be
+                        present.
 
         Returns:
             True if the data is valid, False otherwise.
         """
         try:
-            self.validate(data)
+            self.validate(data, projection)
             return True
         except jsonschema.exceptions.ValidationError:
             return False
@@ -136,7 +234,7 @@ class Type:
         Returns:
             A tuple of values of object fields identifying it globally.
         """
-        assert LIGHT_ASSERTS or self.is_valid(data)
+        assert LIGHT_ASSERTS or self.is_valid(data, {self.name: set()})
         return tuple(data[field] for field in self.id_fields)
 
     def get_parent_id(self, parent_type_name, data):
@@ -154,11 +252,33 @@ class Type:
             A tuple of values of object fields identifying the parent
             globally.
         """
-        assert LIGHT_ASSERTS or self.is_valid(data)
+        assert LIGHT_ASSERTS or self.is_valid(data, {self.name: set()})
         assert parent_type_name in self.parents
         return tuple(data[field]
                      for field in self.parents[parent_type_name].ref_fields)
 
+    def get_projected_fields(self, projection):
+        """
+        Get the names of the fields to retrieve for objects of this type,
+        according to a projection.
+
+        Args:
+            projection: A dictionary of object type names and sets of names
+                        of fields to retrieve for objects of those types, or
+                        None to retrieve all fields.
+
+        Returns:
+            A tuple of names of the fields to retrieve, in the order of the
+            type's fields, always including the fields identifying the
+            object and its parents.
+        """
+        if projection is None or self.name not in projection:
+            return self.fields
+        field_set = set(projection[self.name]) | set(self.id_fields)
+        for relation in self.parents.values():
+            field_set |= set(relation.ref_fields)
+        return tuple(field for field in self.fields if field in field_set)
+
 
 class Schema:
     """A repository of recognized object types"""
@@ -219,6 +339,9 @@ class Schema:
             "properties": {},
             "additionalProperties": False,
         }
+        # A dictionary of tuples of projected field name tuples of each
+        # type, and JSON schemas for the data retrieved with them
+        self.projected_json_schemas = {}
         for name, info in types.items():
             json_schema = dict(
                 type="object",
@@ -254,12 +377,47 @@ class Schema:
                 type.add_relation(relation)
                 child_type.add_relation(relation)
 
-    def validate(self, data):
+    def get_json_schema(self, projection=None):
+        """
+        Get the JSON schema for raw object-oriented data, retrieved
+        according to a projection.
+
+        Args:
+            projection: A dictionary of object type names and sets of names
+                        of fields retrieved for objects of those types, or
+                        None, if all fields were retrieved.
+
+        Returns:
+            The JSON schema requiring the projected fields to be present.
+        """
+        if projection is None:
+            return self.json_schema
+        key = tuple(
+            type.get_projected_fields(projection)
+            for type in self.types.values()
+        )
+        json_schema = self.projected_json_schemas.get(key)
+        if json_schema is None:
+            json_schema = dict(self.json_schema, properties={
+                name: dict(type="array", items={
+                    k: v for k, v in type.get_json_schema(projection).items()
+                    if k != "$defs"
+                })
+                for name, type in self.types.items()
+            })
+            self.projected_json_schemas[key] = json_schema
+        return json_schema
+
+    def validate(self, data, projection=None):
         """
         Validate raw object-oriented data against the schema.
 
         Args:
-            data:   The data to validate.
+            data:       The data to validate. Can contain lazy JSON values.
+            projection: A dictionary of object type names and sets of names
+                        of fields retrieved for objects of those types, or
+                        None, if all fields were retrieved, and must be
+                        present.
 
         Returns:
             The validated data.
@@ -275,26 +433,54 @@ class Schema:
             # TODO Remove once we stop supporting Python 3.6
             format_checker = jsonschema.draft7_format_checker
 
-        jsonschema.validate(instance=data, schema=self.json_schema,
+        jsonschema.validate(instance=decode_lazy(data),
+                            schema=self.get_json_schema(projection),
                             format_checker=format_checker)
         return data
 
-    def is_valid(self, data):
+    def is_valid(self, data, projection=None):
         """
         Check if a raw object-oriented data is valid according to the schema.
 
         Args:
-            data:   The data to check.
+            data:       The data to check.
+            projection: A dictionary of object type names and sets of names
+                        of fields retrieved for objects of those types, or
+                        None, if all fields were retrieved, and must be
+                        present.
 
         Returns:
             True if the data is valid, False otherwise.
         """
         try:
-            self.validate(data)
+            self.validate(data, projection)
             return True
         except jsonschema.exceptions.ValidationError:
             return False
 
+    def is_valid_projection(self, projection):
+        """
+        Check if a field projection is valid for the schema.
+
+        Args:
+            projection: The projection to check: a dictionary of object type
+                        names and sets of names of fields to retrieve for
+                        objects of those types, or None to retrieve all
+                        fields.
+
+        Returns:
+            True if the projection is valid, False otherwise.
+        """
+        return projection is None or (
+            isinstance(projection, dict) and
+            all(
+                type_name in self.types and
+                isinstance(field_names, (set, frozenset)) and
+                field_names <= set(self.types[type_name].fields)
+                for type_name, field_names in projection.items()
+            )
+        )
+
     def format_dot(self):
         """
         Format the directed graph of object type relations in the schema using
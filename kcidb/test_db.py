@@ -4,7 +4,9 @@ import re
 import textwrap
 import datetime
 import json
-from itertools import permutations
+import tempfile
+from unittest.mock import patch
+from itertools import permutations, product
 import pytest
 import kcidb
 from kcidb.unittest import assert_executes
@@ -16,7 +18,9 @@ def test_schemas_main():
     """Check kcidb-db-schemas works"""
     argv = ["kcidb.db.schemas_main", "-d", "sqlite::memory:"]
     assert_executes("", *argv,
-                    stdout_re=r"4\.0: 4\.0\n4\.1: 4\.1\n")
+                    stdout_re=r"4\.0: 4\.0\n4\.1: 4\.1\n"
+                              r"4\.2: 4\.1\n4\.3: 4\.1\n4\.4: 4\.1\n"
+                              r"4\.5: 4\.1\n4\.6: 4\.1\n")
 
 
 def test_reset(clean_database):
@@ -85,6 +89,24 @@ def test_empty_main():
     assert_executes("", *argv, driver_source=driver_source)
 
 
+def test_compact_main():
+    """Check kcidb-db-compact works"""
+    argv = ["kcidb.db.compact_main", "-d", "bigquery:project.dataset"]
+    driver_source = textwrap.dedent("""
+        from unittest.mock import patch, Mock
+        client = Mock()
+        client.compact = Mock()
+        client.is_initialized = Mock(return_value=True)
+        with patch("kcidb.db.Client", return_value=client) as \
+                Client:
+            status = function()
+        Client.assert_called_once_with("bigquery:project.dataset")
+        client.compact.assert_called_once()
+        return status
+    """)
+    assert_executes("", *argv, driver_source=driver_source)
+
+
 def test_dump_main():
     """Check kcidb-db-dump works"""
     empty = kcidb.io.SCHEMA.new()
@@ -382,6 +404,271 @@ def test_get_last_modified(empty_database):
     assert timestamp.tzinfo is not None
 
 
+def test_metadata_cache():
+    """
+    Check the database schema version is cached, and the cache is
+    invalidated by schema changes, but the last modification time is never
+    cached
+    """
+    with tempfile.NamedTemporaryFile(suffix=".sqlite3") as db_file:
+        client = kcidb.db.Client("sqlite:" + db_file.name)
+        conn = client.driver.conn
+        conn.metadata_ttl = 3600
+        with patch.object(conn, "get_schema_version",
+                          wraps=conn.get_schema_version) as get_schema_version:
+            assert not conn.is_initialized()
+            assert not conn.is_initialized()
+            assert get_schema_version.call_count == 1
+            client.init()
+            assert conn.is_initialized()
+            assert conn.is_initialized()
+            assert get_schema_version.call_count == 2
+            conn.metadata_ttl = 0
+            conn.invalidate_metadata()
+            assert conn.is_initialized()
+            assert conn.is_initialized()
+            assert get_schema_version.call_count == 4
+            conn.metadata_ttl = 3600
+        with patch.object(conn, "get_last_modified",
+                          wraps=conn.get_last_modified) as get_last_modified:
+            client.get_last_modified()
+            client.get_last_modified()
+            assert get_last_modified.call_count == 2
+            timestamp = client.get_last_modified()
+            client.load(COMPREHENSIVE_IO_DATA)
+            assert client.get_last_modified() >= timestamp
+            assert get_last_modified.call_count == 4
+        client.cleanup()
+        assert not client.is_initialized()
+        assert not conn.is_initialized()
+
+
+def test_postgresql_prepared_stale(clean_database):
+    """
+    Check PostgreSQL OO queries recover from statements prepared before a
+    schema change made elsewhere (e.g. by another process)
+    """
+    client = clean_database
+    if not isinstance(client.driver, kcidb.db.postgresql.Driver):
+        pytest.skip("Not a PostgreSQL database")
+    client.init((4, 0))
+    client.load(dict(
+        version=dict(major=4, minor=0),
+        checkouts=[dict(id="_:1", origin="_", comment="Comment")],
+    ))
+    pattern_set = kcidb.orm.query.Pattern.parse(">checkout#")
+    expected = client.oo_query(pattern_set)
+    # Change a column's type bypassing the pool, like another process would
+    conn = client.driver.conn.pool.connect()
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(
+                "ALTER TABLE checkouts ALTER COLUMN comment TYPE VARCHAR(100)"
+            )
+    finally:
+        conn.close()
+    assert client.oo_query(pattern_set) == expected
+    assert client.oo_query(pattern_set) == expected
+
+
+def test_sqlite_options():
+    """
+    Check SQLite connection options are applied, and invalid ones rejected
+    """
+    for params in ("[journal=fast]:memory:", "[mmap=-1]:memory:",
+                   "[nosuch=1]:memory:", "[mode=ro]:memory:"):
+        with pytest.raises(Exception):
+            kcidb.db.Client("sqlite:" + params)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = tmp_dir + "/db.sqlite3"
+        client = kcidb.db.Client(
+            f"sqlite:[journal=wal,sync=normal,mmap=1048576,"
+            f"cache=-4096,temp=memory]{path}"
+        )
+        conn = client.driver.conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == 1048576
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4096
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+        client.init()
+        client.load(COMPREHENSIVE_IO_DATA)
+        dump = client.dump()
+        # Checkpoint the WAL, which immutable connections ignore
+        conn.close()
+        for mode in ("ro", "immutable"):
+            reader = kcidb.db.Client(f"sqlite:[mode={mode}]{path}")
+            assert reader.is_initialized()
+            assert reader.dump() == dump
+            with pytest.raises(Exception):
+                reader.empty()
+
+
+def test_sqlite_load_stage():
+    """
+    Check staged SQLite loading deduplicates objects the same way as loading
+    them one-by-one, for all schema versions
+    """
+    version = dict(major=4, minor=0)
+    data_list = [
+        dict(
+            version=version,
+            checkouts=[
+                dict(id="_:1", origin="_"),
+                dict(id="_:1", origin="_", comment="a"),
+                dict(id="_:1", origin="_", comment="b", valid=True,
+                     git_commit_hash="aa" * 20),
+            ],
+            builds=[
+                dict(id="_:2", checkout_id="_:1", origin="_",
+                     architecture="x86_64"),
+                dict(id="_:1", checkout_id="_:1", origin="_", comment="a"),
+                dict(id="_:1", checkout_id="_:2", origin="_", comment="b",
+                     architecture="arm64"),
+            ],
+            tests=[
+                dict(id="_:1", build_id="_:1", origin="_", status="PASS"),
+                dict(id="_:2", build_id="_:2", origin="_", path="a"),
+                dict(id="_:1", build_id="_:2", origin="_", status="FAIL",
+                     path="b"),
+            ],
+        ),
+        dict(
+            version=version,
+            checkouts=[
+                dict(id="_:1", origin="_", comment="c",
+                     git_commit_hash="bb" * 20),
+                dict(id="_:2", origin="_", comment="d"),
+            ],
+            builds=[
+                dict(id="_:1", checkout_id="_:2", origin="_", comment="c"),
+            ],
+            tests=[
+                dict(id="_:2", build_id="_:1", origin="_", status="SKIP"),
+                dict(id="_:2", build_id="_:1", origin="_", path="c"),
+            ],
+        ),
+        dict(
+            version=version,
+            builds=[
+                dict(id="_:3", checkout_id="_:1", origin="_"),
+            ],
+            tests=[
+                dict(id="_:3", build_id="_:3", origin="_"),
+            ],
+        ),
+    ]
+    for schema_version in kcidb.db.Client("sqlite::memory:").get_schemas():
+        dumps = {}
+        checkouts = {}
+        for mode in ("batch", "stage"):
+            client = kcidb.db.Client(f"sqlite:![load={mode}]:memory:")
+            client.init(schema_version)
+            for data in data_list:
+                client.load(data)
+            dumps[mode] = client.dump()
+            if schema_version >= (4, 5):
+                checkouts[mode] = client.driver.conn.execute(
+                    "SELECT _tests.id, _checkout_ids.value FROM _tests "
+                    "LEFT JOIN _checkout_ids "
+                    "ON _checkout_ids.id = _tests.checkout_id\n"
+                    "ORDER BY 1"
+                ).fetchall()
+        assert dumps["stage"] == dumps["batch"], \
+            f"Staged load differs for schema v{schema_version}"
+        assert checkouts.get("stage") == checkouts.get("batch"), \
+            f"Staged test checkouts differ for schema v{schema_version}"
+
+
+def test_revisions_reparent(clean_database):
+    """
+    Check objects reloaded with a different parent are found under the
+    same revisions by schemas storing checkout keys of tests, as by schema
+    v4.4 (not storing them), with either database or load priority.
+    """
+    driver_name, params = clean_database.database.split(":", 1)
+    if driver_name not in ("sqlite", "postgresql"):
+        pytest.skip(f"Load priority can't be forced for {driver_name!r}")
+    versions = list(clean_database.get_schemas())
+    if (4, 4) not in versions:
+        pytest.skip("Schema v4.4 is not supported")
+    # Have the first load of each new client prioritize the database
+    # (each load after it flips the priority)
+    spec = f"{driver_name}:!{params}"
+    version = dict(major=4, minor=0)
+    data_list = [
+        dict(
+            version=version,
+            checkouts=[
+                dict(id="o:c1", origin="o",
+                     git_commit_hash="bb" * 20, patchset_hash=""),
+            ],
+            builds=[dict(id="o:b1", checkout_id="o:c0", origin="o")],
+            tests=[dict(id="o:t1", build_id="o:b1", origin="o")],
+        ),
+        dict(
+            version=version,
+            builds=[dict(id="o:b1", checkout_id="o:c1", origin="o")],
+            tests=[
+                dict(id="o:t1", build_id="o:b2", origin="o"),
+                dict(id="o:t2", build_id="o:b1", origin="o"),
+            ],
+        ),
+    ]
+    patterns = {
+        hash: kcidb.orm.query.Pattern.parse(
+            f'>revision["{hash}", ""]#>checkout#>build#>test#'
+        )
+        for hash in ("aa" * 20, "bb" * 20)
+    }
+    # The last version of the data adds the first build's checkout, and
+    # the build the first test is moved to
+    data_list.append(dict(
+        version=version,
+        checkouts=[dict(id="o:c0", origin="o",
+                     git_commit_hash="aa" * 20, patchset_hash="")],
+        builds=[dict(id="o:b2", checkout_id="o:c0", origin="o")],
+    ))
+
+    def get_results(schema_version, prio_dbs):
+        """
+        Load data into a schema version, giving the database priority
+        (or not) in each of the loads after the first, as specified, and
+        query revisions' objects after each of them.
+        """
+        results = []
+        client = kcidb.db.Client(spec)
+        client.init(schema_version)
+        client.load(data_list[0])
+        prio_db = False
+        for data, data_prio_db in zip(data_list[1:], prio_dbs):
+            if prio_db != data_prio_db:
+                # Flip the priority with an empty load
+                client.load(dict(version=version))
+                prio_db = not prio_db
+            client.load(data)
+            prio_db = not prio_db
+            results.append({
+                hash: {
+                    name: sorted(
+                        kcidb.orm.data.SCHEMA.types[name].get_id(obj)
+                        for obj in objs
+                    )
+                    for name, objs in client.oo_query(pattern_set).items()
+                }
+                for hash, pattern_set in patterns.items()
+            })
+        client.cleanup()
+        return results
+
+    for prio_dbs in product((False, True), repeat=len(data_list) - 1):
+        expected = get_results((4, 4), prio_dbs)
+        for schema_version in versions[versions.index((4, 4)) + 1:]:
+            assert get_results(schema_version, prio_dbs) == expected, \
+                f"Revisions differ for schema v{schema_version}, " \
+                f"prio_dbs={prio_dbs}"
+
+
 def test_all_fields(empty_database):
     """
     Check all possible I/O fields can be loaded into and dumped from
@@ -1087,6 +1374,94 @@ def test_query(empty_database):
     ]
 
 
+def test_query_iter_interleaved(empty_database):
+    """
+    Check query_iter() calls matching relatives can be interleaved, where
+    supported, and are refused otherwise
+    """
+    client = empty_database
+    client.load(dict(
+        version=dict(major=4, minor=1),
+        checkouts=[dict(id=f"_:{i}", origin="_") for i in range(2)],
+        builds=[dict(id=f"_:{i}", origin="_", checkout_id=f"_:{i}")
+                for i in range(2)],
+        tests=[dict(id=f"_:{i}{j}", origin="_", build_id=f"_:{i}")
+               for i in range(2) for j in range(2)],
+    ))
+
+    def start_query_iters():
+        """Start querying each checkout with its children, by object"""
+        return [
+            client.query_iter(ids=dict(checkouts=[f"_:{i}"]),
+                              children=True, objects_per_report=1)
+            for i in range(2)
+        ]
+
+    expected = [list(query_iter) for query_iter in start_query_iters()]
+    assert all(len(reports) == 4 for reports in expected)
+
+    query_iters = start_query_iters()
+    if isinstance(client.driver, kcidb.db.postgresql.Driver):
+        next(query_iters[0])
+        with pytest.raises(AssertionError):
+            next(query_iters[1])
+        query_iters[0].close()
+        assert list(start_query_iters()[1]) == expected[1]
+        return
+
+    results = [[], []]
+    for reports in zip(*query_iters):
+        for result, report in zip(results, reports):
+            result.append(report)
+    assert results == expected
+
+
+def test_inline_ids_max(empty_database):
+    """
+    Check queries for more IDs than are inlined into statements return
+    the same as with the IDs inlined
+    """
+    client = empty_database
+    schema = getattr(client.driver, "schema", None)
+    if not hasattr(schema, "INLINE_IDS_MAX"):
+        pytest.skip("IDs are never staged")
+    id_num = schema.INLINE_IDS_MAX + 2
+    client.load(dict(
+        version=dict(major=4, minor=1),
+        checkouts=[dict(id=f"_:{i}", origin="_") for i in range(id_num)],
+        builds=[dict(id=f"_:{i}", origin="_", checkout_id=f"_:{i}")
+                for i in range(id_num)],
+    ))
+    # Query all but one existing, and one missing object
+    ids = [f"_:{i}" for i in range(1, id_num + 1)]
+    pattern_set = kcidb.orm.query.Pattern.parse(
+        ">checkout%#>build#", [{(id,) for id in ids}]
+    )
+
+    def query():
+        """Query the objects via both interfaces, normalizing the results"""
+        data = client.query(ids=dict(checkouts=ids, builds=ids))
+        oo_data = client.oo_query(pattern_set)
+        return (
+            {
+                obj_list_name: sorted(objs, key=lambda obj: obj["id"])
+                for obj_list_name, objs in data.items()
+                if obj_list_name != "version"
+            },
+            {
+                obj_type_name: sorted(objs, key=lambda obj: obj["id"])
+                for obj_type_name, objs in oo_data.items()
+            },
+        )
+
+    staged_data, staged_oo_data = query()
+    assert len(staged_data["checkouts"]) == id_num - 1
+    assert len(staged_data["builds"]) == id_num - 1
+    assert len(staged_oo_data["build"]) == id_num - 1
+    with patch.object(schema, "INLINE_IDS_MAX", id_num):
+        assert query() == (staged_data, staged_oo_data)
+
+
 def test_empty(empty_database):
     """Test the empty() method removes all data"""
     io_data = COMPREHENSIVE_IO_DATA
@@ -1097,6 +1472,22 @@ def test_empty(empty_database):
     assert kcidb.io.SCHEMA.new() == client.dump()
 
 
+def test_compact(empty_database):
+    """Test the compact() method preserves the data"""
+    io_data = COMPREHENSIVE_IO_DATA
+    client = empty_database
+    client.load(io_data)
+    client.compact()
+    assert io_data == client.dump()
+    # Load duplicates on top of compacted data
+    client.load(io_data)
+    assert io_data == client.dump()
+    client.compact()
+    assert io_data == client.dump()
+    client.empty()
+    assert kcidb.io.SCHEMA.new() == client.dump()
+
+
 def test_cleanup(clean_database):
     """Test the clean() method removes all data"""
     client = clean_database
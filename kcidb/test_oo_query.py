@@ -0,0 +1,211 @@
+"""kcidb.oo and kcidb.orm query data tests, for all database drivers"""
+
+import gc
+from unittest.mock import patch
+import kcidb
+
+
+def test_lazy(empty_database):
+    """Check JSON fields are decoded lazily, and correctly"""
+    database = empty_database
+    output_files = [dict(name="log.txt", url="https://example.com/log")]
+    misc = dict(foo="bar", baz=[1, 2, 3])
+    database.load({
+        "version": {"major": 4, "minor": 1},
+        "checkouts": [dict(id="_:1", origin="_", misc=misc)],
+        "builds": [dict(id="_:1", checkout_id="_:1", origin="_",
+                        output_files=output_files, misc=misc)],
+    })
+    pattern_set = kcidb.orm.query.Pattern.parse(">checkout#>build#")
+    eager_data = database.oo_query(pattern_set)
+    lazy_data = database.oo_query(pattern_set, lazy=True)
+    assert kcidb.orm.data.decode_lazy(lazy_data) == eager_data
+    assert eager_data["build"][0]["misc"] == misc
+    assert eager_data["build"][0]["output_files"] == output_files
+    for lazy in (True, False):
+        oo_client = kcidb.oo.Client(database, lazy=lazy)
+        build = oo_client.query(pattern_set)["build"][0]
+        build_misc = build.misc
+        assert build_misc == misc
+        # Check the value is decoded only once
+        assert build.misc is build_misc
+        assert build.output_files == output_files
+        assert build.checkout.misc == misc
+
+
+def test_lazy_schemas(clean_database):
+    """
+    Check JSON fields, compressed or not, are returned lazily when requested,
+    for all database schema versions
+    """
+    database = clean_database
+    misc = dict(foo="bar", baz=[1, 2, 3])
+    output_files = [dict(name="log.txt", url="https://example.com/log")]
+    data = {
+        "version": {"major": 4, "minor": 0},
+        "checkouts": [dict(id="_:1", origin="_", misc=misc)],
+        "builds": [dict(id="_:1", checkout_id="_:1", origin="_",
+                        input_files=output_files,
+                        output_files=output_files, misc=misc)],
+        "tests": [dict(id="_:1", build_id="_:1", origin="_",
+                       environment=dict(misc=misc),
+                       output_files=output_files, misc=misc)],
+    }
+    pattern_set = kcidb.orm.query.Pattern.parse(">checkout#>build#>test#")
+    for version in database.get_schemas():
+        database.init(version)
+        database.load(data)
+        eager_data = database.oo_query(pattern_set)
+        lazy_data = database.oo_query(pattern_set, lazy=True)
+        assert kcidb.orm.data.decode_lazy(lazy_data) == eager_data
+        for obj_type_name, field_names in dict(
+            checkout=("misc",),
+            build=("input_files", "output_files", "misc"),
+            test=("environment_misc", "output_files", "misc"),
+        ).items():
+            obj = lazy_data[obj_type_name][0]
+            for field_name in field_names:
+                assert isinstance(obj[field_name], kcidb.orm.data.LazyJSON), \
+                    f"{obj_type_name}.{field_name} is not lazy " \
+                    f"in schema v{version}"
+        database.cleanup()
+
+
+def test_deferred(empty_database):
+    """Check fields are projected away, and fetched on demand, in bulk"""
+    database = empty_database
+    database.load({
+        "version": {"major": 4, "minor": 1},
+        "checkouts": [dict(id="_:1", origin="_", git_commit_hash="a" * 40,
+                           patchset_hash="", git_commit_name="v1")],
+        "builds": [dict(id="_:1", checkout_id="_:1", origin="_")],
+        "tests": [
+            dict(id=f"_:{i}", build_id="_:1", origin="_", status="PASS",
+                 log_excerpt=f"Log {i}", comment=f"Comment {i}")
+            for i in range(3)
+        ],
+    })
+    pattern_set = kcidb.orm.query.Pattern.parse(">build#>test#")
+
+    # Check the database returns only the projected fields
+    tests = database.oo_query(pattern_set,
+                              projection=dict(test={"status"}))["test"]
+    assert sorted(tests, key=lambda test: test["id"]) == [
+        dict(id=f"_:{i}", build_id="_:1", status="PASS") for i in range(3)
+    ]
+
+    revisions = database.oo_query(
+        kcidb.orm.query.Pattern.parse(">revision#"),
+        projection=dict(revision={"git_commit_name"})
+    )["revision"]
+    assert revisions == [dict(git_commit_hash="a" * 40, patchset_hash="",
+                              git_commit_name="v1")]
+
+    # Check the cache returns projected fields fetched earlier
+    cache = kcidb.orm.Cache(database)
+    cache.oo_query(pattern_set, projection=dict(test={"status"}))
+    tests = cache.oo_query(pattern_set)["test"]
+    assert sorted(tests, key=lambda test: test["id"]) == \
+        sorted(database.oo_query(pattern_set)["test"],
+               key=lambda test: test["id"])
+
+    # Check the client fetches deferred fields once, for all tests
+    client = kcidb.oo.Client(database, sort=True)
+    tests = client.query(pattern_set)["test"]
+    with patch.object(database, "oo_query",
+                      wraps=database.oo_query) as oo_query:
+        assert [test.log_excerpt for test in tests] == \
+            [f"Log {i}" for i in range(3)]
+        assert oo_query.call_count == 1
+        assert [test.comment for test in tests] == \
+            [f"Comment {i}" for i in range(3)]
+        assert oo_query.call_count == 2
+        assert all(test.origin == "_" for test in tests)
+        assert oo_query.call_count == 2
+
+    # Check the client doesn't keep objects missing fields, which are not
+    # in use anymore, if not caching
+    client = kcidb.oo.Client(database, cache=False)
+    tests = client.query(pattern_set)["test"]
+    assert len(client.type_id_partial_objs["test"]) == 3
+    del tests
+    gc.collect()
+    assert not client.type_id_partial_objs["test"]
+    tests = client.query(pattern_set)["test"]
+    assert all(test.comment for test in tests)
+    assert len(client.type_id_partial_objs["test"]) == 3
+    assert all(test.log_excerpt for test in tests)
+    assert not client.type_id_partial_objs["test"]
+
+    # Check nothing is deferred when requested
+    client = kcidb.oo.Client(database, deferred={})
+    tests = client.query(pattern_set)["test"]
+    with patch.object(database, "oo_query",
+                      wraps=database.oo_query) as oo_query:
+        assert all(test.log_excerpt for test in tests)
+        assert oo_query.call_count == 0
+
+
+def test_latest_versions(empty_database):
+    """Check only the latest issue versions and incidents are returned"""
+    database = empty_database
+    version = {"major": 4, "minor": 1}
+
+    def get_ids(string, obj_id_set_list=None):
+        """Query objects of the single output type and return their IDs"""
+        pattern_set = kcidb.orm.query.Pattern.parse(string, obj_id_set_list)
+        return sorted(
+            (obj["id"], obj.get("version", obj.get("issue_version")))
+            for objs in database.oo_query(pattern_set).values()
+            for obj in objs
+        )
+
+    database.load({
+        "version": version,
+        "checkouts": [dict(id="_:1", origin="_")],
+        "builds": [dict(id=f"_:{i}", checkout_id="_:1", origin="_")
+                   for i in range(1, 4)],
+        "issues": [dict(id="_:1", version=1, origin="_"),
+                   dict(id="_:2", version=1, origin="_")],
+        "incidents": [
+            dict(id="_:1", issue_id="_:1", issue_version=1,
+                 build_id="_:1", origin="_", present=True),
+            dict(id="_:2", issue_id="_:1", issue_version=1,
+                 build_id="_:2", origin="_", present=True),
+            dict(id="_:3", issue_id="_:2", issue_version=1,
+                 build_id="_:3", origin="_", present=True),
+            dict(id="_:5", issue_id="_:2", issue_version=0,
+                 build_id="_:3", origin="_", present=True),
+        ],
+    })
+    assert get_ids(">issue#") == [("_:1", 1), ("_:2", 1)]
+    assert get_ids(">incident#") == [("_:1", 1), ("_:2", 1), ("_:3", 1)]
+
+    # Add a version of an issue, absent from one build
+    database.load({
+        "version": version,
+        "issues": [dict(id="_:1", version=2, origin="_")],
+        "incidents": [
+            dict(id="_:4", issue_id="_:1", issue_version=2,
+                 build_id="_:1", origin="_", present=False),
+        ],
+    })
+    assert get_ids(">issue#") == [("_:1", 2), ("_:2", 1)]
+    assert get_ids(">issue%#", [{("_:1",)}]) == [("_:1", 2)]
+    assert get_ids(">incident#") == [("_:2", 1), ("_:3", 1)]
+    assert get_ids(">build%>incident#", [{("_:1",)}]) == []
+
+    # Load an older version, and replace the incident of the other issue,
+    # twice, as either the loaded, or the stored data takes priority
+    for _ in range(2):
+        database.load({
+            "version": version,
+            "issues": [dict(id="_:1", version=0, origin="_")],
+            "incidents": [
+                dict(id="_:3", issue_id="_:1", issue_version=2,
+                     build_id="_:2", origin="_", present=True),
+            ],
+        })
+    assert get_ids(">issue#") == [("_:1", 2), ("_:2", 1)]
+    assert get_ids(">incident#") == [("_:3", 2), ("_:5", 0)]
+    assert get_ids(">issue%>incident#", [{("_:2",)}]) == [("_:5", 0)]
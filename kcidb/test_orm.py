@@ -631,6 +631,34 @@ def test_pattern_repr():
         ">checkout[\"\"]#"
 
 
+def test_schema_projection():
+    """Check raw data is validated according to projections"""
+    schema = kcidb.orm.data.SCHEMA
+    build = dict(
+        {field: None for field in schema.types["build"].fields},
+        id="_:1", checkout_id="_:1", origin="_"
+    )
+    projected_build = dict(id="_:1", checkout_id="_:1", origin="_")
+    assert schema.is_valid(dict(build=[build]))
+    assert not schema.is_valid(dict(build=[projected_build]))
+    assert schema.is_valid(dict(build=[projected_build]),
+                           dict(build={"origin"}))
+    assert schema.is_valid(dict(build=[projected_build]),
+                           dict(build=set()))
+    assert not schema.is_valid(dict(build=[projected_build]),
+                               dict(build={"origin", "comment"}))
+    # Fields identifying objects and their parents are always required
+    assert not schema.is_valid(dict(build=[dict(id="_:1")]),
+                               dict(build=set()))
+    # Types outside the projection still require all fields
+    assert not schema.is_valid(dict(build=[projected_build]),
+                               dict(test={"origin"}))
+    build_type = schema.types["build"]
+    assert build_type.is_valid(build)
+    assert not build_type.is_valid(projected_build)
+    assert build_type.is_valid(projected_build, dict(build={"origin"}))
+
+
 def raw_data(type_name, **kwargs):
     """
     Generate raw data for a given type_name.
@@ -66,6 +66,11 @@ setuptools.setup(
             "yamllint",
             "pytest",
         ],
+        # For reading large BigQuery query results faster
+        arrow=[
+            "pyarrow",
+            "google-cloud-bigquery-storage",
+        ],
     ),
     entry_points=dict(
         console_scripts=[
@@ -83,6 +88,7 @@ setuptools.setup(
             "kcidb-db-upgrade = kcidb.db:upgrade_main",
             "kcidb-db-cleanup = kcidb.db:cleanup_main",
             "kcidb-db-empty = kcidb.db:empty_main",
+            "kcidb-db-compact = kcidb.db:compact_main",
             "kcidb-db-load = kcidb.db:load_main",
             "kcidb-db-dump = kcidb.db:dump_main",
             "kcidb-db-query = kcidb.db:query_main",